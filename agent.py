@@ -1,35 +1,86 @@
 from langgraph.graph import StateGraph, END, START
-from langchain_core.runnables import RunnableLambda
 from workflow_nodes import *
+from workflow_nodes.core_nodes import preload_tool_docs
 from agent_types import AgentState
+from workflow_utils import as_runnable
 
+# Available Tools Definition
+tools_dict: dict[str, str] = {
+    "CellTypist": "An automated cell type annotation tool for scRNA-seq datasets on the basis of logistic regression classifiers optimised by the stochastic gradient descent algorithm. CellTypist allows for cell prediction using either built-in (with a current focus on immune sub-populations) or custom models, in order to assist in the accurate classification of different cell types and subtypes.", 
+    "SAM": "a foundation model for image segmentation. It is designed to segment any object in any image with minimal user input — like a point, box, or free-form mask.",
+    "YOLO": "a real-time object detection algorithm that detects and classifies objects in images or videos in a single neural network pass.",
+    "PRnet" : "a perturbation-conditioned generative model designed to predict transcriptional responses to novel drug perturbations at both bulk and single-cell levels.",
+    "ScType": "a computational tool for the fully automated and rapid identification of cell types from single-cell RNA sequencing data by utilizing specific marker gene combinations."
+    }
+
+
+def add_task_loop(workflow: StateGraph, on_success: str):
+    """
+    Add the nodes and edges that bring one task from retrieval to a successful code check.
+    Shared by the main workflow and the per-step loop of parallel runs.
+    """
+    workflow.add_node("task_retriever", as_runnable(get_next_task))                    # Retrieves the next task in the plan
+    workflow.add_node("tool_selector_agent_one", as_runnable(tool_selector_node_one))    # Selects appropriate tools for the task
+    workflow.add_node("code_generator_agent", as_runnable(code_generator_node))  # Generates code for the task
+    workflow.add_node("code_checker", as_runnable(code_check))                     # Tests run generated code and checks for errors
+    workflow.add_node("reflect_agent", as_runnable(reflect_node))                # Reflects on errors and provides suggestions
+    workflow.add_node("replan_agent", as_runnable(replan_node))                  # Replan the task after repeated failure
+
+    workflow.add_edge("task_retriever", "tool_selector_agent_one")
+    workflow.add_edge("tool_selector_agent_one", "code_generator_agent")
+    workflow.add_edge("code_generator_agent", "code_checker")
+
+    # Check if code execution succeeded or needs rework
+    workflow.add_conditional_edges(
+        "code_checker",
+        decide_to_finish,
+        {
+            "end": on_success,         # No error encounted, proceed to next task
+            "replan": "replan_agent",    # Encounter repeated error, replan
+            "reflect": "reflect_agent",  # Encounter error, retry
+            "regenerate": "code_generator_agent",  # Pre-flight check failed, retry without reflection
+            "recheck": "code_checker",  # Known error patched deterministically, run the patched code
+        },
+    )
+
+    workflow.add_edge("reflect_agent", "code_generator_agent")
+    workflow.add_edge("replan_agent", "task_retriever")
 
 
 class Agent:
-    def __init__(self):
+    def __init__(self, checkpointer=None):
         """
-        Activate the Multi-Agentic Workflow
+        Activate the Multi-Agentic Workflow.
+        Every node has a sync and an async variant: use `app.invoke` / `app.stream` from threads,
+        or `await agent.arun(...)` / `app.astream` to serve many sessions from one event loop.
+        With a `checkpointer` the state is saved after every node, per thread_id in the run config,
+        so failed runs can be resumed (see workflow_utils/checkpoints.py).
         """
         
+        # Load tool documentation into memory once
+        preload_tool_docs(tools_dict)
+        
+        # Single-task loop used by the parallel runner, one invocation per plan step
+        step_workflow = StateGraph(AgentState)
+        add_task_loop(step_workflow, on_success=END)
+        step_workflow.add_edge(START, "tool_selector_agent_one")
+        self.step_app = step_workflow.compile(checkpointer=False)
+
         # Define the agent workflow
         # Initialize a StateGraph with AgentState to define the agent workflow
         workflow = StateGraph(AgentState)
         
         # Define agent nodes (steps in the workflow)
-        workflow.add_node("conductor_agent", RunnableLambda(conductor_node))
-        workflow.add_node("frontdesk_agent", RunnableLambda(frontdesk_node))            # Handles user entry and decides whether to activate multi-agentic workflow
-        workflow.add_node("plan_editor_agent", RunnableLambda(plan_editor_node))
-        workflow.add_node("planner_agent", RunnableLambda(planner_node))                # Generates a high-level plan of tasks
-        workflow.add_node("task_retriever", RunnableLambda(get_next_task))                    # Retrieves the next task in the plan
-        workflow.add_node("tool_selector_agent_one", RunnableLambda(tool_selector_node_one))    # Selects appropriate tools for the task
-        workflow.add_node("tool_selector_node_two", RunnableLambda(tool_selector_node_two))    # Selects appropriate tools for the task       
-        workflow.add_node("code_generator_agent", RunnableLambda(code_generator_node))  # Generates code for the task
-        workflow.add_node("code_checker", RunnableLambda(code_check))                     # Tests run generated code and checks for errors
-        workflow.add_node("reflect_agent", RunnableLambda(reflect_node))                # Reflects on errors and provides suggestions
+        workflow.add_node("conductor_agent", as_runnable(conductor_node))
+        workflow.add_node("frontdesk_agent", as_runnable(frontdesk_node))            # Handles user entry and decides whether to activate multi-agentic workflow
+        workflow.add_node("plan_editor_agent", as_runnable(plan_editor_node))
+        workflow.add_node("planner_agent", as_runnable(planner_node))                # Generates a high-level plan of tasks
+        workflow.add_node("tool_selector_node_two", as_runnable(tool_selector_node_two))    # Selects appropriate tools for the task       
         workflow.add_node("completion_checker", lambda x: x)                                    # Dummy node to evaluate code test completion
-        workflow.add_node("index_updater", RunnableLambda(update_task_index))            # Increments the task index to proceed
-        workflow.add_node("replan_agent", RunnableLambda(replan_node))                  # Replan the task after repeated failure
-        workflow.add_node("reporter_agent", RunnableLambda(reporter_node))              # Report the entire process and outputs
+        workflow.add_node("index_updater", as_runnable(update_task_index))            # Increments the task index to proceed
+        workflow.add_node("reporter_agent", as_runnable(reporter_node))              # Report the entire process and outputs
+        workflow.add_node("parallel_runner", as_runnable(make_parallel_runner(self.step_app)))  # Runs independent plan steps side by side
+        add_task_loop(workflow, on_success="completion_checker")                         # Retrieve, code, check, reflect/replan one task
 
         # Connect the nodes, begin from START
         workflow.add_edge(START, "conductor_agent")
@@ -43,6 +94,7 @@ class Agent:
                 "plan_generator_agent": "tool_selector_node_two",
                 "plan_editor_agent": "plan_editor_agent", 
                 "analysis_agent": "task_retriever",
+                "parallel_analysis_agent": "parallel_runner",
             }
         )
         
@@ -50,26 +102,7 @@ class Agent:
         workflow.add_edge("tool_selector_node_two","planner_agent")
         workflow.add_edge("planner_agent", END)
         workflow.add_edge("plan_editor_agent", END)
-        workflow.add_edge("task_retriever", "tool_selector_agent_one")
-    
-        # Main Analysis Pipeline Activated        
-        workflow.add_edge("task_retriever", "tool_selector_agent_one")
-        workflow.add_edge("tool_selector_agent_one", "code_generator_agent")
-        workflow.add_edge("code_generator_agent", "code_checker")
-
-        # Check if code execution succeeded or needs rework
-        workflow.add_conditional_edges(
-            "code_checker",
-            decide_to_finish,
-            {
-                "end": "completion_checker",         # No error encounted, proceed to next task
-                "replan": "replan_agent",    # Encounter repeated error, replan
-                "reflect": "reflect_agent",  # Encounter error, retry
-            },
-        )
-
-        workflow.add_edge("reflect_agent", "code_generator_agent")
-        workflow.add_edge("replan_agent", "task_retriever")
+        workflow.add_edge("parallel_runner", "reporter_agent")
 
         # Decide to proceed to next task or finalize report
         workflow.add_conditional_edges(
@@ -85,4 +118,8 @@ class Agent:
         workflow.add_edge("reporter_agent", END)
 
         # Compile the full workflow graph
-        self.app = workflow.compile()
\ No newline at end of file
+        self.app = workflow.compile(checkpointer=checkpointer)
+
+    async def arun(self, inputs: dict, config: dict = None) -> dict:
+        """Async entry point: run one request to completion without blocking the event loop."""
+        return await self.app.ainvoke(inputs, config)
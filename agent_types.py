@@ -9,12 +9,17 @@ class PlanEditor(BaseModel):
 class Plan(BaseModel):
     """Plan of sequential steps to be followed."""
     steps: List[str] = Field(..., description="Ordered list of steps to follow.")
+    depends_on: Optional[List[List[int]]] = Field(None, description="For each step, in the same order, the numbers (1-based) of the earlier steps whose outputs it needs. [] for a step that only needs the input files.")
     input_file_path: Optional[Dict[str,str]] = Field(None, description="Dictionary where keys are file paths and values are their descriptions.")
 
 class SelectedTool(BaseModel):
     """Selected tools name for the current task."""
     tools: List[str] = Field(..., description="List of selected tool names. Return ['None'] if no tools are suitable.")
 
+class StepTools(BaseModel):
+    """Tool assigned to each listed plan step."""
+    tools: List[str] = Field(..., description="One tool name per listed step, in the same order. Use 'None' for steps that need no tool.")
+
 class Code(BaseModel):
     """Schema for code solutions, including explanation, imports, and code."""
     prefix: str = Field(..., description="Description of the problem and approach")
@@ -31,16 +36,23 @@ class AgentState(TypedDict):
     conversation_history: Annotated[Sequence[BaseMessage], add_messages]    # History of all conversation messages
     messages: Annotated[Sequence[BaseMessage], add_messages]                # Inner messages of Analysis workflow
     user_prompt: str                                                        # The latest user input prompt
+    history_summary: Optional[str]                                          # Running summary of the conversation turns no longer shown verbatim
+    history_summary_covered: Optional[int]                                  # Number of conversation_history messages covered by history_summary
+    session_id: Optional[str]                                               # Identifies the UI session, selects its execution kernel
     
     # Tooling and Input File Info
     available_tools: Dict[str, str]                                         # Dictionary of available tool names and descriptions
     input_file_path: str                                                    # path of your file
+    results_dir: Optional[str]                                              # Where generated code saves its outputs (default RESULTS_DIR)
 
     # Planning and Task Management                                  
     plan: List[str]                                                         # Planned list of task steps
     current_task: Optional[str]                                             # Current task being processed
     current_task_index: int                                                 # Index of the current task step in the plan list
     selected_tool: Optional[List[str]]                                      # Tool(s) selected for the current task
+    step_tools: Optional[Dict[str, str]]                                    # Tool chosen for each plan step, keyed by the step text ("None" if no tool)
+    step_dependencies: Optional[Dict[str, List[str]]]                       # Earlier steps whose outputs each plan step needs, keyed by the step text
+    completed_steps: Optional[List[int]]                                    # Finished step indices when steps run out of order (parallel runs)
 
     # Routing and Flow Control Flags                                    
     conductor_status: str                                                   # Flag that decide which agent to use (frontdesk_agent, plan_generator_agent or plan_editor_agent)
@@ -50,4 +62,11 @@ class AgentState(TypedDict):
     code_generation: Optional[Code]                                         # Generated code solution object
     all_generated_code: Optional[str]                                       # Full code history for all generated steps
     stdout_output: Optional[str]                                            # All captured stdout output from code execution
+    output_records: Optional[List[dict]]                                    # Per-step summary of the output (saved files, shapes, key lines, excerpt)
+    live_variables: Optional[Dict[str, str]]                                # Variables alive in the session kernel (persistent execution mode)
+    preflight_failed: Optional[bool]                                        # Last code block was rejected by the static pre-flight check
+    patched_retry: Optional[bool]                                           # Last code block failed with a known error and was patched deterministically
+    fix_context: Optional[dict]                                             # Error signatures, first failing code and fix-memory use for the current task
     iterations: Optional[int]                                               # Number of iterations or retries attempted
+    use_result_cache: Optional[bool]                                        # Set to False to bypass the executed-code result cache
+    early_kill: Optional[bool]                                              # Set to False to let runs with fatal output continue to the timeout
@@ -0,0 +1,313 @@
+"""
+Headless batch runner: one approved plan, many datasets, (almost) no LLM calls per dataset.
+
+The full agent runs the plan once, on the first dataset. The code it commits
+for each task becomes a template that is replayed on every other dataset, with
+only the input path and the results directory swapped. The replays run in a
+process pool without any LLM call. Each dataset writes to its own directory,
+results/<dataset>/, and a summary table closes the run. A template none of whose
+tasks reads its input path, or with a task that uses neither the input path nor
+the results directory, cannot be re-targeted this way and is not replayed.
+
+The template is saved as results/batch_template.json, so later batches with the
+same plan can skip the agent run entirely (--template).
+
+Usage:
+    python batch_cli.py --plan plan.txt --inputs "data/*.h5ad" --workers 4
+    python batch_cli.py --step "Load the data" --step "Annotate cells with CellTypist" --inputs a.h5ad b.h5ad
+    python batch_cli.py --template results/batch_template.json --inputs "more_data/*.h5ad"
+
+A plan file has one step per line ("1." or "-" prefixes and "#" comments are
+ignored), or is a JSON list of steps. Datasets whose replay fails are re-run
+by the full agent with --fallback-agent.
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+from dotenv import load_dotenv
+
+TEMPLATE_FILENAME = "batch_template.json"
+TASK_MARKER = "\n#Next Task: "
+
+
+# ---------- plan and inputs ----------
+def load_plan(path: str) -> List[str]:
+    with open(path) as f:
+        text = f.read()
+    if path.endswith(".json"):
+        return [str(step) for step in json.loads(text)]
+    steps = []
+    for line in text.splitlines():
+        line = re.sub(r"^\s*(\d+[.)]|[-*])\s*", "", line).strip()
+        if line and not line.startswith("#"):
+            steps.append(line)
+    return steps
+
+
+def expand_inputs(patterns: List[str]) -> List[str]:
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(os.path.expanduser(pattern))) or [pattern]
+        paths.extend(os.path.abspath(path) for path in matches)
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"Input file(s) not found: {', '.join(missing)}")
+    return list(dict.fromkeys(paths))
+
+
+def dataset_names(paths: List[str]) -> Dict[str, str]:
+    """Results directory name of every input: its file name without extension, made unique."""
+    names, seen = {}, set()
+    for path in paths:
+        stem = re.sub(r"[^A-Za-z0-9_.-]", "_", os.path.basename(path).split(".")[0]) or "dataset"
+        name, suffix = stem, 1
+        while name in seen:
+            suffix += 1
+            name = f"{stem}_{suffix}"
+        seen.add(name)
+        names[path] = name
+    return names
+
+
+# ---------- template ----------
+def split_tasks(all_generated_code: str) -> List[Dict[str, str]]:
+    """The committed code of a run, one {"task", "code"} per task (see code_check in core_nodes.py)."""
+    steps = []
+    for section in all_generated_code.split(TASK_MARKER)[1:]:
+        task, _, code = section.partition("\n")
+        steps.append({"task": task, "code": code})
+    return steps
+
+
+def render_step(code: str, template: dict, input_path: str, results_dir: str) -> str:
+    """Template code with the template dataset's paths replaced by this dataset's."""
+    return code.replace(template["input_path"], input_path).replace(template["results_dir"], results_dir)
+
+
+def check_template(template: dict, persistent: bool = False):
+    """
+    Raise ValueError when the template cannot be re-targeted at another dataset by swapping
+    paths: no task reads the template's input path (the replay would analyse the template
+    dataset again), or, with isolated execution, a task mentions neither the input path nor
+    the results directory. In persistent mode later tasks may work on the kernel namespace alone.
+    """
+    codes = [step["code"] for step in template["steps"]]
+    if not any(template["input_path"] in code for code in codes):
+        raise ValueError(f"No task of the template reads its input path {template['input_path']}")
+    if not persistent:
+        for idx, code in enumerate(codes, 1):
+            if template["input_path"] not in code and template["results_dir"] not in code:
+                raise ValueError(f"Task {idx} of the template uses neither its input path nor its results directory")
+
+
+def render_steps(template: dict, input_path: str, results_dir: str, persistent: bool = False) -> List[str]:
+    """The code of every task for one dataset, after check_template()."""
+    check_template(template, persistent)
+    return [render_step(step["code"], template, input_path, results_dir) for step in template["steps"]]
+
+
+def run_template_agent(plan: List[str], input_path: str, results_dir: str, verbose: bool = False) -> dict:
+    """Run the full agent on one dataset and return its template: the committed code of every task."""
+    from langchain_community.callbacks import get_openai_callback
+    from agent import Agent, tools_dict
+
+    inputs = {
+        "user_prompt": "Yes, please run the plan.",
+        "session_id": f"batch-{os.getpid()}",
+        "conversation_history": [],
+        "history_summary": "",
+        "history_summary_covered": 0,
+        "error": "no",
+        "all_generated_code": "",
+        "available_tools": tools_dict,
+        "code_generation": "",
+        "current_task_index": 0,
+        "replan_triggered": False,
+        "plan": plan,
+        "step_tools": {},
+        "step_dependencies": {},
+        "input_file_path": {input_path: "single-cell dataset (.h5ad) to analyse"},
+        "results_dir": results_dir,
+        "stdout_output": "",
+        "use_result_cache": True,
+    }
+    started = time.time()
+    output = sys.stdout if verbose else open(os.devnull, "w")
+    with get_openai_callback() as cb, contextlib.redirect_stdout(output):
+        result = Agent().app.invoke(inputs, {"recursion_limit": 100})
+    steps = split_tasks(result.get("all_generated_code") or "")
+    if len(steps) != len(result["plan"]):
+        raise RuntimeError(f"The agent completed {len(steps)} of {len(result['plan'])} tasks on {input_path}")
+    logging.info(f"Template run on {input_path}: {len(steps)} tasks, {cb.successful_requests} LLM calls, ${cb.total_cost:.6f}")
+    return {
+        "plan": result["plan"],
+        "input_path": input_path,
+        "results_dir": results_dir,
+        "steps": steps,
+        "llm_calls": cb.successful_requests,
+        "cost": cb.total_cost,
+        "duration": time.time() - started,
+    }
+
+
+# ---------- replay ----------
+def replay_dataset(template: dict, input_path: str, results_dir: str, name: str, timeout: float) -> dict:
+    """Process pool worker: run the template's tasks on one dataset, in order, stopping at the first failure."""
+    from workflow_utils import run_code, shutdown_kernel, uses_persistent_namespace, create_attempt_sandbox, release_sandbox, cleanup_session
+    from workflow_utils import setup_logging
+
+    # The logging thread of the parent does not exist in a pool worker: one log per dataset instead
+    setup_logging(f"scagent_batch_{name}", console=False)
+    os.makedirs(results_dir, exist_ok=True)
+    stdout_path = os.path.join(results_dir, "batch_stdout.txt")
+    open(stdout_path, "w").close()
+    session_id = f"batch-{name}"
+    summary = {"name": name, "input_path": input_path, "results_dir": results_dir, "status": "ok",
+               "tasks_done": 0, "failed_task": None, "error": "", "step_durations": [],
+               "step_peak_rss_mb": []}
+    started = time.time()
+    try:
+        codes = render_steps(template, input_path, results_dir, uses_persistent_namespace())
+    except ValueError as e:
+        summary.update(status="failed", failed_task=1, error=f"template: {e}", duration=time.time() - started)
+        cleanup_session(session_id)
+        return summary
+    try:
+        for idx, (step, code) in enumerate(zip(template["steps"], codes)):
+            temp_dir = create_attempt_sandbox(session_id, idx)
+            try:
+                # In persistent mode the tasks share one kernel namespace, as they did in the template run
+                result = run_code(session_id, code, script_path=os.path.join(temp_dir, "batch_script.py"),
+                                  cwd=temp_dir, timeout=timeout)
+            finally:
+                release_sandbox(temp_dir)
+            summary["step_durations"].append(round(result.duration, 2))
+            summary["step_peak_rss_mb"].append(round(result.peak_rss_mb) if result.peak_rss_mb is not None else None)
+            with open(stdout_path, "a") as f:
+                f.write(f"#Task {idx + 1}: {step['task']}\n{result.stdout}\n")
+            if result.returncode != 0:
+                stderr = result.stderr.strip().splitlines()
+                summary.update(status="failed", failed_task=idx + 1, error=stderr[-1] if stderr else f"exit code {result.returncode}")
+                break
+            summary["tasks_done"] = idx + 1
+    except Exception as e:
+        summary.update(status="failed", failed_task=summary["tasks_done"] + 1, error=f"{type(e).__name__}: {e}")
+    finally:
+        if uses_persistent_namespace():
+            shutdown_kernel(session_id)
+        cleanup_session(session_id)
+    summary["duration"] = time.time() - started
+    return summary
+
+
+def print_summary(rows: List[dict], total_tasks: int):
+    print(f"\n{'dataset':<32}{'status':>10}{'tasks':>8}{'time':>10}{'peak mem':>10}{'LLM calls':>11}  error")
+    for row in rows:
+        peaks = [peak for peak in row.get("step_peak_rss_mb") or [] if peak is not None]
+        peak = f"{max(peaks)}MB" if peaks else "n/a"
+        print(f"{row['name'][:31]:<32}{row['status']:>10}{row['tasks_done']:>4}/{total_tasks:<3}{row['duration']:>9.1f}s"
+              f"{peak:>10}{row.get('llm_calls', 0):>11}  {row['error'][:60]}")
+    ok = sum(row["status"] != "failed" for row in rows)
+    llm_calls = sum(row.get("llm_calls", 0) for row in rows)
+    print(f"\n{ok}/{len(rows)} datasets completed, {llm_calls} LLM calls in total")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    plan_group = parser.add_mutually_exclusive_group(required=True)
+    plan_group.add_argument("--plan", help="plan file (one step per line, or a JSON list)")
+    plan_group.add_argument("--step", action="append", help="plan step (repeat for every step)")
+    plan_group.add_argument("--template", help=f"{TEMPLATE_FILENAME} of an earlier batch: replay it without any agent run")
+    parser.add_argument("--inputs", nargs="+", required=True, help="input files or glob patterns")
+    parser.add_argument("--results", default=os.environ.get("SCAGENT_RESULTS_DIR", "results"), help="root of the per-dataset results directories")
+    parser.add_argument("--workers", type=int, default=max(1, min(4, os.cpu_count() or 1)), help="datasets replayed at once")
+    parser.add_argument("--timeout", type=float, default=3600, help="seconds allowed per task and dataset")
+    parser.add_argument("--fallback-agent", action="store_true", help="re-run datasets whose replay failed with the full agent")
+    parser.add_argument("--verbose", action="store_true", help="show the agent's node output")
+    args = parser.parse_args()
+
+    load_dotenv()
+    from workflow_utils import setup_logging
+    setup_logging("scagent_batch", console=False)
+
+    inputs = expand_inputs(args.inputs)
+    names = dataset_names(inputs)
+    results_root = os.path.abspath(args.results)
+    rows = []
+
+    if args.template:
+        with open(args.template) as f:
+            template = json.load(f)
+        pending = inputs
+    else:
+        plan = load_plan(args.plan) if args.plan else args.step
+        if not os.environ.get("OPENAI_API_KEY") and not os.environ.get("SCAGENT_LLM_FACTORY"):
+            parser.error("OPENAI_API_KEY is not set (needed for the template run)")
+        first = inputs[0]
+        print(f"Running the plan ({len(plan)} steps) with the agent on {first}...")
+        started = time.time()
+        try:
+            template = run_template_agent(plan, first, os.path.join(results_root, names[first]), args.verbose)
+        except Exception as e:
+            logging.exception("Template run failed")
+            print(f"The agent could not complete the plan on {first}: {type(e).__name__}: {e}")
+            sys.exit(1)
+        os.makedirs(results_root, exist_ok=True)
+        with open(os.path.join(results_root, TEMPLATE_FILENAME), "w") as f:
+            json.dump(template, f, indent=2)
+        rows.append({"name": names[first], "input_path": first, "results_dir": template["results_dir"], "status": "agent",
+                     "tasks_done": len(template["steps"]), "error": "", "duration": time.time() - started,
+                     "llm_calls": template["llm_calls"]})
+        pending = inputs[1:]
+
+    total_tasks = len(template["steps"])
+    from workflow_utils import uses_persistent_namespace
+    try:
+        check_template(template, uses_persistent_namespace())
+    except ValueError as e:
+        print(f"The template cannot be replayed on other datasets: {e}")
+        sys.exit(1)
+    print(f"Replaying {total_tasks} tasks on {len(pending)} dataset(s) with {args.workers} worker(s)...")
+    replayed = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(replay_dataset, template, path, os.path.join(results_root, names[path]), names[path], args.timeout)
+                   for path in pending]
+        for done, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            replayed.append(row)
+            detail = f"failed at task {row['failed_task']}: {row['error']}" if row["status"] == "failed" else "ok"
+            print(f"[{done}/{len(pending)}] {row['name']} {detail} ({row['duration']:.1f}s)")
+            logging.info(f"Replay {row['name']}: {row}")
+    replayed.sort(key=lambda row: inputs.index(row["input_path"]))
+
+    if args.fallback_agent:
+        for row in replayed:
+            if row["status"] != "failed":
+                continue
+            print(f"Re-running {row['name']} with the agent...")
+            started = time.time()
+            try:
+                result = run_template_agent(template["plan"], row["input_path"], row["results_dir"], args.verbose)
+                row.update(status="agent", tasks_done=len(result["steps"]), error="", llm_calls=result["llm_calls"])
+            except Exception as e:
+                row.update(error=f"agent: {type(e).__name__}: {e}")
+            row["duration"] += time.time() - started
+
+    rows += replayed
+    with open(os.path.join(results_root, "batch_summary.json"), "w") as f:
+        json.dump(rows, f, indent=2)
+    print_summary(rows, total_tasks)
+    sys.exit(0 if all(row["status"] != "failed" for row in rows) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Offline end-to-end benchmark: the compiled agent graph on synthetic datasets of increasing size.
+
+Runs the scanpy pipeline of benchmarks/pipeline_scenario.py through the full
+Agent().app graph, with a stand-in LLM (canned answers, or a recording with
+--recording) and real code execution. No network and no API key are needed. Each
+dataset size runs in a fresh process, and the report gives:
+
+    - wall time, time waiting for the LLM, code execution time and the agent's own overhead
+    - peak memory of the executed code and of the agent process
+    - prompt tokens sent per run
+    - per-node breakdown (from the run profile, see workflow_utils/tracing.py)
+
+--save writes the results as JSON; --baseline compares against such a file and
+exits with status 1 when the wall time or overhead of a size regressed by more
+than --tolerance, to gate performance changes.
+
+Usage:
+    python benchmarks/offline_pipeline.py --sizes 2000 10000 50000 --save bench.json
+    python benchmarks/offline_pipeline.py --baseline bench.json --tolerance 0.2
+    python benchmarks/offline_pipeline.py --recording recording.jsonl --latency 0.5
+
+Needs numpy, scipy, anndata and scanpy (the packages the generated code uses).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def configure(scratch: str, recording: str = "", latency: float = 0.0):
+    """Stand-in LLM, fresh caches and scratch directories; must happen before the workflow is imported."""
+    for key, value in {
+        "SCAGENT_LLM_FACTORY": "benchmarks.simulated_llm:ReplayChatModel" if recording else "benchmarks.simulated_llm:SimulatedChatModel",
+        "SCAGENT_SIM_RECORDING": recording,
+        "SCAGENT_SIM_LLM_LATENCY": str(latency),
+        "SCAGENT_LLM_CACHE": "0",
+        "SCAGENT_RESULT_CACHE": "0",
+        "SCAGENT_CHECKPOINTS": "0",
+        "SCAGENT_PREROUTER": "1",
+        # A fresh interpreter per block, as in the original executor
+        "SCAGENT_EXECUTOR": "subprocess",
+        "SCAGENT_ROUTER_DIR": os.path.join(scratch, "routing"),
+        "SCAGENT_FIX_MEMORY_DIR": os.path.join(scratch, "fixes"),
+        "SCAGENT_PROFILE_DIR": os.path.join(scratch, "profiles"),
+        "SCAGENT_SANDBOX_ROOT": os.path.join(scratch, "sandboxes"),
+        "OPENAI_API_KEY": "not-used",
+    }.items():
+        os.environ.setdefault(key, value)
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident memory of this process (VmHWM); unlike ru_maxrss it does not carry over the parent's."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_scenario(input_path: str, results_dir: str, label: str) -> dict:
+    """Worker process: one run of the scenario plan through the agent graph."""
+    from agent import Agent, tools_dict
+    from workflow_utils import RunProfiler, node_breakdown
+    from benchmarks.pipeline_scenario import PLAN
+
+    started = time.time()
+    agent = Agent()
+    startup = time.time() - started
+    inputs = {
+        "user_prompt": "Yes, please run the plan.",
+        "session_id": f"bench-{label}",
+        "conversation_history": [],
+        "history_summary": "",
+        "history_summary_covered": 0,
+        "error": "no",
+        "all_generated_code": "",
+        "available_tools": tools_dict,
+        "code_generation": "",
+        "current_task_index": 0,
+        "replan_triggered": False,
+        "plan": list(PLAN),
+        "step_tools": {},
+        "step_dependencies": {},
+        "input_file_path": {input_path: "synthetic single-cell count matrix (.h5ad)"},
+        "results_dir": results_dir,
+        "stdout_output": "",
+        "use_result_cache": False,
+    }
+    profiler = RunProfiler(label)
+    os.makedirs(results_dir, exist_ok=True)
+    started = time.time()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = agent.app.invoke(inputs, {"recursion_limit": 100, "callbacks": [profiler]})
+    wall = time.time() - started
+    records = profiler.records
+    llm_seconds = sum(record["duration"] for record in records if record["kind"] == "llm")
+    exec_seconds = sum(record["duration"] for record in records if record["kind"] == "exec")
+    return {
+        "label": label,
+        "startup": startup,
+        "wall": wall,
+        "llm_seconds": llm_seconds,
+        "exec_seconds": exec_seconds,
+        "overhead": max(0.0, wall - llm_seconds - exec_seconds),
+        "tasks_done": (result.get("all_generated_code") or "").count("\n#Next Task: "),
+        "tasks": len(result["plan"]),
+        "failed_attempts": sum(record["kind"] == "exec" and record["outcome"] == "error" for record in records),
+        "llm_calls": sum(record["kind"] == "llm" for record in records),
+        "prompt_tokens": sum(record.get("prompt_tokens") or 0 for record in records if record["kind"] == "llm"),
+        # Largest peak memory of an executed block, as measured by the executor
+        "exec_peak_mb": max((record.get("peak_rss_mb") or 0.0 for record in records if record["kind"] == "exec"), default=0.0),
+        "agent_peak_mb": _peak_rss_mb(),
+        "nodes": node_breakdown(records),
+        "profile": profiler.path,
+    }
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """Regressions of wall time or overhead against a saved run, per dataset size."""
+    with open(baseline_path) as f:
+        baseline = {row["label"]: row for row in json.load(f)["results"]}
+    regressions = []
+    for row in results:
+        before = baseline.get(row["label"])
+        if before is None:
+            continue
+        for metric in ("wall", "overhead"):
+            # Ignore sub-second noise on tiny runs
+            if row[metric] > before[metric] * (1 + tolerance) and row[metric] - before[metric] > 0.5:
+                regressions.append(f"{row['label']}: {metric} {before[metric]:.2f}s -> {row[metric]:.2f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 10000, 50000], help="cells per synthetic dataset")
+    parser.add_argument("--genes", type=int, default=2000, help="genes per synthetic dataset")
+    parser.add_argument("--recording", default="", help="replay LLM answers from this recording (see simulated_llm.py)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per simulated LLM call")
+    parser.add_argument("--data-dir", default=os.path.join(ROOT, ".scagent_cache", "bench_data"), help="where synthetic datasets are kept")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="scagent_bench_")
+    configure(scratch, os.path.abspath(args.recording) if args.recording else "", args.latency)
+    from benchmarks.pipeline_scenario import make_dataset, PLAN
+    from workflow_utils import format_breakdown
+
+    results = []
+    for n_cells in args.sizes:
+        label = f"{n_cells}_cells"
+        path = os.path.join(args.data_dir, f"synthetic_{n_cells}x{args.genes}.h5ad")
+        # A fresh process per dataset and per run, so peak memory is measured for that run alone
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            if not os.path.exists(path):
+                print(f"Writing synthetic dataset {path}...")
+                pool.submit(make_dataset, path, n_cells, args.genes).result()
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            row = pool.submit(run_scenario, path, os.path.join(scratch, "results", label), label).result()
+        row.update(cells=n_cells, genes=args.genes, input_mb=os.path.getsize(path) / 1024 ** 2)
+        results.append(row)
+        print(f"{label}: {row['tasks_done']}/{row['tasks']} tasks in {row['wall']:.1f}s")
+
+    print(f"\n{len(PLAN)}-step scanpy pipeline, simulated LLM latency {args.latency}s"
+          + (f", replaying {args.recording}" if args.recording else "") + "\n")
+    print(f"{'cells':>8}{'input':>9}{'wall':>9}{'LLM':>9}{'exec':>9}{'overhead':>10}{'exec peak':>11}{'agent peak':>12}"
+          f"{'LLM calls':>11}{'prompt tok':>12}{'failed':>8}")
+    for row in results:
+        print(f"{row['cells']:>8}{row['input_mb']:>7.1f}MB{row['wall']:>8.1f}s{row['llm_seconds']:>8.1f}s{row['exec_seconds']:>8.1f}s"
+              f"{row['overhead']:>9.2f}s{row['exec_peak_mb']:>9.0f}MB{row['agent_peak_mb']:>10.0f}MB"
+              f"{row['llm_calls']:>11}{row['prompt_tokens']:>12}{row['failed_attempts']:>8}")
+    print(f"\nPer node, {results[-1]['label']} (profile: {results[-1]['profile']}):")
+    print(format_breakdown(results[-1]["nodes"]))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"latency": args.latency, "recording": args.recording, "results": results}, f, indent=2)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against the baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+    if any(row["tasks_done"] < row["tasks"] for row in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark scenario: a standard scanpy pipeline on a synthetic dataset.
+
+PLAN is the plan the offline benchmark runs. For each step the simulated code
+generator answers with the block below, so the executed code does the real
+work of that step at the dataset's size. The blocks are self-contained (isolated
+execution mode): each one reads the previous step's output from results_dir.
+
+make_dataset() writes the synthetic input: negative-binomial counts with a few
+cell populations that each over-express their own gene module.
+"""
+import os
+from typing import Optional
+
+STEPS = [
+    (
+        "Load the dataset, compute QC metrics and filter low-quality cells and genes",
+        """adata = sc.read_h5ad({input_path!r})
+sc.pp.calculate_qc_metrics(adata, percent_top=None, log1p=False, inplace=True)
+sc.pp.filter_cells(adata, min_genes=50)
+sc.pp.filter_genes(adata, min_cells=3)
+adata.write_h5ad({results_dir!r} + "/qc.h5ad")
+print(f"After QC: {{adata.n_obs}} cells x {{adata.n_vars}} genes")""",
+    ),
+    (
+        "Normalize, log-transform and select highly variable genes",
+        """adata = sc.read_h5ad({results_dir!r} + "/qc.h5ad")
+sc.pp.normalize_total(adata, target_sum=1e4)
+sc.pp.log1p(adata)
+sc.pp.highly_variable_genes(adata, n_top_genes=1000)
+adata = adata[:, adata.var.highly_variable].copy()
+adata.write_h5ad({results_dir!r} + "/normalized.h5ad")
+print(f"Highly variable genes: {{adata.n_vars}}")""",
+    ),
+    (
+        "Run PCA and compute the neighborhood graph",
+        """adata = sc.read_h5ad({results_dir!r} + "/normalized.h5ad")
+sc.pp.scale(adata, max_value=10)
+sc.pp.pca(adata, n_comps=30)
+sc.pp.neighbors(adata, n_neighbors=15, n_pcs=30)
+adata.write_h5ad({results_dir!r} + "/pca.h5ad")
+print(f"PCA variance ratio (first 5): {{adata.uns['pca']['variance_ratio'][:5].round(3).tolist()}}")""",
+    ),
+    (
+        "Cluster the cells and rank marker genes per cluster",
+        """from sklearn.cluster import KMeans
+adata = sc.read_h5ad({results_dir!r} + "/pca.h5ad")
+adata.obs["cluster"] = KMeans(n_clusters=8, n_init=4, random_state=0).fit_predict(adata.obsm["X_pca"]).astype(str)
+adata.obs["cluster"] = adata.obs["cluster"].astype("category")
+sc.tl.rank_genes_groups(adata, groupby="cluster", method="t-test")
+markers = sc.get.rank_genes_groups_df(adata, group=None).groupby("group", observed=True).head(5)
+markers.to_csv({results_dir!r} + "/markers.csv", index=False)
+adata.write_h5ad({results_dir!r} + "/clustered.h5ad")
+print(adata.obs["cluster"].value_counts().to_string())""",
+    ),
+]
+PLAN = [step for step, _ in STEPS]
+_CODE = dict(STEPS)
+
+
+def scenario_code(task: str, input_path: Optional[str], results_dir: Optional[str]) -> Optional[str]:
+    """Code block of a scenario step, or None when `task` is not one."""
+    template = _CODE.get(task)
+    if template is None or not input_path or not results_dir:
+        return None
+    return template.format(input_path=input_path, results_dir=results_dir)
+
+
+def make_dataset(path: str, n_cells: int, n_genes: int = 2000, n_types: int = 8, seed: int = 0) -> str:
+    """Write a synthetic count matrix (sparse, CSR) as .h5ad; returns `path`. Needs numpy, scipy and anndata."""
+    import numpy as np
+    import pandas as pd
+    import anndata
+    from scipy import sparse
+
+    rng = np.random.default_rng(seed)
+    cell_types = rng.integers(n_types, size=n_cells)
+    # Per-gene base expression, with a module of 50 genes up-regulated in each cell type
+    base = rng.gamma(shape=0.3, scale=1.0, size=n_genes)
+    means = np.tile(base, (n_types, 1))
+    for cell_type in range(n_types):
+        module = rng.choice(n_genes, size=50, replace=False)
+        means[cell_type, module] *= 8
+    library_size = rng.lognormal(mean=0.0, sigma=0.3, size=n_cells)
+    # Negative binomial (gamma-Poisson) counts, built in chunks to bound memory
+    chunks = []
+    for start in range(0, n_cells, 10000):
+        stop = min(start + 10000, n_cells)
+        mu = means[cell_types[start:stop]] * library_size[start:stop, None]
+        counts = rng.poisson(rng.gamma(shape=2.0, scale=mu / 2.0))
+        chunks.append(sparse.csr_matrix(counts.astype(np.float32)))
+    adata = anndata.AnnData(
+        X=sparse.vstack(chunks).tocsr(),
+        obs=pd.DataFrame({"true_type": pd.Categorical(cell_types.astype(str))}, index=[f"cell{i}" for i in range(n_cells)]),
+        var=pd.DataFrame(index=[f"gene{i}" for i in range(n_genes)]),
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    adata.write_h5ad(path)
+    return path
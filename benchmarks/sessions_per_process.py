@@ -0,0 +1,138 @@
+"""
+Sessions served by one process: blocking graph on worker threads vs. the async graph.
+
+Runs the same analysis request (a plan of SCAGENT_SIM_PLAN_STEPS sequential steps)
+for N sessions against the simulated chat model, with real code execution in
+subprocesses, and reports throughput:
+
+    - sync:  app.invoke on a pool of --threads worker threads (one pinned thread per running session)
+    - sync, one thread per session: the same with as many threads as sessions, the
+      unbounded thread-per-session baseline the async run is compared with
+    - async: agent.arun for every session on one event loop
+
+Usage:
+    python benchmarks/sessions_per_process.py --sessions 32 --threads 4
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Simulated model, fresh caches and scratch directories; must be set before the workflow is imported
+_SCRATCH = tempfile.mkdtemp(prefix="scagent_bench_")
+for key, value in {
+    "SCAGENT_LLM_FACTORY": "benchmarks.simulated_llm:SimulatedChatModel",
+    "SCAGENT_LLM_CACHE": "0",
+    "SCAGENT_RESULT_CACHE": "0",
+    "SCAGENT_PREROUTER": "0",
+    "SCAGENT_EXECUTOR": "subprocess",
+    "SCAGENT_PARALLEL_STEPS": "1",
+    "SCAGENT_ROUTER_DIR": os.path.join(_SCRATCH, "routing"),
+    "SCAGENT_FIX_MEMORY_DIR": os.path.join(_SCRATCH, "fixes"),
+    "SCAGENT_RESULTS_DIR": os.path.join(_SCRATCH, "results"),
+    "SCAGENT_SANDBOX_ROOT": os.path.join(_SCRATCH, "sandboxes"),
+}.items():
+    os.environ.setdefault(key, value)
+os.environ.setdefault("OPENAI_API_KEY", "not-used")
+
+from agent import Agent, tools_dict  # noqa: E402
+from benchmarks.simulated_llm import SIM_LLM_LATENCY, SIM_EXEC_SECONDS, SIM_PLAN_STEPS  # noqa: E402
+
+
+def session_inputs(idx: int) -> dict:
+    return {
+        "user_prompt": "Yes, please run the plan.",
+        "session_id": f"bench-{idx}",
+        "conversation_history": [],
+        "history_summary": "",
+        "history_summary_covered": 0,
+        "error": "no",
+        "all_generated_code": "",
+        "available_tools": tools_dict,
+        "code_generation": "",
+        "current_task_index": 0,
+        "replan_triggered": False,
+        "plan": [f"Simulated step {step + 1}" for step in range(SIM_PLAN_STEPS)],
+        "step_tools": {},
+        "step_dependencies": {},
+        "input_file_path": "",
+        "stdout_output": "",
+        "use_result_cache": False,
+    }
+
+
+class PeakThreads:
+    """Samples the number of live threads while a benchmark runs."""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(0.05):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_sync(agent: Agent, sessions: int, threads: int) -> dict:
+    config = {"recursion_limit": 100}
+    with PeakThreads() as peak:
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda idx: agent.app.invoke(session_inputs(idx), config), range(sessions)))
+        elapsed = time.time() - start
+    return {"mode": f"sync ({threads} threads)", "elapsed": elapsed, "peak_threads": peak.peak}
+
+
+def run_async(agent: Agent, sessions: int) -> dict:
+    config = {"recursion_limit": 100}
+
+    async def main():
+        await asyncio.gather(*(agent.arun(session_inputs(idx), config) for idx in range(sessions)))
+
+    with PeakThreads() as peak:
+        start = time.time()
+        asyncio.run(main())
+        elapsed = time.time() - start
+    return {"mode": "async (1 event loop)", "elapsed": elapsed, "peak_threads": peak.peak}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=32, help="concurrent sessions (requests) to serve")
+    parser.add_argument("--threads", type=int, default=4, help="worker threads of the sync baseline")
+    args = parser.parse_args()
+
+    agent = Agent()
+    print(f"{args.sessions} sessions, {SIM_PLAN_STEPS} steps each, LLM latency {SIM_LLM_LATENCY}s, "
+          f"code execution {SIM_EXEC_SECONDS}s per step\n")
+    # The nodes print their progress; keep the benchmark output readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        rows = [run_sync(agent, args.sessions, args.threads)]
+        if args.threads < args.sessions:
+            rows.append(run_sync(agent, args.sessions, args.sessions))
+        rows.append(run_async(agent, args.sessions))
+    print(f"{'mode':<24}{'wall time':>12}{'sessions/s':>12}{'sessions/min':>14}{'peak threads':>14}")
+    for row in rows:
+        rate = args.sessions / row["elapsed"]
+        print(f"{row['mode']:<24}{row['elapsed']:>11.1f}s{rate:>12.2f}{rate * 60:>14.1f}{row['peak_threads']:>14}")
+
+
+if __name__ == "__main__":
+    main()
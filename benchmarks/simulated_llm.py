@@ -0,0 +1,253 @@
+"""
+Stand-in chat models for the benchmarks: no network, no API key.
+
+Plugged in with SCAGENT_LLM_FACTORY (see workflow_utils/llm.py):
+
+    benchmarks.simulated_llm:SimulatedChatModel
+        Fixed latency and deterministic canned answers. Plain chains get a short
+        reply (the conductor always routes to analysis_agent); structured-output
+        chains get a valid instance of their schema. The code generator answers
+        with the scenario code of the current task (benchmarks/pipeline_scenario.py),
+        or with a block that sleeps for SCAGENT_SIM_EXEC_SECONDS.
+
+    benchmarks.simulated_llm:ReplayChatModel
+        Answers from a recording (SCAGENT_SIM_RECORDING): the recorded answer to the
+        same prompt, else the next unused answer of the same kind (same schema),
+        else the canned answer.
+
+    benchmarks.simulated_llm:RecordingChatModel
+        ChatOpenAI that appends every answer to SCAGENT_SIM_RECORDING, e.g. while
+        using the app, to build recordings for ReplayChatModel.
+
+Structured output goes through tool calls, like ChatOpenAI, so every call is a
+real chat model run: callbacks (tracing.RunProfiler, get_openai_callback) see it,
+with token usage estimated by count_tokens.
+
+Settings (environment variables):
+    SCAGENT_SIM_LLM_LATENCY     seconds per simulated LLM call (default 0.5)
+    SCAGENT_SIM_EXEC_SECONDS    seconds each canned code block runs (default 0.5)
+    SCAGENT_SIM_PLAN_STEPS      steps in the simulated plan (default 3)
+    SCAGENT_SIM_RECORDING       JSONL recording read by ReplayChatModel and written by RecordingChatModel
+"""
+import os
+import re
+import ast
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_openai import ChatOpenAI
+
+from workflow_utils import count_tokens
+from benchmarks.pipeline_scenario import scenario_code
+
+SIM_LLM_LATENCY = float(os.environ.get("SCAGENT_SIM_LLM_LATENCY", "0.5"))
+SIM_EXEC_SECONDS = float(os.environ.get("SCAGENT_SIM_EXEC_SECONDS", "0.5"))
+SIM_PLAN_STEPS = int(os.environ.get("SCAGENT_SIM_PLAN_STEPS", "3"))
+SIM_RECORDING = os.environ.get("SCAGENT_SIM_RECORDING", "")
+
+_recording_lock = threading.Lock()
+
+
+def _text(messages: List[BaseMessage]) -> str:
+    return "\n".join(str(message.content) for message in messages)
+
+
+def prompt_hash(messages: List[BaseMessage]) -> str:
+    return hashlib.sha256(_text(messages).encode()).hexdigest()
+
+
+def _reply(messages: List[BaseMessage]) -> str:
+    text = _text(messages)
+    if "routing agent" in text:
+        return "analysis_agent"
+    if "Report Generator" in text:
+        return "- All simulated steps completed."
+    return "Simulated reply."
+
+
+def _code_answer(messages: List[BaseMessage]) -> dict:
+    """Scenario code of the task named in the code generator's request, else a block that just sleeps."""
+    request = str(messages[-1].content)
+    task = re.search(r"current task: (.*)$", request)
+    paths = re.search(r"^- input_file_path: (.*)$", request, flags=re.MULTILINE)
+    results_dir = re.search(r"^- results_dir: (.*)$", request, flags=re.MULTILINE)
+    try:
+        input_paths = ast.literal_eval(paths.group(1)) if paths else None
+    except (ValueError, SyntaxError):
+        input_paths = None
+    input_path = next(iter(input_paths)) if isinstance(input_paths, dict) and input_paths else None
+    code = scenario_code(task.group(1).strip() if task else "", input_path, results_dir.group(1).strip() if results_dir else None)
+    if code is not None:
+        return {"prefix": "Scenario step", "imports": "import scanpy as sc", "code": code}
+    return {"prefix": "Simulated step", "imports": "import time",
+            "code": f"time.sleep({SIM_EXEC_SECONDS})\nprint('Simulated step finished')"}
+
+
+def _structured(name: str, messages: List[BaseMessage]) -> dict:
+    """Arguments of a valid instance of the schema named `name`."""
+    if name == "Plan":
+        steps = [f"Simulated step {idx + 1}" for idx in range(SIM_PLAN_STEPS)]
+        return {"steps": steps, "depends_on": [[idx] if idx else [] for idx in range(SIM_PLAN_STEPS)], "input_file_path": None}
+    if name == "PlanEditor":
+        return {"edited_plan": [f"Simulated step {idx + 1}" for idx in range(SIM_PLAN_STEPS)]}
+    if name == "SelectedTool":
+        return {"tools": ["None"]}
+    if name == "StepTools":
+        # One answer per numbered step in the request
+        listed = re.findall(r"^\s*\d+\. ", str(messages[-1].content), flags=re.MULTILINE)
+        return {"tools": ["None"] * len(listed)}
+    if name == "Code":
+        return _code_answer(messages)
+    if name == "Reflection":
+        return {"error": "Simulated error", "suggestion": "Simulated suggestion"}
+    raise ValueError(f"No simulated answer for schema {name}")
+
+
+class SimulatedChatModel(BaseChatModel):
+    """Chat model that waits SIM_LLM_LATENCY seconds and answers from canned templates."""
+
+    model: str = "simulated"
+    temperature: float = 0
+    latency: float = SIM_LLM_LATENCY
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated"
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def answer(self, messages: List[BaseMessage], tool_name: Optional[str]) -> AIMessage:
+        """The answer without latency or usage: a reply, or a call of `tool_name` (structured output)."""
+        if tool_name is None:
+            return AIMessage(content=_reply(messages))
+        return AIMessage(content="", tool_calls=[{"name": tool_name, "args": _structured(tool_name, messages), "id": f"call_{uuid.uuid4().hex[:12]}"}])
+
+    def _result(self, messages: List[BaseMessage], tools: Optional[list]) -> ChatResult:
+        message = self.answer(messages, tools[0]["function"]["name"] if tools else None)
+        output = message.content or json.dumps([call["args"] for call in message.tool_calls])
+        prompt_tokens, completion_tokens = count_tokens(_text(messages)), count_tokens(output)
+        message.usage_metadata = {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                                  "total_tokens": prompt_tokens + completion_tokens}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result(messages, kwargs.get("tools"))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result(messages, kwargs.get("tools"))
+
+
+def load_recording(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class _Recording:
+    """Recorded answers, by prompt and in order per kind ("text" or a schema name)."""
+
+    def __init__(self, path: str):
+        records = load_recording(path) if path and os.path.exists(path) else []
+        self.by_prompt = {record["prompt_hash"]: record for record in records}
+        self.by_kind = defaultdict(list)
+        for record in records:
+            self.by_kind[record["kind"]].append(record)
+        self.used = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def find(self, kind: str, messages: List[BaseMessage]) -> Optional[dict]:
+        record = self.by_prompt.get(prompt_hash(messages))
+        if record is not None and record["kind"] == kind:
+            return record
+        with self.lock:
+            position = self.used[kind]
+            if position < len(self.by_kind[kind]):
+                self.used[kind] += 1
+                return self.by_kind[kind][position]
+        return None
+
+
+_recordings: Dict[str, _Recording] = {}
+
+
+class ReplayChatModel(SimulatedChatModel):
+    """Simulated model that answers with recorded answers where it has them (SCAGENT_SIM_RECORDING)."""
+
+    recording: str = SIM_RECORDING
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def answer(self, messages: List[BaseMessage], tool_name: Optional[str]) -> AIMessage:
+        recording = _recordings.setdefault(self.recording, _Recording(self.recording))
+        record = recording.find(tool_name or "text", messages)
+        if record is None:
+            return super().answer(messages, tool_name)
+        if tool_name is None:
+            return AIMessage(content=record["output"])
+        return AIMessage(content="", tool_calls=[{"name": tool_name, "args": record["output"], "id": f"call_{uuid.uuid4().hex[:12]}"}])
+
+
+class RecordingChatModel(ChatOpenAI):
+    """ChatOpenAI that appends every answer to SCAGENT_SIM_RECORDING for later replay."""
+
+    def _record(self, messages: List[BaseMessage], result: ChatResult, kwargs: dict):
+        message = result.generations[0].message
+        tools = kwargs.get("tools") or []
+        response_format = kwargs.get("response_format")
+        if message.tool_calls:
+            kind, output = message.tool_calls[0]["name"], message.tool_calls[0]["args"]
+        elif tools or response_format:
+            # Structured output answered as JSON content (json_schema method)
+            kind = tools[0]["function"]["name"] if tools else getattr(response_format, "__name__", "structured")
+            output = json.loads(message.content)
+        else:
+            kind, output = "text", message.content
+        self._write(kind, messages, output)
+
+    def _write(self, kind: str, messages: List[BaseMessage], output):
+        record = {"kind": kind, "prompt_hash": prompt_hash(messages), "model": self.model_name, "output": output}
+        with _recording_lock, open(SIM_RECORDING, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        if SIM_RECORDING:
+            self._record(messages, result, kwargs)
+        return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        if SIM_RECORDING:
+            self._record(messages, result, kwargs)
+        return result
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        # Streamed replies (front desk, reporter) are recorded once complete
+        content = ""
+        for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            content += chunk.message.content if isinstance(chunk.message.content, str) else ""
+            yield chunk
+        if SIM_RECORDING and not kwargs.get("tools"):
+            self._write("text", messages, content)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        content = ""
+        async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            content += chunk.message.content if isinstance(chunk.message.content, str) else ""
+            yield chunk
+        if SIM_RECORDING and not kwargs.get("tools"):
+            self._write("text", messages, content)
@@ -0,0 +1,228 @@
+"""
+Rebuild past runs from scagent log files, and re-execute their code without any LLM.
+
+The logs in logs/ hold full traces of past sessions. This tool turns a log into
+structured run records: requests (user prompt, route), their tasks, and the
+code attempts of every task (code, imports, outcome, error). Each level carries
+timings:
+
+    - llm_wait:  time spent waiting for OpenAI responses. Each "HTTP Request"
+                 line closes a call that started at the previous log entry.
+    - exec:      time spent executing code blocks (code checker start to result)
+    - other:     the rest of the task (prompt building, tool docs, bookkeeping)
+
+The final report is counted in the request, not in its last task. Entries of
+concurrent sessions or parallel steps interleave in one log; they are
+attributed in log order.
+
+With --replay, the recorded code of every task runs again against the local
+executor, in order and without any LLM call. By default only each task's
+successful attempt is replayed; --all-attempts replays failed ones too. Paths
+of the original machine can be rewritten with --path-map OLD=NEW.
+
+Usage:
+    python log_replay.py logs/scagent_log_2025-05-12_21-50-54.log
+    python log_replay.py logs/*.log --json runs.json
+    python log_replay.py 'logs/*.jsonl' 'logs/*.jsonl.*.gz'
+    python log_replay.py logs/scagent_log_2025-05-12_21-50-54.log --replay --path-map /home/koozy/BMDS/practicum/SCAgent_UI=$PWD
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import argparse
+from typing import Dict, List, Optional
+
+from workflow_utils.structured_logging import read_log_entries
+
+_CODE_RE = re.compile(r"my current prexif:\n\n(?P<prefix>.*?)\n\nmy final code:\n\n(?P<code>.*?)\n\nmy final imports:\n\n(?P<imports>.*)$", re.DOTALL)
+_EXEC_TIME_RE = re.compile(r"^Code block executed in ([\d.]+)s(?: \(.*peak memory (\d+) MB\))?")
+
+
+# ---------- parsing ----------
+def _new_task(index: int, task: str, started: float) -> dict:
+    return {"index": index, "task": task, "started": started, "ended": started, "llm_calls": 0, "llm_wait": 0.0,
+            "exec_seconds": 0.0, "attempts": []}
+
+
+def parse_log(path: str) -> dict:
+    """Structured record of one log file: its requests, their tasks and every code attempt."""
+    requests: List[dict] = []
+    request: Optional[dict] = None
+    task: Optional[dict] = None
+    attempt: Optional[dict] = None
+    previous_time = None
+    checker_started = None
+    expect_route = False
+
+    for timestamp, level, source, message in read_log_entries(path):
+        if message == "---Initiate Conductor Agent---":
+            request = {"user_prompt": "", "route": None, "started": timestamp, "ended": timestamp,
+                       "llm_calls": 0, "llm_wait": 0.0, "tasks": []}
+            requests.append(request)
+            task = attempt = None
+        if request is None:
+            previous_time = timestamp
+            continue
+        request["ended"] = timestamp
+        if task is not None:
+            task["ended"] = timestamp
+
+        if message.startswith("HTTP Request:") and previous_time is not None:
+            wait = timestamp - previous_time
+            request["llm_calls"] += 1
+            request["llm_wait"] += wait
+            if task is not None:
+                task["llm_calls"] += 1
+                task["llm_wait"] += wait
+        elif expect_route:
+            request["route"] = message.strip() or None
+        elif message.startswith("user_prompt: ") and not request["user_prompt"]:
+            request["user_prompt"] = message[len("user_prompt: "):]
+        elif message.startswith("Route to "):
+            request["route"] = request["route"] or message[len("Route to "):].split()[0]
+        elif message == "All Plan completed" or message.startswith("all generated code:"):
+            # The report that follows belongs to the request, not to the last task
+            task = attempt = None
+        elif message.startswith("Current task index: "):
+            index = int(message.rsplit(" ", 1)[1])
+            task = _new_task(index, "", timestamp)
+            request["tasks"].append(task)
+            attempt = None
+        elif message.startswith("Current task: ") and task is not None and not task["task"]:
+            task["task"] = message[len("Current task: "):]
+        elif message.startswith("my current prexif:") and task is not None:
+            match = _CODE_RE.search(message)
+            if match:
+                attempt = {"iteration": len(task["attempts"]) + 1, "code": match.group("code"),
+                           "imports": match.group("imports").strip(), "outcome": None, "error": None, "exec_seconds": None, "peak_rss_mb": None}
+                task["attempts"].append(attempt)
+        elif message == "---Initiate Code Checker---":
+            checker_started = timestamp
+        elif (match := _EXEC_TIME_RE.match(message)) and attempt is not None:
+            attempt["exec_seconds"] = float(match.group(1))
+            attempt["peak_rss_mb"] = float(match.group(2)) if match.group(2) else None
+        elif message.startswith("---CODE BLOCK CHECK:") and attempt is not None:
+            attempt["outcome"] = "ok" if "SUCCESS" in message else "failed"
+            if attempt["exec_seconds"] is None and checker_started is not None:
+                attempt["exec_seconds"] = timestamp - checker_started
+            task["exec_seconds"] += attempt["exec_seconds"] or 0.0
+        elif message.startswith("Error message:") and attempt is not None and attempt["error"] is None:
+            attempt["error"] = message.split(":", 1)[1].strip()[-500:]
+        expect_route = message == "conductor_result:"
+        previous_time = timestamp
+
+    for request in requests:
+        request["duration"] = request["ended"] - request["started"]
+        for task in request["tasks"]:
+            task["duration"] = task["ended"] - task["started"]
+            task["other_seconds"] = max(0.0, task["duration"] - task["llm_wait"] - task["exec_seconds"])
+    return {"log": os.path.abspath(path), "requests": requests}
+
+
+# ---------- replay ----------
+def apply_path_map(source: str, path_map: Dict[str, str]) -> str:
+    for old, new in path_map.items():
+        source = source.replace(old, new)
+    return source
+
+
+def replay_run(run: dict, path_map: Dict[str, str], all_attempts: bool = False, timeout: float = 600) -> List[dict]:
+    """Re-execute the recorded code of every task in order; returns one row per executed block."""
+    from workflow_utils import run_code, create_attempt_sandbox, release_sandbox, cleanup_session, shutdown_kernel
+
+    rows = []
+    session_id = f"replay-{os.getpid()}"
+    try:
+        for request_no, request in enumerate(run["requests"]):
+            for task in request["tasks"]:
+                attempts = task["attempts"] if all_attempts else [a for a in task["attempts"] if a["outcome"] == "ok"][-1:]
+                for attempt in attempts:
+                    temp_dir = create_attempt_sandbox(session_id, task["index"], attempt["iteration"])
+                    source = apply_path_map(attempt["imports"] + "\n" + attempt["code"], path_map)
+                    try:
+                        result = run_code(session_id, source, script_path=os.path.join(temp_dir, "replay_script.py"),
+                                          cwd=temp_dir, timeout=timeout)
+                        outcome = "ok" if result.returncode == 0 else "failed"
+                        # Generated code often reports its own errors on stdout before sys.exit(1)
+                        output = result.stderr.strip() or result.stdout.strip()
+                        error = (output.splitlines() or [f"exit code {result.returncode}"])[-1] if result.returncode else None
+                        duration, peak_rss_mb = result.duration, result.peak_rss_mb
+                    except Exception as e:
+                        outcome, error, duration, peak_rss_mb = "failed", f"{type(e).__name__}: {e}", None, None
+                    finally:
+                        release_sandbox(temp_dir)
+                    rows.append({"request": request_no, "task_index": task["index"], "task": task["task"],
+                                 "iteration": attempt["iteration"], "recorded_outcome": attempt["outcome"],
+                                 "recorded_exec": attempt["exec_seconds"], "replay_outcome": outcome,
+                                 "replay_exec": duration, "recorded_peak_mb": attempt.get("peak_rss_mb"),
+                                 "replay_peak_mb": peak_rss_mb, "error": error})
+    finally:
+        shutdown_kernel(session_id)
+        cleanup_session(session_id)
+    return rows
+
+
+# ---------- reports ----------
+def print_breakdown(run: dict):
+    print(f"\n{run['log']}")
+    for request_no, request in enumerate(run["requests"]):
+        prompt = request["user_prompt"] if len(request["user_prompt"]) <= 70 else request["user_prompt"][:67] + "..."
+        print(f"\nRequest {request_no + 1} -> {request['route']}: {prompt}")
+        print(f"  {request['duration']:.1f}s total, {request['llm_calls']} LLM calls, {request['llm_wait']:.1f}s LLM wait")
+        if not request["tasks"]:
+            continue
+        print(f"  {'task':<6}{'attempts':>9}{'total':>9}{'LLM wait':>10}{'exec':>9}{'other':>9}  description")
+        for task in request["tasks"]:
+            print(f"  {task['index'] + 1:<6}{len(task['attempts']):>9}{task['duration']:>8.1f}s{task['llm_wait']:>9.1f}s"
+                  f"{task['exec_seconds']:>8.1f}s{task['other_seconds']:>8.1f}s  {task['task'][:60]}")
+
+
+def print_replay(rows: List[dict]):
+    print(f"\n{'task':<6}{'try':>5}{'recorded':>11}{'replayed':>11}{'recorded exec':>15}{'replayed exec':>15}"
+          f"{'recorded peak':>15}{'replayed peak':>15}  error")
+    for row in rows:
+        recorded = f"{row['recorded_exec']:.1f}s" if row["recorded_exec"] is not None else "n/a"
+        replayed = f"{row['replay_exec']:.1f}s" if row["replay_exec"] is not None else "n/a"
+        recorded_peak = f"{row['recorded_peak_mb']:.0f}MB" if row["recorded_peak_mb"] is not None else "n/a"
+        replayed_peak = f"{row['replay_peak_mb']:.0f}MB" if row["replay_peak_mb"] is not None else "n/a"
+        print(f"{row['task_index'] + 1:<6}{row['iteration']:>5}{row['recorded_outcome'] or 'n/a':>11}{row['replay_outcome']:>11}"
+              f"{recorded:>15}{replayed:>15}{recorded_peak:>15}{replayed_peak:>15}  {(row['error'] or '')[:60]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="scagent log files or glob patterns")
+    parser.add_argument("--json", help="write the run records (and replay results) to this JSON file")
+    parser.add_argument("--replay", action="store_true", help="re-execute the recorded code with the local executor")
+    parser.add_argument("--all-attempts", action="store_true", help="replay failed attempts too, not only each task's successful one")
+    parser.add_argument("--path-map", action="append", default=[], metavar="OLD=NEW", help="rewrite paths in the replayed code")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds allowed per replayed block")
+    args = parser.parse_args()
+
+    paths = [path for pattern in args.logs for path in sorted(glob.glob(pattern))]
+    if not paths:
+        parser.error("no log files found")
+    path_map = dict(item.split("=", 1) for item in args.path_map)
+
+    runs = []
+    for path in paths:
+        run = parse_log(path)
+        print_breakdown(run)
+        if args.replay:
+            started = time.time()
+            run["replay"] = replay_run(run, path_map, args.all_attempts, args.timeout)
+            print_replay(run["replay"])
+            print(f"\nReplayed {len(run['replay'])} block(s) in {time.time() - started:.1f}s without any LLM call")
+        runs.append(run)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(runs, f, indent=2)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
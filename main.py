@@ -1,33 +1,25 @@
 import os
 import time
+import uuid
 import logging
-from datetime import datetime
+import threading
 from langchain_community.callbacks import get_openai_callback
 from langchain_core.messages import HumanMessage
+from workflow_utils import llm_cache_stats, preflight_stats, iteration_stats, FIX_MEMORY_ENABLED
+from workflow_utils import setup_logging as start_logging
+from workflow_utils import RunProfiler, format_breakdown, get_checkpointer, mark_interrupted_runs, run_thread_id, run_config, begin_run, finish_run, resumable_runs, resume_point, restore_live_namespace
+from workflow_utils import shutdown_kernel, cleanup_session
 from dotenv import load_dotenv
 import getpass
 import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
-# Set up logging configuration
+# Set up logging (once per process, shared by all sessions): records go through a queue to
+# rotating JSON log files written by a background thread, see workflow_utils/structured_logging.py
+@st.cache_resource(show_spinner=False)
 def setup_logging():
-    # Create logs directory if it doesn't exist
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-    
-    # Generate log filename with timestamp and unique ID for this run
-    current_time = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-    log_filename = f"logs/scagent_log_{current_time}.log"
-    
-    # Configure logger
-    logging.basicConfig(
-        level=logging.INFO,
-        # format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        format= "%(asctime)s - %(levelname)s -%(filename)s:%(lineno)d - %(message)s",
-        handlers=[
-            logging.FileHandler(log_filename),
-            logging.StreamHandler()  
-        ]
-    )
+    log_filename = start_logging("scagent_log")
     
     # Create a logger instance
     logger = logging.getLogger("SCAgent")
@@ -44,51 +36,142 @@ def _set_env(var: str):
 
 _set_env("OPENAI_API_KEY")
 
-# Import agent
-from agent import Agent
-agent = Agent()
-agent_app = agent.app
-
 # Set page config and title
 st.set_page_config(page_title="SCAgent – Your Single-Cell Analysis Assistant")
 st.markdown("## SCAgent – Your Single-Cell Analysis Assistant")
 
-# Available Tools Definition
-tools_dict: dict[str, str] = {
-    "CellTypist": "An automated cell type annotation tool for scRNA-seq datasets on the basis of logistic regression classifiers optimised by the stochastic gradient descent algorithm. CellTypist allows for cell prediction using either built-in (with a current focus on immune sub-populations) or custom models, in order to assist in the accurate classification of different cell types and subtypes.", 
-    "SAM": "a foundation model for image segmentation. It is designed to segment any object in any image with minimal user input — like a point, box, or free-form mask.",
-    "YOLO": "a real-time object detection algorithm that detects and classifies objects in images or videos in a single neural network pass.",
-    "PRnet" : "a perturbation-conditioned generative model designed to predict transcriptional responses to novel drug perturbations at both bulk and single-cell levels.",
-    "ScType": "a computational tool for the fully automated and rapid identification of cell types from single-cell RNA sequencing data by utilizing specific marker gene combinations."
-    }
+logger = setup_logging()
+
+# Import agent
+# Streamlit re-executes this script on every interaction, so the LLM chains, tool
+# documentation and compiled graph are built once per process and shared by all sessions.
+@st.cache_resource(show_spinner="Starting SCAgent...")
+def load_agent():
+    start_time = time.time()
+    from agent import Agent, tools_dict
+    # Runs cut off by the previous process (crash, restart) become resumable
+    mark_interrupted_runs()
+    agent = Agent(checkpointer=get_checkpointer())
+    startup_time = time.time() - start_time
+    logging.info(f"Agent workflow built in {startup_time:.2f}s")
+    return agent.app, tools_dict, startup_time
+
+agent_app, tools_dict, startup_time = load_agent()
 
 # Session State Initialization
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+
+# Streamlit has no session-end callback: every script run releases the execution kernel
+# and sandbox directories of the sessions whose browser connection is gone
+@st.cache_resource(show_spinner=False)
+def session_registry():
+    return {}, threading.Lock()
+
+
+def release_ended_sessions():
+    sessions, lock = session_registry()
+    ctx = get_script_run_ctx()
+    with lock:
+        if ctx is not None:
+            sessions[ctx.session_id] = st.session_state.session_id
+        ended = [sessions.pop(sid) for sid in list(sessions) if not runtime.get_instance().is_active_session(sid)]
+    for session_id in ended:
+        logging.info(f"Session {session_id} ended, releasing its kernel and sandboxes")
+        shutdown_kernel(session_id)
+        cleanup_session(session_id)
+
+
+if runtime.exists():
+    release_ended_sessions()
+if "run_no" not in st.session_state:
+    # Number of requests in this session; each request is checkpointed on its own thread
+    st.session_state.run_no = 0
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "conversation_history" not in st.session_state:
     st.session_state.conversation_history = []
 if "plan" not in st.session_state:
     st.session_state.plan = []
+if "history_summary" not in st.session_state:
+    # Running summary of older conversation turns and how many messages it covers
+    st.session_state.history_summary = ""
+    st.session_state.history_summary_covered = 0
+if "step_tools" not in st.session_state:
+    st.session_state.step_tools = {}
+if "step_dependencies" not in st.session_state:
+    st.session_state.step_dependencies = {}
 if "input_file_path" not in st.session_state:
     st.session_state.input_file_path = ""
 if "total_cost" not in st.session_state:
     st.session_state.total_cost = 0.0
-if "thinking" not in st.session_state:
-    st.session_state.thinking = False
+if "llm_cache" not in st.session_state:
+    # LLM response cache hits, lookups and the cost they saved in this session
+    st.session_state.llm_cache = {"hits": 0, "lookups": 0, "saved_cost": 0.0}
 if "processing_time" not in st.session_state:
     st.session_state.processing_time = 0.0
 if "stdout_output" not in st.session_state:
     st.session_state.stdout_output = ""
 if "logger" not in st.session_state:
-    # Initiatlize Logger
+    # Log the start of every new session
     st.session_state.logger = "Initiate Logger"
-    logger = setup_logging()
-    logger.info("Application started")
+    logger.info(f"Application started (session {st.session_state.session_id})")
+
+
+# Sidebar Settings
+use_result_cache = st.sidebar.checkbox(
+    "Reuse cached results of identical code steps",
+    value=True,
+    help="Untick to force every generated code block to execute again.",
+)
+early_kill = st.sidebar.checkbox(
+    "Stop code early on fatal errors",
+    value=True,
+    help="Abort a running step as soon as its output shows a fatal error (e.g. MemoryError) instead of waiting for the timeout.",
+)
+
+st.sidebar.caption(f"Workflow built once per process in {startup_time:.2f}s")
+
+# Failed or interrupted runs, resumed from their last completed task
+resume_run = None
+failed_runs = resumable_runs(st.session_state.session_id)
+if failed_runs:
+    st.sidebar.markdown("**Resume a failed run**")
+for run in failed_runs:
+    label = run["user_prompt"] if len(run["user_prompt"]) <= 40 else run["user_prompt"][:37] + "..."
+    if st.sidebar.button(f"↻ {label}", key=f"resume_{run['thread_id']}",
+                         help=f"{run['status'].capitalize()}: {run['error'] or 'process stopped'}"):
+        resume_run = run
 
+# Number of execution output lines kept on screen while a step runs
+MAX_LIVE_OUTPUT_LINES = 200
+
+# Human-readable labels of graph nodes shown while the workflow runs
+NODE_LABELS = {
+    "conductor_agent": "Conductor: routing your request",
+    "frontdesk_agent": "Front desk: writing a reply",
+    "plan_editor_agent": "Plan editor: revising the plan",
+    "tool_selector_node_two": "Tool selector: choosing a tool for the request",
+    "planner_agent": "Planner: drafting the analysis plan",
+    "task_retriever": "Task retriever: loading the next task",
+    "tool_selector_agent_one": "Tool selector: choosing a tool for the task",
+    "code_generator_agent": "Code generator: writing code",
+    "code_checker": "Code checker: executing code",
+    "reflect_agent": "Reflection: analysing the error",
+    "index_updater": "Moving to the next task",
+    "replan_agent": "Replanner: revising the failing task",
+    "parallel_runner": "Running independent tasks in parallel",
+    "reporter_agent": "Reporter: writing the report",
+}
+# Agents whose replies are streamed token by token into the chat
+STREAMED_REPLY_NODES = {"frontdesk_agent", "reporter_agent"}
 
 # UI Elements
 # Function to display the cost and processing time at the bottom right
 def display_metrics():
+    lookups = st.session_state.llm_cache["lookups"]
+    cache_hit_rate = st.session_state.llm_cache["hits"] / lookups if lookups else 0.0
     metrics_display_html = f"""
     <div style='
         position: fixed;
@@ -104,7 +187,8 @@ def display_metrics():
         z-index: 9999; /* Ensure it's on top */
     '>
         Processing Time: <span style='color: #3F51B5;'>{st.session_state.processing_time:.2f}s</span><br>
-        Total Cost: <span style='color: #4CAF50;'>${st.session_state.total_cost:.6f}</span>
+        Total Cost: <span style='color: #4CAF50;'>${st.session_state.total_cost:.6f}</span><br>
+        LLM Cache: <span style='color: #3F51B5;'>{cache_hit_rate:.0%} hits</span>, saved <span style='color: #4CAF50;'>${st.session_state.llm_cache["saved_cost"]:.6f}</span>
     </div>
     """
     st.markdown(metrics_display_html, unsafe_allow_html=True)
@@ -115,33 +199,35 @@ for msg in st.session_state.messages:
     with st.chat_message(msg["role"]):
         st.markdown(msg["content"])
 
-# 2. Display thinking indicator if in thinking state
-if st.session_state.thinking:
-    with st.chat_message("assistant"):
-        st.write("Thinking...")
+# 2. Accept user input (or a run to resume) and process it in the same script run
+prompt = st.chat_input("Ask about single-cell analysis...")
+resume_config = None
+if resume_run is not None and not prompt:
+    point = resume_point(agent_app, resume_run["thread_id"])
+    if point is None:
+        st.sidebar.warning("Nothing left to resume in this run.")
+        finish_run(resume_run["thread_id"], "completed")
+    else:
+        resume_config, resume_values = point
+        prompt = resume_run["user_prompt"]
+        logging.info(f"Resuming run {resume_run['thread_id']} before {resume_values.get('current_task') or 'the next step'}")
+        restore_live_namespace(resume_values)
 
-# Accept user input
-if prompt := st.chat_input("Ask about single-cell analysis..."):
-    # Add user message to history
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    st.session_state.conversation_history.append(HumanMessage(content=f"User prompt: {prompt}"))
-    
-    # Show user input
-    with st.chat_message("user"):
-        st.markdown(prompt)
-    
-    # Set thinking state to true and rerun to show thinking indicator
-    st.session_state.thinking = True
-    st.rerun()
-
-# Process the query if in thinking state
-elif st.session_state.thinking:
-    start_time = time.time()
-    
-    with get_openai_callback() as cb:
-        agent_result = agent_app.invoke({
-            "user_prompt": st.session_state.messages[-1]["content"],
+if prompt:
+    if resume_config is None:
+        # Add user message to history
+        st.session_state.messages.append({"role": "user", "content": prompt})
+        st.session_state.conversation_history.append(HumanMessage(content=f"User prompt: {prompt}"))
+        with st.chat_message("user"):
+            st.markdown(prompt)
+        st.session_state.run_no += 1
+        thread_id = run_thread_id(st.session_state.session_id, st.session_state.run_no)
+        graph_inputs = {
+            "user_prompt": prompt,
+            "session_id": st.session_state.session_id,
             "conversation_history": st.session_state.conversation_history,
+            "history_summary": st.session_state.history_summary,
+            "history_summary_covered": st.session_state.history_summary_covered,
             "iteration": 0,
             "error": "no",
             "all_generated_code": "",
@@ -150,11 +236,157 @@ elif st.session_state.thinking:
             "current_task_index": 0,
             "replan_triggered": False,
             "plan": st.session_state.plan,
+            "step_tools": st.session_state.step_tools,
+            "step_dependencies": st.session_state.step_dependencies,
             "input_file_path": st.session_state.input_file_path,
-            "stdout_output": st.session_state.stdout_output
-        }, {"recursion_limit": 100})
+            "stdout_output": st.session_state.stdout_output,
+            "use_result_cache": use_result_cache,
+            "early_kill": early_kill,
+        }
+        graph_config = run_config(thread_id, recursion_limit=100)
+    else:
+        # Continue from the checkpoint: the completed tasks' code and output are already in its state
+        thread_id = resume_run["thread_id"]
+        graph_inputs = None
+        graph_config = {**resume_config, "recursion_limit": 100}
+        st.session_state.messages.append({"role": "user", "content": f"↻ Resume: {prompt}"})
+        with st.chat_message("user"):
+            st.markdown(f"↻ Resume: {prompt}")
+    begin_run(thread_id, st.session_state.session_id, prompt)
+    # Per-node latency, tokens and cost of this run (see workflow_utils/tracing.py)
+    profiler = RunProfiler(thread_id)
+    graph_config["callbacks"] = [profiler]
+    
+    assistant_container = st.chat_message("assistant")
+    progress_status = assistant_container.status("Thinking...", expanded=True)   # Node-by-node progress
+    execution_output_area = assistant_container.empty()                           # Live output of code being executed
+    reply_area = assistant_container.empty()                                      # Token-by-token reply
+    
+    start_time = time.time()
+    
+    execution_lines = []
+    reply_text = ""
+    node_started = {}
+    agent_result = None
+    run_error = None
+    cache_stats_before = llm_cache_stats()
+    with get_openai_callback() as cb:
+        try:
+            for stream_mode, chunk in agent_app.stream(graph_inputs, graph_config, stream_mode=["debug", "custom", "messages", "values"]):
+                if stream_mode == "values":
+                    agent_result = chunk
+                    continue
+            
+                # Node start / finish
+                if stream_mode == "debug":
+                    node = chunk["payload"].get("name")
+                    if node not in NODE_LABELS:
+                        continue
+                    label = NODE_LABELS[node]
+                    if chunk["type"] == "task":
+                        node_started[node] = time.time()
+                        progress_status.update(label=f"{label}...")
+                    elif chunk["type"] == "task_result":
+                        elapsed = time.time() - node_started.get(node, time.time())
+                        if chunk["payload"].get("error"):
+                            progress_status.write(f"✗ {label} failed after {elapsed:.1f}s")
+                            continue
+                        progress_status.write(f"✓ {label} ({elapsed:.1f}s)")
+                        result = dict(chunk["payload"].get("result") or [])
+                        if node == "task_retriever" and result.get("current_task"):
+                            progress_status.write(f"**Current task:** {result['current_task']}")
+                    continue
+            
+                # Token-by-token replies of the front desk and reporter agents
+                if stream_mode == "messages":
+                    message_chunk, metadata = chunk
+                    if metadata.get("langgraph_node") in STREAMED_REPLY_NODES and isinstance(message_chunk.content, str):
+                        reply_text += message_chunk.content
+                        reply_area.markdown(reply_text + "▌")
+                    continue
+            
+                # Code execution output and retry decisions
+                event_type = chunk.get("type")
+                if event_type == "decision":
+                    if chunk["decision"] == "reflect":
+                        progress_status.write(f"↻ Attempt {chunk['iterations']} failed, retrying")
+                    elif chunk["decision"] == "regenerate":
+                        progress_status.write(f"↻ Attempt {chunk['iterations']} rejected by the pre-flight check, regenerating")
+                    elif chunk["decision"] == "replan":
+                        progress_status.write(f"↻ Task failed {chunk['iterations']} times, replanning it")
+                    continue
+                if event_type == "preflight":
+                    progress_status.write("Pre-flight check: " + "; ".join(chunk["issues"]))
+                    continue
+                if event_type == "parallel_step":
+                    if chunk["status"] == "start":
+                        progress_status.write(f"**Task {chunk['task_index']+1} started:** {chunk['task']}")
+                    else:
+                        progress_status.write(f"✓ Task {chunk['task_index']+1} done ({chunk['duration']:.1f}s)")
+                    continue
+                if event_type == "known_fix":
+                    progress_status.write(f"Known error, applied fix: {chunk['patch']}" if chunk["patch"]
+                                          else "Known error, the fix that worked before was added to the retry")
+                    continue
+                if event_type == "exec_start":
+                    execution_lines.append(f"### Task {chunk['task_index']+1}, attempt {chunk['iteration']}: {chunk['task']}\n")
+                elif event_type == "exec_output":
+                    execution_lines.append(chunk["line"] if chunk["line"].endswith("\n") else chunk["line"] + "\n")
+                elif event_type == "exec_end" and chunk.get("killed_reason"):
+                    execution_lines.append(f"### Stopped early: output matched {chunk['killed_reason']!r}\n")
+                elif event_type == "exec_end" and chunk.get("peak_rss_mb") is not None:
+                    execution_lines.append(f"### Finished in {chunk['duration']:.1f}s, peak memory {chunk['peak_rss_mb']:.0f} MB\n")
+                else:
+                    continue
+                execution_output_area.code("".join(execution_lines[-MAX_LIVE_OUTPUT_LINES:]), language="text")
+        except Exception as e:
+            run_error = e
+            finish_run(thread_id, "failed", f"{type(e).__name__}: {e}")
+            logging.exception(f"Run {thread_id} failed, it can be resumed from its last completed task")
+        except BaseException:
+            # Stopped by the user or by a rerun of the page
+            finish_run(thread_id, "interrupted")
+            raise
+        else:
+            finish_run(thread_id, "completed")
         st.session_state.total_cost += cb.total_cost
     
+    # LLM cache activity during this request (the counters are shared by the whole process)
+    cache_stats_after = llm_cache_stats()
+    cache_hits = cache_stats_after["hits"] - cache_stats_before["hits"]
+    cache_lookups = cache_hits + cache_stats_after["misses"] - cache_stats_before["misses"]
+    saved_cost = cache_stats_after["saved_cost"] - cache_stats_before["saved_cost"]
+    st.session_state.llm_cache["hits"] += cache_hits
+    st.session_state.llm_cache["lookups"] += cache_lookups
+    st.session_state.llm_cache["saved_cost"] += saved_cost
+    logging.info(f"Request cost: ${cb.total_cost:.6f} ({cb.successful_requests} LLM calls), "
+                 f"LLM cache: {cache_hits}/{cache_lookups} hits, saved ${saved_cost:.6f}")
+    logging.info(f"Pre-flight check (process totals): {preflight_stats()}")
+    if FIX_MEMORY_ENABLED:
+        logging.info(f"Fix memory, attempts to success (all runs): {iteration_stats()}")
+    
+    breakdown = profiler.breakdown()
+    logging.info(f"Run profile ({profiler.path}):\n{format_breakdown(breakdown)}")
+    with assistant_container.expander("Run profile: time per agent"):
+        st.dataframe(
+            [{"Agent": row["node"], "Runs": row["runs"], "Total (s)": round(row["seconds"], 2),
+              "LLM (s)": round(row["llm_seconds"], 2), "Execution (s)": round(row["exec_seconds"], 2),
+              "Other (s)": round(row["other_seconds"], 2), "LLM calls": row["llm_calls"],
+              "Prompt tokens": row["prompt_tokens"], "Completion tokens": row["completion_tokens"],
+              "Cost ($)": round(row["cost"], 6), "Peak memory (MB)": round(row["peak_rss_mb"]) if row.get("peak_rss_mb") is not None else None,
+              "Errors": row["errors"]} for row in breakdown],
+            hide_index=True,
+        )
+    
+    if run_error is not None:
+        progress_status.update(label="Failed", state="error", expanded=False)
+        st.error(f"The run failed ({type(run_error).__name__}: {run_error}). "
+                 "Use **Resume a failed run** in the sidebar to continue from the last completed task.")
+        display_metrics()
+        st.stop()
+    
+    progress_status.update(label="Done", state="complete", expanded=False)
+    
     # Calculate processing time
     end_time = time.time()
     st.session_state.processing_time = end_time - start_time
@@ -165,16 +397,15 @@ elif st.session_state.thinking:
         reply = assistant_msgs.content
         st.session_state.messages.append({"role": "assistant", "content": reply})
         st.session_state.conversation_history.append(assistant_msgs)
+        reply_area.markdown(reply)
     
     # Update other state
     st.session_state.plan = agent_result["plan"]
+    st.session_state.step_tools = agent_result.get("step_tools") or {}
+    st.session_state.step_dependencies = agent_result.get("step_dependencies") or {}
+    st.session_state.history_summary = agent_result.get("history_summary") or ""
+    st.session_state.history_summary_covered = agent_result.get("history_summary_covered") or 0
     st.session_state.input_file_path = agent_result["input_file_path"]
-    
-    # Turn off thinking state
-    st.session_state.thinking = False
-    
-    # Force a rerun to update the UI properly
-    st.rerun()
 
 # Call the function to display the metrics at the bottom right
 display_metrics()
\ No newline at end of file
@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Module-level settings are read at import: point every runtime directory at a scratch location
+_scratch = tempfile.mkdtemp(prefix="scagent_tests_")
+os.environ.setdefault("SCAGENT_EXECUTOR", "subprocess")
+os.environ.setdefault("SCAGENT_RESULT_CACHE_DIR", os.path.join(_scratch, "result_cache"))
+os.environ.setdefault("SCAGENT_SANDBOX_ROOT", os.path.join(_scratch, "sandboxes"))
+os.environ.setdefault("SCAGENT_RESULTS_DIR", os.path.join(_scratch, "results"))
+os.environ.setdefault("SCAGENT_LOG_DIR", os.path.join(_scratch, "logs"))
+for name in ("PROFILE", "ROUTER", "LLM_CACHE", "FIX_MEMORY", "CHECKPOINT"):
+    os.environ.setdefault(f"SCAGENT_{name}_DIR", os.path.join(_scratch, name.lower()))
+# The LLM clients are created at import; no test sends a request
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
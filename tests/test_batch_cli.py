@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from batch_cli import TASK_MARKER, check_template, render_steps, replay_dataset, split_tasks
+
+
+def _template(tmp_path, steps):
+    input_path = str(tmp_path / "template.txt")
+    results_dir = str(tmp_path / "results" / "template")
+    return {"plan": [task for task, _ in steps], "input_path": input_path, "results_dir": results_dir,
+            "steps": [{"task": task, "code": code.format(input=input_path, results=results_dir)} for task, code in steps]}
+
+
+STEPS = [
+    ("Count the lines", "n = len(open({input!r}).read().splitlines())\n"
+                        "import os\nos.makedirs({results!r}, exist_ok=True)\n"
+                        "open(os.path.join({results!r}, 'count.txt'), 'w').write(str(n))\n"),
+    ("Double the count", "import os\nn = int(open(os.path.join({results!r}, 'count.txt')).read())\n"
+                         "open(os.path.join({results!r}, 'double.txt'), 'w').write(str(2 * n))\n"),
+]
+
+
+def test_split_tasks():
+    code = f"{TASK_MARKER}Load the data\nx = 1\n{TASK_MARKER}Plot\nprint(x)\n"
+    assert split_tasks(code) == [{"task": "Load the data", "code": "x = 1\n"}, {"task": "Plot", "code": "print(x)\n"}]
+
+
+def test_render_steps_retargets_every_task(tmp_path):
+    template = _template(tmp_path, STEPS)
+    for name in ("a", "b"):
+        input_path, results_dir = str(tmp_path / f"{name}.txt"), str(tmp_path / "results" / name)
+        rendered = render_steps(template, input_path, results_dir)
+        assert input_path in rendered[0]
+        assert all(results_dir in code for code in rendered)
+        assert not any(template["input_path"] in code or template["results_dir"] in code for code in rendered)
+
+
+def test_check_template_rejects_steps_that_cannot_be_retargeted(tmp_path):
+    with pytest.raises(ValueError, match="input path"):
+        check_template(_template(tmp_path, [("Load", "x = open('other.txt').read()\n")]))
+    untouched = _template(tmp_path, STEPS + [("Print", "print('done')\n")])
+    with pytest.raises(ValueError, match="Task 3"):
+        check_template(untouched)
+    # Tasks of a persistent-namespace run may work on the kernel state alone
+    check_template(untouched, persistent=True)
+
+
+def test_replay_two_datasets(tmp_path):
+    template = _template(tmp_path, STEPS)
+    rows = []
+    for name, lines in (("a", 3), ("b", 5)):
+        input_path = tmp_path / f"{name}.txt"
+        input_path.write_text("line\n" * lines)
+        rows.append(replay_dataset(template, str(input_path), str(tmp_path / "results" / name), name, timeout=60))
+
+    assert [row["status"] for row in rows] == ["ok", "ok"]
+    assert (tmp_path / "results" / "a" / "double.txt").read_text() == "6"
+    assert (tmp_path / "results" / "b" / "double.txt").read_text() == "10"
+    assert not os.path.exists(template["results_dir"])
+
+
+def test_replay_marks_dataset_failed_when_template_is_not_retargetable(tmp_path):
+    template = _template(tmp_path, [("Load", "print(open('other.txt').read())\n")])
+    input_path = tmp_path / "a.txt"
+    input_path.write_text("x")
+    row = replay_dataset(template, str(input_path), str(tmp_path / "results" / "a"), "a", timeout=60)
+    assert row["status"] == "failed"
+    assert row["tasks_done"] == 0
+    assert "template" in row["error"]
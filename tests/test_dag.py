@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+from workflow_utils.dag import dag_width, dependencies_from_plan, plan_ancestors, plan_predecessors, run_dag
+
+PLAN = ["Load", "QC", "Cluster", "Annotate", "Plot"]
+
+
+def test_dependencies_from_plan():
+    assert dependencies_from_plan(PLAN[:3], [[], [1], [1, 3, 9]]) == {"Load": [], "QC": ["Load"], "Cluster": ["Load"]}
+    # Misaligned answers fall back to the sequential plan
+    assert dependencies_from_plan(PLAN[:3], [[], [1]]) == {}
+
+
+def test_predecessors_ancestors_and_width():
+    dependencies = {"Load": [], "QC": ["Load"], "Cluster": ["Load"], "Annotate": ["QC", "Cluster"]}
+    predecessors = plan_predecessors(PLAN, dependencies)
+    # "Plot" has no recorded dependencies: it waits for every earlier step
+    assert predecessors == [[], [0], [0], [1, 2], [0, 1, 2, 3]]
+    assert plan_ancestors(predecessors)[3] == [0, 1, 2]
+    assert dag_width(predecessors) == 2
+    # A dependency that is no longer in the plan makes the step sequential again
+    assert plan_predecessors(["Load", "Cluster"], {"Cluster": ["Normalize"]}) == [[], [0]]
+
+
+def test_run_dag_respects_dependencies_and_skips_done_steps():
+    predecessors = [[], [0], [0], [1, 2]]
+    finished, running, overlap = [0], set(), []
+    lock = threading.Lock()
+
+    def run_step(idx, lane):
+        with lock:
+            assert all(p in finished for p in predecessors[idx])
+            running.add(idx)
+            if len(running) > 1:
+                overlap.append(set(running))
+        time.sleep(0.05)
+        with lock:
+            running.discard(idx)
+            finished.append(idx)
+        return idx
+
+    assert run_dag(predecessors, run_step, done=[0], max_workers=2) == {1: 1, 2: 2, 3: 3}
+    assert {1, 2} in overlap
+
+
+def test_run_dag_stops_scheduling_after_a_failure():
+    started = []
+
+    def run_step(idx, lane):
+        started.append(idx)
+        if idx == 0:
+            raise ValueError("boom")
+        return idx
+
+    with pytest.raises(ValueError):
+        run_dag([[], [0]], run_step, max_workers=2)
+    assert started == [0]
@@ -0,0 +1,42 @@
+import h5py
+import numpy as np
+
+from workflow_utils import dataset_probe
+from workflow_utils.dataset_probe import data_context, describe_dataset, is_large_data, probe_inputs
+
+
+def _write_h5ad(path, n_obs=100, n_vars=50, nnz=400):
+    with h5py.File(path, "w") as f:
+        x = f.create_group("X")
+        x.attrs["shape"] = (n_obs, n_vars)
+        x.create_dataset("data", data=np.ones(nnz, dtype=np.float32))
+        x.create_dataset("indices", data=np.zeros(nnz, dtype=np.int32))
+        x.create_dataset("indptr", data=np.zeros(n_obs + 1, dtype=np.int64))
+        f.create_group("layers").create_dataset("counts", data=np.zeros((n_obs, n_vars), dtype=np.float32))
+
+
+def test_probe_h5ad_counts_x_and_layers(tmp_path):
+    path = tmp_path / "data.h5ad"
+    _write_h5ad(path)
+    (info,) = probe_inputs({str(path): "counts"})
+    assert (info["n_obs"], info["n_vars"], info["sparse"], info["estimated"]) == (100, 50, True, False)
+    assert info["memory_bytes"] == 400 * 4 + 400 * 4 + 101 * 8 + 100 * 50 * 4
+    assert "100 cells x 50 genes, sparse" in describe_dataset(info)
+
+
+def test_other_files_fall_back_to_the_size_on_disk(tmp_path):
+    path = tmp_path / "counts.csv"
+    path.write_text("a,b\n" * 100)
+    (info,) = probe_inputs(str(path))
+    assert info["memory_bytes"] == path.stat().st_size and info["estimated"]
+    assert probe_inputs(str(tmp_path / "missing.h5ad")) == []
+
+
+def test_large_data_mode_follows_the_threshold(tmp_path, monkeypatch):
+    path = tmp_path / "data.h5ad"
+    _write_h5ad(path)
+    monkeypatch.setattr(dataset_probe, "LARGE_DATA_THRESHOLD_GB", str(1 / 1024 ** 3))
+    assert is_large_data(probe_inputs(str(path)))
+    assert "Large-data mode" in data_context(str(path))
+    monkeypatch.setattr(dataset_probe, "LARGE_DATA_THRESHOLD_GB", "100")
+    assert "Large-data mode" not in data_context(str(path))
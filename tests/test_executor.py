@@ -0,0 +1,34 @@
+import asyncio
+import os
+import subprocess
+
+import pytest
+
+from workflow_utils.executor import arun_code, run_code
+
+LONG_LINE = "print('x' * 200000)\nprint('done')\n"
+
+
+def test_async_run_reads_lines_longer_than_the_stream_limit(tmp_path):
+    lines = []
+    result = asyncio.run(arun_code("executor-test", LONG_LINE, str(tmp_path / "script.py"), str(tmp_path),
+                                   timeout=20, backend="subprocess", on_output=lambda stream, line: lines.append(line)))
+    assert result.returncode == 0
+    assert result.duration < 10
+    assert result.stdout == "x" * 200000 + "\ndone\n"
+    assert lines == ["x" * 200000 + "\n", "done\n"]
+
+
+def test_sync_and_async_runs_agree(tmp_path):
+    source = "import sys\nprint('a')\nsys.stdout.write('no newline')\n"
+    sync = run_code("executor-test", source, str(tmp_path / "sync.py"), str(tmp_path), timeout=20, backend="subprocess")
+    result = asyncio.run(arun_code("executor-test", source, str(tmp_path / "async.py"), str(tmp_path),
+                                   timeout=20, backend="subprocess"))
+    assert result.stdout == sync.stdout == "a\nno newline"
+    assert os.path.exists(tmp_path / "async.py")
+
+
+def test_async_run_times_out(tmp_path):
+    with pytest.raises(subprocess.TimeoutExpired):
+        asyncio.run(arun_code("executor-test", "import time\ntime.sleep(10)\n", str(tmp_path / "script.py"), str(tmp_path),
+                              timeout=1, backend="subprocess"))
@@ -0,0 +1,35 @@
+from workflow_utils.fix_memory import apply_patches, error_signature
+
+SOURCE = "dense = adata.X.A\nmask = adata.obs['keep'].values\nother = model.A\n"
+SPARSE_TRACEBACK = '''Traceback (most recent call last):
+  File "/tmp/sandbox/test_script.py", line 1, in <module>
+    dense = adata.X.A
+            ^^^^^^^^^
+  File "/usr/lib/python3/site-packages/scipy/sparse/_base.py", line 771, in __getattr__
+    raise AttributeError(attr + " not found")
+AttributeError: 'csr_matrix' object has no attribute 'A'
+'''
+
+
+def test_error_signature_masks_paths_and_numbers():
+    stderr = "Traceback (most recent call last):\n  File \"/tmp/x.py\", line 3\nFileNotFoundError: [Errno 2] No such file or directory: '/data/run_12/a.h5ad'\n"
+    assert error_signature("", stderr) == "FileNotFoundError: [Errno <n>] No such file or directory: '<path>'"
+
+
+def test_sparse_patch_only_rewrites_the_failing_expression():
+    signature = error_signature("", SPARSE_TRACEBACK)
+    description, (patched,) = apply_patches(signature, SOURCE, traceback=SPARSE_TRACEBACK)
+    assert "toarray" in description
+    assert patched == "dense = adata.X.toarray()\nmask = adata.obs['keep'].values\nother = model.A\n"
+
+
+def test_sparse_patch_needs_a_sparse_type_and_a_traceback_line():
+    other_type = SPARSE_TRACEBACK.replace("'csr_matrix'", "'Model'")
+    assert apply_patches(error_signature("", other_type), SOURCE, traceback=other_type) is None
+    assert apply_patches(error_signature("", SPARSE_TRACEBACK), SOURCE) is None
+
+
+def test_numpy_alias_patch():
+    stderr = "AttributeError: module 'numpy' has no attribute 'float'.\n"
+    description, (patched,) = apply_patches(error_signature("", stderr), "x = np.float(3)\ny = np.float64(2)\n", traceback=stderr)
+    assert patched == "x = float(3)\ny = np.float64(2)\n"
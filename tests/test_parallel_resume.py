@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from workflow_nodes.parallel_nodes import make_parallel_runner
+from workflow_utils import begin_run, resumable_runs, finish_run, completed_step_results
+
+PLAN = ["Load the data", "Cluster the cells", "Annotate the cells", "Plot the clusters"]
+# Diamond: 2 and 3 need 1, 4 needs 2 and 3
+DEPENDENCIES = {PLAN[1]: [PLAN[0]], PLAN[2]: [PLAN[0]], PLAN[3]: [PLAN[1], PLAN[2]]}
+
+
+class FakeStepApp:
+    """Single-task loop that commits one line of code per step; fails on `fail_on` once."""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.ran = []
+        self.lock = threading.Lock()
+
+    def invoke(self, state, config):
+        idx = state["current_task_index"]
+        with self.lock:
+            self.ran.append(idx)
+        if idx == self.fail_on:
+            raise RuntimeError(f"step {idx + 1} failed")
+        return {**state, "all_generated_code": state["all_generated_code"] + f"\n#Next Task: {PLAN[idx]}\nstep_{idx} = 1\n",
+                "stdout_output": f"done {idx}\n"}
+
+
+def _state():
+    return {"plan": list(PLAN), "current_task_index": 0, "step_dependencies": DEPENDENCIES, "session_id": "resume-test",
+            "all_generated_code": "", "stdout_output": "", "output_records": [], "available_tools": {},
+            "step_tools": {step: "scanpy" for step in PLAN}}
+
+
+def test_resumed_parallel_run_skips_completed_steps():
+    config = {"configurable": {"thread_id": "resume-test:1"}}
+    failing = FakeStepApp(fail_on=2)
+    with pytest.raises(RuntimeError):
+        make_parallel_runner(failing)(_state(), config)
+    assert sorted(failing.ran) == [0, 1, 2]
+
+    resumed = FakeStepApp()
+    result = make_parallel_runner(resumed)(_state(), config)
+    assert sorted(resumed.ran) == [2, 3]
+    assert [line for line in result["all_generated_code"].splitlines() if line.startswith("step_")] == \
+        ["step_0 = 1", "step_1 = 1", "step_2 = 1", "step_3 = 1"]
+
+
+def test_completed_steps_are_not_reused_after_plan_edits():
+    config = {"configurable": {"thread_id": "resume-test:2"}}
+    with pytest.raises(RuntimeError):
+        make_parallel_runner(FakeStepApp(fail_on=3))(_state(), config)
+    predecessors = [[], [0], [0], [1, 2]]
+    assert sorted(completed_step_results("resume-test:2", PLAN, predecessors)) == [0, 1, 2]
+    # An edited first step invalidates everything that depends on it
+    edited = ["Load the filtered data"] + PLAN[1:]
+    assert completed_step_results("resume-test:2", edited, predecessors) == {}
+
+
+def test_resumable_runs_are_listed_per_session():
+    begin_run("session-a:1", "session-a", "analyse a.h5ad")
+    begin_run("session-b:1", "session-b", "analyse b.h5ad")
+    finish_run("session-a:1", "failed", "boom")
+    finish_run("session-b:1", "failed", "boom")
+    assert [run["user_prompt"] for run in resumable_runs("session-a")] == ["analyse a.h5ad"]
+    assert [run["user_prompt"] for run in resumable_runs("session-b")] == ["analyse b.h5ad"]
+
+
+def test_lane_kernels_are_shut_down_when_the_runner_returns(monkeypatch):
+    import workflow_nodes.parallel_nodes as parallel_nodes
+    released = []
+    monkeypatch.setattr(parallel_nodes, "shutdown_kernel", released.append)
+    monkeypatch.setattr(parallel_nodes, "PARALLEL_STEPS", 3)
+    with pytest.raises(RuntimeError):
+        make_parallel_runner(FakeStepApp(fail_on=0))(_state(), {"configurable": {"thread_id": "resume-test:3"}})
+    assert released == ["resume-test-lane1", "resume-test-lane2"]
@@ -0,0 +1,19 @@
+from workflow_utils.preflight import preflight_check
+
+
+def test_relative_input_paths_are_flagged_even_when_they_exist_next_to_the_agent(tmp_path, monkeypatch):
+    (tmp_path / "data.csv").write_text("a,b\n")
+    monkeypatch.chdir(tmp_path)
+    issues = preflight_check("import pandas as pd\ndf = pd.read_csv('data.csv')\n")
+    assert len(issues) == 1
+    assert "'data.csv' does not exist" in issues[0] and "absolute paths" in issues[0]
+
+
+def test_absolute_and_written_paths(tmp_path):
+    existing = tmp_path / "data.csv"
+    existing.write_text("a,b\n")
+    assert preflight_check(f"import pandas as pd\ndf = pd.read_csv({str(existing)!r})\n") == []
+    assert preflight_check("open('out.txt', 'w').write('x')\nprint(open('out.txt').read())\n") == []
+    missing = preflight_check(f"import pandas as pd\ndf = pd.read_csv({str(tmp_path / 'missing.csv')!r})\n",
+                              input_file_path={str(existing): "counts"})
+    assert len(missing) == 1 and "Available input files" in missing[0]
@@ -0,0 +1,84 @@
+import os
+import threading
+
+from workflow_utils import result_cache
+from workflow_utils.result_cache import run_code_cached, lookup
+
+
+def _block(results_dir, name: str, delay: float) -> str:
+    return (f"import time, os\n"
+            f"time.sleep({delay})\n"
+            f"open(os.path.join({str(results_dir)!r}, {name!r}), 'w').write({name!r})\n")
+
+
+def _run(tmp_path, source: str, results_dir):
+    script_dir = tmp_path / f"sandbox_{abs(hash(source))}"
+    script_dir.mkdir(exist_ok=True)
+    return run_code_cached("test-session", source, script_path=str(script_dir / "script.py"), cwd=str(script_dir),
+                           timeout=60, results_dir=str(results_dir))
+
+
+def test_sequential_run_stores_only_its_own_artifacts(tmp_path):
+    results_dir = tmp_path / "results"
+    results_dir.mkdir()
+    (results_dir / "existing.txt").write_text("untouched")
+    source = _block(results_dir, "sequential.txt", 0)
+
+    assert _run(tmp_path, source, results_dir).returncode == 0
+    cached = lookup(source)
+    assert cached is not None
+    assert [os.path.basename(a["path"]) for a in cached.artifacts] == ["sequential.txt"]
+
+
+def test_overlapping_runs_are_not_stored(tmp_path):
+    results_dir = tmp_path / "results"
+    results_dir.mkdir()
+    source_a = _block(results_dir, "A.txt", 1.0)
+    source_b = _block(results_dir, "B.txt", 0.2)
+    results = {}
+
+    threads = [threading.Thread(target=lambda key=key, source=source: results.__setitem__(key, _run(tmp_path, source, results_dir)))
+               for key, source in (("A", source_a), ("B", source_b))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results["A"].returncode == 0 and results["B"].returncode == 0
+    assert sorted(os.listdir(results_dir)) == ["A.txt", "B.txt"]
+    # Neither run can tell its writes apart from the other's: a hit on A must not restore B.txt
+    assert lookup(source_a) is None
+    assert lookup(source_b) is None
+    assert not result_cache._active_runs
+
+
+def test_writes_outside_the_results_directory_are_not_stored(tmp_path):
+    results_dir = tmp_path / "results"
+    results_dir.mkdir()
+    outside = tmp_path / "elsewhere.txt"
+    source = f"open({str(outside)!r}, 'w').write('x')\n"
+
+    assert _run(tmp_path, source, results_dir).returncode == 0
+    assert outside.exists()
+    assert lookup(source) is None
+
+
+def test_changed_upstream_file_in_the_results_directory_is_not_a_hit(tmp_path):
+    results_dir = tmp_path / "results"
+    results_dir.mkdir()
+    upstream = results_dir / "up.txt"
+    upstream.write_text("1")
+    # The input path is built at run time, so it is not a literal the cache could see
+    source = (f"import os\nresults_dir = {str(results_dir)!r}\n"
+              f"value = int(open(os.path.join(results_dir, 'up.txt')).read())\n"
+              f"print('value', value)\n"
+              f"open(os.path.join(results_dir, 'down.txt'), 'w').write(str(value + 10))\n")
+
+    assert _run(tmp_path, source, results_dir).stdout.strip() == "value 1"
+    assert lookup(source) is not None
+
+    upstream.write_text("7")
+    result = _run(tmp_path, source, results_dir)
+    assert result.backend != "cache"
+    assert result.stdout.strip() == "value 7"
+    assert (results_dir / "down.txt").read_text() == "17"
@@ -0,0 +1,56 @@
+import gzip
+import json
+
+import pytest
+
+from workflow_utils.router import examples_from_logs, rule_route
+from workflow_utils.structured_logging import store_payload
+
+
+def _record(message: str) -> str:
+    return json.dumps({"time": "2025-05-12 21:50:54,123", "level": "INFO", "file": "agent_nodes.py", "line": 1,
+                       "node": "", "thread": "", "message": message}) + "\n"
+
+
+def test_examples_from_json_rotated_and_text_logs(tmp_path):
+    long_prompt = "Analyse my data " + "with many details " * 200
+    digest = store_payload(str(tmp_path), f"user_prompt: {long_prompt}")
+    (tmp_path / "scagent_log_2025-05-12_21-50-54.jsonl").write_text(
+        _record("user_prompt: hello") + _record("conductor_result:\nfrontdesk_agent")
+        + _record(f"user_prompt: Analyse my data [payload {digest}, {len(long_prompt) + 13} chars]")
+        + _record("conductor_result:\nplan_generator_agent")
+        + _record("planner result:\n['Load the data']")
+        + _record("user_prompt: yes, run it") + _record("conductor_result:\nanalysis_agent"))
+    with gzip.open(tmp_path / "scagent_log_2025-05-11_10-00-00.jsonl.1.gz", "wt") as f:
+        f.write(_record("user_prompt: thanks") + _record("conductor_result:\nfrontdesk_agent"))
+    (tmp_path / "scagent_log_2025-05-10_10-00-00.log").write_text(
+        "2025-05-10 10:00:01,000 - INFO -agent_nodes.py:109 - user_prompt: Make a plan\n"
+        "2025-05-10 10:00:02,000 - INFO -agent_nodes.py:124 - conductor_result:\nplan_generator_agent\n")
+
+    assert sorted(examples_from_logs(str(tmp_path))) == sorted([
+        ("Make a plan", False, "plan_generator_agent"),
+        ("thanks", False, "frontdesk_agent"),
+        ("hello", False, "frontdesk_agent"),
+        (long_prompt, False, "plan_generator_agent"),
+        ("yes, run it", True, "analysis_agent"),
+    ])
+
+
+@pytest.mark.parametrize("prompt, has_plan, route", [
+    ("Hello!", False, "frontdesk_agent"),
+    ("thanks", True, "frontdesk_agent"),
+    ("yes, go ahead", True, "analysis_agent"),
+    ("Proceed with the plan please", True, "analysis_agent"),
+    ("yes", False, None),
+    ("Change step 3 to use Leiden clustering", True, "plan_editor_agent"),
+    ("Please remove the doublet detection step", True, "plan_editor_agent"),
+    ("add a UMAP step after clustering", True, "plan_editor_agent"),
+    ("Remove step 2", False, None),
+    # Questions and longer requests that only mention an edit verb and a step go to the classifier or the LLM
+    ("How do I remove batch effects in a later step?", True, None),
+    ("Can you explain what task 2 will change in my data?", True, None),
+    ("Please analyse my new file /data/pbmc.h5ad with the same plan and add a UMAP step at the end", True, None),
+    ("Remove step 2?", True, None),
+])
+def test_rule_route(prompt, has_plan, route):
+    assert rule_route(prompt, has_plan) == route
@@ -0,0 +1,46 @@
+import os
+import gzip
+import time
+import logging
+
+import pytest
+
+from workflow_utils.structured_logging import (RotatingLogFileHandler, parse_levels, payload_path, prune_payloads,
+                                               read_payload, store_payload)
+
+
+def test_parse_levels():
+    assert parse_levels("INFO,code_checker=WARNING, code_generator_agent=debug") == \
+        (logging.INFO, {"code_checker": logging.WARNING, "code_generator_agent": logging.DEBUG})
+    assert parse_levels("") == (logging.INFO, {})
+    with pytest.raises(ValueError):
+        parse_levels("code_checker=LOUD")
+
+
+def test_prune_payloads_keeps_referenced_ones(tmp_path):
+    kept = store_payload(str(tmp_path), "kept " * 1000)
+    dropped = store_payload(str(tmp_path), "dropped " * 1000)
+    with gzip.open(tmp_path / "scagent_log_1.jsonl.1.gz", "wt") as f:
+        f.write(f'{{"message": "messages: [payload {kept}, 5000 chars]"}}\n')
+
+    # Fresh payloads may belong to a record still in the queue
+    assert prune_payloads(str(tmp_path)) == 0
+    assert prune_payloads(str(tmp_path), grace_seconds=0) == 1
+    assert read_payload(str(tmp_path), kept) is not None
+    assert read_payload(str(tmp_path), dropped) is None
+
+
+def test_rollover_prunes_payloads_of_deleted_backups(tmp_path):
+    handler = RotatingLogFileHandler(str(tmp_path / "scagent_log.jsonl"), max_bytes=0, rotate_seconds=0, backups=1)
+    old = store_payload(str(tmp_path), "old " * 1000)
+    new = store_payload(str(tmp_path), "new " * 1000)
+    handler.stream.write(f"[payload {old}, 4000 chars]\n")
+    handler.doRollover()
+    handler.stream.write(f"[payload {new}, 4000 chars]\n")
+    for digest in (old, new):
+        os.utime(payload_path(str(tmp_path), digest), (time.time() - 7200,) * 2)
+    handler.doRollover()   # the backup referencing the old payload is overwritten
+    handler.close()
+
+    assert not (tmp_path / "payloads" / f"{old}.gz").exists()
+    assert read_payload(str(tmp_path), new) is not None
@@ -0,0 +1,17 @@
+from workflow_utils.tracing import node_breakdown
+
+
+def test_node_breakdown():
+    records = [
+        {"kind": "node", "node": "code_generator_agent", "duration": 3.0},
+        {"kind": "llm", "node": "code_generator_agent", "duration": 2.0, "prompt_tokens": 100, "completion_tokens": 20, "cost": 0.01},
+        {"kind": "node", "node": "code_checker", "duration": 5.0, "outcome": "error"},
+        {"kind": "exec", "node": "code_checker", "duration": 4.5, "peak_rss_mb": 300.0},
+        {"kind": "exec", "node": "code_checker", "duration": 0.0, "peak_rss_mb": 120.0},
+    ]
+    checker, generator = node_breakdown(records)
+    assert checker["node"] == "code_checker"
+    assert (checker["runs"], checker["exec_seconds"], checker["peak_rss_mb"], checker["errors"]) == (1, 4.5, 300.0, 1)
+    assert checker["other_seconds"] == 0.5
+    assert (generator["llm_calls"], generator["prompt_tokens"], generator["completion_tokens"]) == (1, 100, 20)
+    assert generator["other_seconds"] == 1.0
@@ -1,6 +1,7 @@
 from .agent_nodes import frontdesk_node, planner_node, tool_selector_node_one, tool_selector_node_two, code_generator_node, reflect_node, replan_node, reporter_node, plan_editor_node, conductor_node
 from .core_nodes import get_next_task, update_task_index, code_check
 from .conditional_nodes import should_continue, decide_to_finish, conductor_router
+from .parallel_nodes import make_parallel_runner
 
 __all__ = [
     "frontdesk_node", 
@@ -18,5 +19,6 @@ __all__ = [
     "decide_to_finish", 
     "plan_editor_node",
     "conductor_router",
-    "conductor_node"
+    "conductor_node",
+    "make_parallel_runner"
 ]
\ No newline at end of file
@@ -2,11 +2,59 @@ import logging
 from typing import List
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_openai import ChatOpenAI
-from agent_types import AgentState, Plan, SelectedTool, Code, Reflection, PlanEditor
+from agent_types import AgentState, Plan, SelectedTool, StepTools, Code, Reflection, PlanEditor
 from .core_nodes import tool_doc_retrieval
+from workflow_utils import uses_persistent_namespace, RESULTS_DIR, pre_route, record_decision, router_stats
+from workflow_utils import make_chat_model, LLM_CACHE_CODEGEN
+from workflow_utils import format_output_records, count_tokens, CODEGEN_OUTPUT_TOKENS, REPORT_OUTPUT_TOKENS
+from workflow_utils import compact_history, HISTORY_SUMMARY_TOKENS, emit_progress, dedupe_messages
+from workflow_utils import dependencies_from_plan, dual_node, Blocking
+from workflow_utils import probe_inputs, describe_dataset, is_large_data, data_context
 
 # Define System Prompts for all LLM Agents & Agent Node Function
+# ==================== History Summarizer ====================
+history_summarizer_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            """
+            You maintain a running summary of a conversation between a user and SCAgent, a single-cell analysis assistant.
+            Update the existing summary with the new messages. Keep what later routing and replies depend on:
+            the user's goals, the input files, the current plan and any edits to it, which analyses were run and their key results.
+            Drop greetings and small talk. Write at most {max_words} words of plain text.
+            """
+        ),
+        ("user", "Existing summary:\n{summary}\n\nNew messages:\n{new_messages}"),
+    ]
+)
+# Tagged "nostream" so its tokens never show up in the streamed chat reply
+history_summarizer_agent = (history_summarizer_prompt | make_chat_model(model="gpt-4o-mini", temperature=0)).with_config(tags=["nostream"])
+
+def summarize_history(summary: str, new_messages: str) -> str:
+    result = history_summarizer_agent.invoke({
+        "summary": summary or "None",
+        "new_messages": new_messages,
+        "max_words": HISTORY_SUMMARY_TOKENS * 2 // 3,
+    })
+    return result.content.strip()
+
+def history_for(state: AgentState, agent: str):
+    """Token-budgeted conversation history for `agent`, plus the summary update to store in state."""
+    return compact_history(
+        state.get("conversation_history"),
+        agent,
+        state.get("history_summary"),
+        state.get("history_summary_covered"),
+        summarize_history,
+    )
+
+def log_prompt_tokens(agent: str, prompt, inputs: dict, result=None):
+    """Log (and stream to the UI) the prompt size of one LLM call, estimated locally and as billed."""
+    estimated = sum(count_tokens(m.content) for m in prompt.format_messages(**inputs))
+    usage = getattr(result, "usage_metadata", None) or {}
+    logging.info(f"Prompt tokens ({agent}): {estimated} estimated, {usage.get('input_tokens', 'n/a')} billed")
+    emit_progress({"type": "prompt_tokens", "agent": agent, "tokens": estimated, "billed": usage.get("input_tokens")})
+
 # ==================== Conductor Agent ====================
 conductor_prompt = ChatPromptTemplate.from_messages(
     [
@@ -49,23 +97,38 @@ conductor_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-conductor_agent = conductor_prompt | ChatOpenAI(model = "gpt-4o-mini", temperature = 0)
+conductor_agent = conductor_prompt | make_chat_model(model = "gpt-4o-mini", temperature = 0)
 
+@dual_node
 def conductor_node(state: AgentState):
     logging.info("---Initiate Conductor Agent---")
     print("---Initiate Conductor Agent---")
     
     user_prompt = state["user_prompt"]
-    conversation_history = state.get("conversation_history","No History")
+    has_plan = bool(state.get("plan"))
     logging.info(f"user_prompt: {user_prompt}")
     
-    conductor_result = conductor_agent.invoke({"user_prompt":user_prompt,"conversation_history":conversation_history})
+    # Trivially classifiable messages are routed locally without an LLM call
+    pre_routed = pre_route(user_prompt, has_plan)
+    if pre_routed:
+        print(f"conductor_result (pre-router): {pre_routed}")
+        return {"conductor_status": pre_routed}
+    
+    # Recent turns verbatim, older ones summarized, within the conductor's token budget
+    conversation_history, history_update = yield Blocking(history_for, state, "conductor")
+    conductor_inputs = {"user_prompt":user_prompt,"conversation_history":conversation_history}
+    conductor_result = yield conductor_agent, conductor_inputs
+    log_prompt_tokens("conductor", conductor_prompt, conductor_inputs, conductor_result)
     
     conductor_content = conductor_result.content
     logging.info(f"conductor_result:\n{conductor_content}")
     print(f"conductor_result: {conductor_content}")
     
-    return {"conductor_status": conductor_content}
+    # Every LLM decision becomes training data for the pre-router
+    record_decision(user_prompt, has_plan, conductor_content.strip())
+    logging.info(f"Pre-router stats: {router_stats()}")
+    
+    return {"conductor_status": conductor_content, **history_update}
 
 # ==================== FrontDesk Agent ====================
 
@@ -86,22 +149,25 @@ frontdesk_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-frontdesk_agent = frontdesk_prompt | ChatOpenAI(model="gpt-4o-mini", temperature=0)
+frontdesk_agent = frontdesk_prompt | make_chat_model(model="gpt-4o-mini", temperature=0)
 
+@dual_node
 def frontdesk_node(state: AgentState):
     logging.info("---Initiate FrontDesk Agent---")
     print("---Initiate FrontDesk Agent---")
     user_prompt = state["user_prompt"]
-    conversation_history = state["conversation_history"]
+    conversation_history, history_update = yield Blocking(history_for, state, "frontdesk")
     
     # Invoke the front desk LLM with current message history
-    frontdesk_result = frontdesk_agent.invoke({"user_prompt": user_prompt, "conversation_history":conversation_history})
+    frontdesk_inputs = {"user_prompt": user_prompt, "conversation_history":conversation_history}
+    frontdesk_result = yield frontdesk_agent, frontdesk_inputs
+    log_prompt_tokens("frontdesk", frontdesk_prompt, frontdesk_inputs, frontdesk_result)
     
     frontdesk_content = frontdesk_result.content
     logging.info(f"frontdesk_content:\n{frontdesk_content}")
     print(f"frontdesk_content: {frontdesk_content}")
     
-    return {"conversation_history": frontdesk_result}
+    return {"conversation_history": frontdesk_result, **history_update}
 
 # ==================== Plan Editor Agent ====================
 plan_editor_prompt = ChatPromptTemplate.from_messages(
@@ -119,8 +185,9 @@ plan_editor_prompt = ChatPromptTemplate.from_messages(
         ("user","Here is user feedback: {user_prompt}"),
     ]
 )
-plan_editor_agent = plan_editor_prompt | ChatOpenAI(model = "gpt-4.1-mini", temperature = 0).with_structured_output(PlanEditor)
+plan_editor_agent = plan_editor_prompt | make_chat_model(model = "gpt-4.1-mini", temperature = 0).with_structured_output(PlanEditor)
 
+@dual_node
 def plan_editor_node(state:AgentState):
     
     print("---Initiate Plan Editor Agent---")
@@ -132,7 +199,7 @@ def plan_editor_node(state:AgentState):
     if not plan:
         raise ValueError(f"Plan list is empty!")
     elif plan:
-        plan_editor_result = plan_editor_agent.invoke({"plan":plan, "user_prompt":user_prompt})
+        plan_editor_result = yield plan_editor_agent, {"plan":plan, "user_prompt":user_prompt}
         edited_plan = plan_editor_result.edited_plan
         print(f"edited_plan:\n{edited_plan}")
         logging.info(f"edited_plan:\n{edited_plan}")
@@ -167,9 +234,15 @@ planner_prompt = ChatPromptTemplate.from_messages(
            - Each **value** is a short human-readable description of what that file contains
          - If no file is mentioned, set `input_file_path` to `null`.
          
+         **Step Dependencies:**
+         - For each subtask, list in `depends_on` the numbers (1-based) of the earlier subtasks whose outputs it needs, e.g. a plot of the clusters depends on the clustering subtask.
+         - Use [] for a subtask that only needs the input files. Subtasks that do not depend on each other (e.g. several plots, or two annotation tools compared side by side) can run at the same time.
+         - Only list real data dependencies; when unsure, depend on the previous subtask.
+         
          **Output Format:**
          Return:
          - A clearly ordered list of subtasks in the workflow.
+         - The `depends_on` list, with one entry per subtask in the same order.
          - A correctly structured `input_file_path` dictionary as defined above.         
          """
         ), 
@@ -177,7 +250,8 @@ planner_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-planner_agent = planner_prompt | ChatOpenAI(model="gpt-4.1", temperature=0).with_structured_output(Plan)
+planner_agent = planner_prompt | make_chat_model(model="gpt-4.1", temperature=0).with_structured_output(Plan)
+@dual_node
 def planner_node(state: AgentState):
     print("---Initiate Planner Agent---")
     logging.info("---Initiate Planner Agent---")
@@ -187,22 +261,33 @@ def planner_node(state: AgentState):
     logging.info(f"selected_tool: {selected_tool}")
     
     if selected_tool[0] != "None":
-        tool_context = tool_doc_retrieval(selected_tool)
+        tool_context = tool_doc_retrieval(selected_tool, query=user_prompt)
     else: 
         tool_context = ""
          
-    planner_result = planner_agent.invoke({"user_prompt": user_prompt, "selected_tool":selected_tool, "tool_context":tool_context})
+    planner_result = yield planner_agent, {"user_prompt": user_prompt, "selected_tool":selected_tool, "tool_context":tool_context}
     generated_plans = planner_result.steps
     input_file_path = planner_result.input_file_path
+    step_dependencies = dependencies_from_plan(generated_plans, planner_result.depends_on)
     print(f"planner result: {generated_plans}")
     logging.info(f"planner result:\n{generated_plans}")
+    logging.info(f"step dependencies: {planner_result.depends_on}")
     print(f"extracted input_file_path: {input_file_path}")
     logging.info(f"extracted input_file_path: {input_file_path}")
+    # Probe the input sizes up front (cached), so code generation knows them before any code runs.
+    # Reading HDF5 layouts is file I/O: off the event loop in the async graph
+    datasets = yield Blocking(probe_inputs, input_file_path)
+    for info in datasets:
+        logging.info(f"input dataset: {describe_dataset(info)}")
+    if is_large_data(datasets):
+        print("Input data exceeds the memory threshold, code generation uses the large-data mode")
+        logging.info("Input data exceeds the memory threshold, code generation uses the large-data mode")
     
     formatted_steps = "\n".join([f"{idx+1}. {step}" for idx, step in enumerate(generated_plans)])
     all_plans_message = AIMessage(content=f"Here is the planned sequence of tasks. Let me know if you need any changes:\n\n{formatted_steps}")
     logging.info(f"all_plans_message:\n{all_plans_message.content}")
-    return {"plan": generated_plans, "conversation_history": all_plans_message, "input_file_path": input_file_path}
+    return {"plan": generated_plans, "conversation_history": all_plans_message, "input_file_path": input_file_path,
+            "step_dependencies": step_dependencies}
 
 
 # ==================== Tool Selector Agent ====================
@@ -220,32 +305,77 @@ tool_selector_prompt = ChatPromptTemplate.from_messages(
         ), ("user", "{current_task}"),
     ]
 )
-tool_selector_agent = tool_selector_prompt | ChatOpenAI(model="gpt-4o-mini", temperature=0).with_structured_output(SelectedTool)
+tool_selector_agent = tool_selector_prompt | make_chat_model(model="gpt-4o-mini", temperature=0).with_structured_output(SelectedTool)
+
+plan_tool_selector_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system",
+         """
+         You are a Tool Selector Agent specializing in bioinformatics and single-cell RNA-seq analysis.
+         For each listed step of the analysis plan, select the single most relevant tool from the provided list, or "None" if no tool is suitable.
+         Return exactly one tool name per listed step, in the same order as the listed steps.
+         Do **not** create new tools or hallucinate capabilities not in the provided list.
 
+         Available Tool List: {tools_dict}
+         Overall plan: {plan}
+         """
+        ), ("user", "Select a tool for each of these steps:\n{steps}"),
+    ]
+)
+plan_tool_selector_agent = plan_tool_selector_prompt | make_chat_model(model="gpt-4o-mini", temperature=0).with_structured_output(StepTools)
+
+def tool_selection_steps(plan: List[str], steps: List[str], tool_dictionary: dict):
+    """Choose a tool for several plan steps with a single LLM call; returns {step: tool name or "None"}."""
+    steps_formatted = "\n".join(f"{idx+1}. {step}" for idx, step in enumerate(steps))
+    result = yield plan_tool_selector_agent, {"plan": plan, "steps": steps_formatted, "tools_dict": tool_dictionary}
+    if len(result.tools) != len(steps):
+        # Misaligned answer: fall back to one call per step (concurrent in the async graph) rather than guessing the mapping
+        logging.warning(f"Tool selector returned {len(result.tools)} tools for {len(steps)} steps, selecting per step")
+        requests = []
+        for step in steps:
+            task_formatted = f"""
+    This the list for overall plan: {plan} \n
+    You are tasked with selecting tool for this step:{step}.
+    """
+            requests.append((tool_selector_agent, {"current_task": task_formatted, "tools_dict": tool_dictionary}))
+        tools = [selection.tools[0] for selection in (yield requests)]
+    else:
+        tools = result.tools
+    # Only tools that actually exist can be used
+    return {step: tool if tool in tool_dictionary else "None" for step, tool in zip(steps, tools)}
+
+select_tools_for_steps = dual_node(tool_selection_steps)
+
+@dual_node
 def tool_selector_node_one(state: AgentState):
     print("---Initiate Tool Selector Agent---")
     logging.info("---Initiate Tool Selector Agent---")
     current_subtask = state["current_task"]
     tool_dictionary = state["available_tools"]
+    plan = state["plan"]
     
     print(f"current task: {current_subtask}")
     logging.info(f"current task: {current_subtask}")
 
-    task_formatted = f"""
-    This the list for overall plan: {state["plan"]} \n
-    You are tasked with selecting tool for this step:{current_subtask}.
-    """
-    tool_selector_result = tool_selector_agent.invoke({"current_task": task_formatted,"tools_dict": tool_dictionary})
-    if tool_selector_result.tools[0] != "None":
-        selected_tool_result = tool_selector_result.tools[0] # Only one tool is selected
+    # Tools are selected for the whole plan at once; only new or changed steps (plan editor, replanner) are selected again
+    step_tools = {step: tool for step, tool in (state.get("step_tools") or {}).items() if step in plan or step == current_subtask}
+    missing_steps = [step for step in dict.fromkeys(plan + [current_subtask]) if step not in step_tools]
+    if missing_steps:
+        logging.info(f"Selecting tools for {len(missing_steps)} plan step(s) in one call")
+        step_tools.update((yield from tool_selection_steps(plan, missing_steps, tool_dictionary)))
+        logging.info(f"Tools per step: {step_tools}")
+    
+    if step_tools[current_subtask] != "None":
+        selected_tool_result = step_tools[current_subtask] # Only one tool is selected
         logging.info(f"Tool selector result: {selected_tool_result}\n")
         print(f"Tool selector result: {selected_tool_result}\n")
     else:
         selected_tool_result = ["None"]
         print("Tool selector did not select any tool.\n")
         logging.info("Tool selector did not select any tool.\n")
-    return {"selected_tool": selected_tool_result}
+    return {"selected_tool": selected_tool_result, "step_tools": step_tools}
 
+@dual_node
 def tool_selector_node_two(state: AgentState):
     print("---Initiate Tool Selector Agent---")
     logging.info("---Initiate Tool Selector Agent---")
@@ -258,7 +388,7 @@ def tool_selector_node_two(state: AgentState):
     print(f"current task: {current_subtask}")
     logging.info(f"current task: {current_subtask}")
 
-    tool_selector_result = tool_selector_agent.invoke({"current_task": task_formatted,"tools_dict": tool_dictionary})
+    tool_selector_result = yield tool_selector_agent, {"current_task": task_formatted,"tools_dict": tool_dictionary}
     if tool_selector_result.tools[0] != "None":
         selected_tool_result = tool_selector_result.tools[0] # Only one tool is selected
         logging.info(f"Tool selector result: {selected_tool_result}\n")
@@ -276,20 +406,25 @@ code_gen_prompt = ChatPromptTemplate.from_messages(
             "system",
             """
             You are a Python code generation agent specialized in single-cell RNA-seq using Scanpy.
-            Generate a **self-contained**, **immediately executable** code block for a single task in the workflow.
+            Generate an **immediately executable** code block for a single task in the workflow.
+            {execution_context}
+
+            {data_context}
 
             ### Inputs:
             - `selected_tool`: Tool to use for the task (fallback to Scanpy if not given).
             - `tool_context`: Tool-specific parameters/instructions.
             - `code`: Newly generated Python code that contain errors.
-            - `output_messages`: Accumulated code output messages from previous successful tasks. 
+            - `output_messages`: Summary of the output of previous successful tasks (saved files, shapes, key results), most recent in the most detail. 
             - `current_task`: Task to implement.
             - `input_file_path`: input data file for the *entire workflow*.
+            - `results_dir`: Absolute path of the directory where all outputs must be saved.
+            - `live_variables`: Variables already loaded in the running Python session, with a short description of each.
 
             ### Guidelines:
             1. Implement **only** the current task — no placeholders, no mixing unrelated logic.
             2. Use the selected tool if provided; otherwise follow standard Scanpy best practices.
-            3. Save outputs to `<base_dir>/../results/`, creating the directory if needed.
+            3. Save outputs to the absolute directory given in `results_dir`, creating it if needed. The code runs in a temporary working directory, so never save outputs relative to the script location.
             4. Use `try-except` for file I/O. Use `sys.exit(1)` for critical failures.
             5. **Print informative messages** at each major step:
                 - What step is being run.
@@ -308,13 +443,21 @@ code_gen_prompt = ChatPromptTemplate.from_messages(
             """
         ),
         ("placeholder", "{messages}"),
-        ("user", "Code context:\n\n{code}\n\n- selected_tool: {selected_tool}\n- output_messages: {output_messages}\n- tool_context: {tool_context}\n- input_file_path: {input_file_path}\n\nGenerate the Python code block for the current task: {current_task}"),
+        ("user", "Code context:\n\n{code}\n\n- selected_tool: {selected_tool}\n- output_messages: {output_messages}\n- tool_context: {tool_context}\n- input_file_path: {input_file_path}\n- results_dir: {results_dir}\n- live_variables: {live_variables}\n\nGenerate the Python code block for the current task: {current_task}"),
     ]
 )
 # 5. Use variables from prior code (e.g., `adata`) but dont redefine them unnecessarily.
 
-code_gen_agent = code_gen_prompt | ChatOpenAI(temperature=1, model="gpt-4.1").with_structured_output(Code)
+code_gen_agent = code_gen_prompt | make_chat_model(temperature=1, model="gpt-4.1", cached=LLM_CACHE_CODEGEN).with_structured_output(Code)
 
+isolated_execution_context = "The block must be **self-contained**: it runs in a fresh Python namespace, so load every input it needs from disk."
+persistent_execution_context = (
+    "The block runs in a **persistent Python session**: the variables listed in `live_variables` are already in memory. "
+    "Reuse them directly (e.g. keep working on `adata`) instead of re-reading files from disk, and keep results needed by later steps in variables. "
+    "Only load from `input_file_path` when the data is not in `live_variables`, and only write files for outputs the task asks for."
+)
+
+@dual_node
 def code_generator_node(state: AgentState):
 
     print("---Initiate Code Generator Agent---")
@@ -322,14 +465,26 @@ def code_generator_node(state: AgentState):
     # State Access
     current_task = state["current_task"] # Access current task
     current_task_index = state["current_task_index"] # Access current task index
-    messages = state["messages"] # Access messages
+    messages = dedupe_messages(state["messages"]) # Access messages of the current task window
     input_file_path = state["input_file_path"]
     selected_tool = state["selected_tool"] # Access selected tool
     iterations = state["iterations"]  # Access iterations
     error: str | None = state["error"] # Access error  
-    stdout_output = state["stdout_output"]
+    # Previous steps' output, compacted to a token budget
+    output_messages = format_output_records(state.get("output_records"), CODEGEN_OUTPUT_TOKENS)
     prev_code = state["code_generation"] # Access previous generated code
     all_generated_code = state["all_generated_code"] # Access all generated code
+    live_variables = state.get("live_variables") or {}
+    
+    # Execution mode
+    if uses_persistent_namespace():
+        execution_context = persistent_execution_context
+        live_variables_text = "\n".join(f"  - {name}: {desc}" for name, desc in live_variables.items()) or "None"
+    else:
+        execution_context = isolated_execution_context
+        live_variables_text = "None (isolated execution)"
+    # Size of the inputs, with the large-data guidance when they do not fit in memory
+    data_size_context = yield Blocking(data_context, input_file_path)
     
     # Conversion
     if prev_code != "" and hasattr(prev_code, "imports") and hasattr(prev_code, "code"):
@@ -345,9 +500,10 @@ def code_generator_node(state: AgentState):
     #     generated_code = f"No error"
     #     # all_code = f"This previous code block contains no error and is for context only:\n{all_generated_code}\n"
 
-    # tool documentation
+    # tool documentation: only the sections relevant to the task (and to the last error on a retry)
     if selected_tool[0] != "None":
-        tool_docs = tool_doc_retrieval(selected_tool)
+        doc_query = current_task + ("\n" + str(messages[-1].content) if error == "yes" and messages else "")
+        tool_docs = tool_doc_retrieval(selected_tool, query=doc_query)
     else: 
         tool_docs = ""
     
@@ -357,11 +513,6 @@ def code_generator_node(state: AgentState):
     print(f"current iterations:\n\t{iterations}")
     print(f"error:\n\t{error}")
     print(f"input_file_path:\n\t{input_file_path}")
-    print(f"messages:\n\t{messages}")
-    print("\n"+"="*80+"\n")
-    print(f"previous code:\n\t{prev_code}") #If this print nothing,it means no error was occur for current task.
-    print("\n"+"="*80+"\n")
-    print(f"output_messages:\n\n{stdout_output}")
     print(f"Retrieved Tool Docs\n\t{tool_docs[:90]}")
     logging.info(f"current task: {current_task}")
     logging.info(f"current task index: {current_task_index}")
@@ -369,20 +520,22 @@ def code_generator_node(state: AgentState):
     logging.info(f"current iterations: {iterations}")
     logging.info(f"error: {error}")
     logging.info(f"input_file_path: {input_file_path}")
+    logging.info(f"live_variables: {list(live_variables)}")
     logging.info(f"Retrieved Tool Docs\n\n{tool_docs[:90]}")
     logging.info("\n"+"="*80+"\n")
-    logging.info(f"messages:\n\n{messages}")
-    logging.info(f"output_messages:\n\n{stdout_output}")
+    # The full message list grows with every retry; logged at DEBUG only (SCAGENT_LOG_LEVELS)
+    logging.debug(f"messages:\n\n{messages}")
+    logging.info(f"output_messages ({count_tokens(output_messages)} tokens):\n\n{output_messages}")
     logging.info("\n"+"="*80+"\n")
     # logging.info(f"code with error:\n\n{generated_code}")
     logging.info("\n"+"="*80+"\n")
         
-    # We have been routed back to generation with an error
+    # We have been routed back to generation with an error (prompt only, so it is not stored once per retry)
     if error == "yes":
-        messages += [HumanMessage(content="The previous attempt failed. Please review the error and suggestions, then try generating the code again.")]    
+        messages = messages + [HumanMessage(content="The previous attempt failed. Please review the error and suggestions, then try generating the code again.")]
  
     # Invoke LLM
-    code_solution= code_gen_agent.invoke(
+    code_solution = yield code_gen_agent, (
         {
             "messages": messages,
             "current_task": current_task,
@@ -390,21 +543,22 @@ def code_generator_node(state: AgentState):
             "input_file_path": input_file_path, 
             "selected_tool": selected_tool, 
             "code":prev_code,
-            "output_messages": stdout_output,
+            "output_messages": output_messages,
+            "execution_context": execution_context,
+            "data_context": data_size_context,
+            "live_variables": live_variables_text,
+            "results_dir": state.get("results_dir") or RESULTS_DIR,
          }
     )
 
     # Increment
     new_iterations: int = iterations + 1
-    print("\n"+"="*80+"\n")
-    print(f"my current prexif:\n\n{code_solution.prefix}\n\nmy final code:\n\n{code_solution.code}\n\nmy final imports:\n\n{code_solution.imports}")
-    print("\n"+"="*80+"\n")
     print(f"iterations after invoke:\n\t{new_iterations}")
     logging.info("\n"+"="*80+"\n")
     logging.info(f"my current prexif:\n\n{code_solution.prefix}\n\nmy final code:\n\n{code_solution.code}\n\nmy final imports:\n\n{code_solution.imports}")
     logging.info("\n"+"="*80+"\n")
     logging.info(f"iterations after invoke:\n\t{new_iterations}")
-    return {"messages": messages, "code_generation": code_solution, "iterations": new_iterations}   
+    return {"code_generation": code_solution, "iterations": new_iterations}   
 
 # ==================== Reflection Agent ====================
 code_reflection_prompt = ChatPromptTemplate.from_messages(
@@ -438,7 +592,8 @@ code_reflection_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-reflection_agent = code_reflection_prompt | ChatOpenAI(temperature=0, model="gpt-4.1").with_structured_output(Reflection)  
+reflection_agent = code_reflection_prompt | make_chat_model(temperature=0, model="gpt-4.1").with_structured_output(Reflection)  
+@dual_node
 def reflect_node(state: AgentState):
     """
     Reflect on errors and suggest improvements.
@@ -448,7 +603,7 @@ def reflect_node(state: AgentState):
     logging.info("---Initiate Reflect Agent---")
 
     # State
-    messages = state["messages"]
+    messages = dedupe_messages(state["messages"])
     error_code = state["code_generation"]    
     previous_code = state["all_generated_code"]
     selected_tool = state["selected_tool"] 
@@ -458,15 +613,16 @@ def reflect_node(state: AgentState):
     if replan_triggered == True and iterations == 5:
         raise RuntimeError("Repeated Error occur even after Replan. Kindly identify root problem.")
     else:
-        # tool documentation
+        # tool documentation relevant to the task and its error
         if selected_tool[0] != "None":
-            tool_docs = tool_doc_retrieval(selected_tool)
+            doc_query = state["current_task"] + ("\n" + str(messages[-1].content) if messages else "")
+            tool_docs = tool_doc_retrieval(selected_tool, query=doc_query)
         else: 
             tool_docs = ""
         
         # Prompt reflection
         # Add reflection
-        reflections_result = reflection_agent.invoke(
+        reflections_result = yield reflection_agent, (
             {
                 "messages": messages, 
                 "error_code": error_code,
@@ -507,7 +663,8 @@ replanner_prompt = ChatPromptTemplate.from_messages(
         )
     ]
 ) 
-replan_agent = replanner_prompt | ChatOpenAI(temperature=0, model="gpt-4.1-mini")
+replan_agent = replanner_prompt | make_chat_model(temperature=0, model="gpt-4.1-mini")
+@dual_node
 def replan_node(state: AgentState):
     """
     Generate a revised task based on the error and suggestions.
@@ -516,13 +673,13 @@ def replan_node(state: AgentState):
     logging.info("---Initiate Replan Agent---")
 
     # State
-    messages = state["messages"]
+    messages = dedupe_messages(state["messages"])
     current_task = state["current_task"]
     plan_list = state["plan"]
     current_task_index = state["current_task_index"]
 
     # Prompt replan
-    replan_result = replan_agent.invoke(
+    replan_result = yield replan_agent, (
         {
             "messages": messages, 
             "current_task": current_task,
@@ -531,7 +688,7 @@ def replan_node(state: AgentState):
     )
     revised_task = replan_result.content
     plan_list[current_task_index] = revised_task
-    replan_message = AIMessage(content=f"Here is the revised task: {revised_task} from this original task: {current_task}")
+    replan_message = AIMessage(content=f"Here is the revised task: {revised_task} from this original task: {current_task}", name="replan")
     print(f"New revised task:\n\t{revised_task}")
     logging.info(f"replan_message:\n\n{replan_message.content}")
     return {"replan_triggered": True, "plan": plan_list, "current_task": revised_task, "messages": replan_message}
@@ -564,18 +721,20 @@ reporter_prompt = ChatPromptTemplate.from_messages(
         )
     ]
 )
-reporter_agent = reporter_prompt | ChatOpenAI(temperature=0, model="gpt-4o-mini")
+reporter_agent = reporter_prompt | make_chat_model(temperature=0, model="gpt-4o-mini")
+@dual_node
 def reporter_node(state: AgentState):
     
     compiled_messages = state["messages"]
     all_generated_code = state["all_generated_code"]
-    all_stdout = state["stdout_output"]
+    # Per-step output records instead of the full stdout, within the reporter's token budget
+    final_output_message = format_output_records(state.get("output_records"), REPORT_OUTPUT_TOKENS)
     
-    logging.info(f"Compiled messages:\n\n{compiled_messages}")
+    logging.debug(f"Compiled messages:\n\n{compiled_messages}")
     logging.info(f"all generated code:\n\n{all_generated_code}")
-    logging.info(f"all_stdout:\n\n{all_stdout}")
+    logging.info(f"final_output_message ({count_tokens(final_output_message)} tokens):\n\n{final_output_message}")
 
-    report_result = reporter_agent.invoke({"final_output_message": all_stdout})
+    report_result = yield reporter_agent, {"final_output_message": final_output_message}
     
     summary_content = report_result.content
     print(f"Here is your Report of your output:\n\n{summary_content}\n\n")
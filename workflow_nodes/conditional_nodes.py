@@ -1,4 +1,5 @@
 from agent_types import AgentState
+from workflow_utils import emit_progress, runs_in_parallel
 import logging
 
 
@@ -18,6 +19,9 @@ def conductor_router(state:AgentState):
     elif conductor_status == "plan_editor_agent":
         logging.info("Route to plan_editor_agent")
         return "plan_editor_agent"
+    elif conductor_status == "analysis_agent" and generated_plan and runs_in_parallel(generated_plan, state.get("step_dependencies")):
+        logging.info("Route to parallel analysis (independent steps run side by side)")
+        return "parallel_analysis_agent"
     elif conductor_status == "analysis_agent" and generated_plan:
         logging.info("Route to analysis_agent")
         return "analysis_agent"
@@ -40,6 +44,8 @@ def should_continue(state: AgentState):
 def decide_to_finish(state: AgentState):
     """
     Determines whether to end code generation loop, or Reflect, or Replan.
+    Code rejected by the pre-flight check goes straight back to the generator: its error is already precise.
+    Code patched for a known error is checked again directly, without any LLM call.
     """
     logging.info("---Initiate decide_to_finish CONDITIONAL NODE---")
     error = state["error"]
@@ -48,11 +54,19 @@ def decide_to_finish(state: AgentState):
 
     if error == "no":
         logging.info("---DECISION: FINISH!!!---")
-        return "end"
+        decision = "end"
+    elif state.get("patched_retry"):
+        logging.info("---DECISION: RE-CHECK (deterministic fix)---")
+        decision = "recheck"
     elif iterations >= max_iterations:
         logging.info("---DECISION: RE-PLAN---")
-        return "replan"
+        decision = "replan"
+    elif state.get("preflight_failed"):
+        logging.info("---DECISION: REGENERATE (pre-flight)---")
+        decision = "regenerate"
     else:
         logging.info("---DECISION: RE-TRY SOLUTION---")
-        return "reflect"
+        decision = "reflect"
+    emit_progress({"type": "decision", "decision": decision, "iterations": iterations})
+    return decision
 
@@ -1,9 +1,14 @@
 import os
 import logging
-import shutil
 import subprocess
-from langchain_core.messages import HumanMessage, AIMessage
-from agent_types import AgentState
+from langchain_core.messages import HumanMessage, AIMessage, RemoveMessage
+from agent_types import AgentState, Code
+from workflow_utils import run_code, run_code_cached, arun_code, arun_code_cached, reset_namespace, uses_persistent_namespace, RESULT_CACHE_ENABLED
+from workflow_utils import create_attempt_sandbox, release_sandbox, emit_progress, FATAL_PATTERNS, build_output_record
+from workflow_utils import format_execution_error, task_digest, get_tool_doc_index, TOOL_DOC_TOKENS
+from workflow_utils import preflight_check, preflight_stats, PREFLIGHT_ENABLED
+from workflow_utils import dual_node, Blocking
+from workflow_utils import error_signature, apply_patches, lookup_fix, record_fix, record_task_outcome, iteration_stats
 
 # This node is responsible to assign current task for current loop.
 def get_next_task(state: AgentState):
@@ -26,23 +31,36 @@ def get_next_task(state: AgentState):
             
             # First loop - append the plan list message and new task message
             if not state.get("messages") and current_task_index < len(plan_list):
-                plan_list_message = HumanMessage(content=f"Here are the list of tasks to be achieved: {plan_list}")
+                plan_list_message = HumanMessage(content=task_digest(plan_list, current_task_index))
+                # A new analysis run starts from a clean live namespace.
+                if uses_persistent_namespace():
+                    reset_namespace(state.get("session_id") or "default")
                 return {
                     "current_task": current_task,
                     "messages": [plan_list_message, new_message],
                     "iterations": 0,
                     "code_generation": "",
                     "error": "no",
+                    "live_variables": {},
+                    "output_records": [],
+                    "fix_context": {},
                 }
             
             # Subsequent loop reset everything after success/replan of one task.
             elif current_task_index < len(plan_list):
+                # Start a new message window: earlier tasks' attempts are replaced by a short digest.
+                # After a replan the same task is retried, so the replanner's note is kept.
+                retrying_task = state.get("current_task") == current_task
+                removed = [RemoveMessage(id=m.id) for m in state["messages"]
+                           if m.id and not (retrying_task and m.name == "replan")]
+                digest_message = HumanMessage(content=task_digest(plan_list, current_task_index, state.get("completed_steps")))
                 return {
                     "current_task": current_task,
-                    "messages": [new_message],
+                    "messages": removed + [digest_message, new_message],
                     "iterations": 0,
                     "code_generation": "",
-                    "error": "no"  
+                    "error": "no",
+                    "fix_context": {},
                 }
         else:
             raise IndexError(f"Current task index {current_task_index} is out of bounds for the plan list.")
@@ -57,6 +75,7 @@ def update_task_index(state: AgentState):
     return {"current_task_index": state["current_task_index"] + 1, "iterations": 0}
 
 # This node is responsible to check the code. It proceed to next task if correct, else return to the code generation step.
+@dual_node
 def code_check(state: AgentState):
     """
     Check code        
@@ -69,30 +88,87 @@ def code_check(state: AgentState):
     current_task = state["current_task"]
     current_task_index = state["current_task_index"]
     std_output_all = state.get("stdout_output","")
+    session_id = state.get("session_id") or "default"
+    live_variables = state.get("live_variables") or {}
+    persistent = uses_persistent_namespace()
+    result = None
     imports = code_solution.imports
     code_block = code_solution.code
+    iterations = state.get("iterations") or 0
+
+    # Static pre-flight check: obvious errors go straight back to the code generator without executing anything
+    if PREFLIGHT_ENABLED:
+        known_names = live_variables if persistent else ()
+        issues = preflight_check(imports + "\n" + code_block, state.get("input_file_path"), known_names)
+        if issues:
+            print("---CODE BLOCK CHECK: FAILED (Pre-flight)---")
+            logging.error("---CODE BLOCK CHECK: FAILED (Pre-flight)---")
+            error_message = AIMessage(content="The code was not executed because a static check found these problems:\n" + "\n".join(issues))
+            logging.error(f"Error message:\n\n{error_message.content}")
+            logging.info(f"Pre-flight stats: {preflight_stats()}")
+            emit_progress({"type": "preflight", "task_index": current_task_index, "iteration": iterations, "issues": issues})
+            return {
+                "messages": [error_message],
+                "error": "yes",
+                "preflight_failed": True,
+                "patched_retry": False,
+                "live_variables": live_variables,
+            }
 
-    # Test run 
-    temp_dir = "temp_scripts"
-    os.makedirs(temp_dir, exist_ok=True)
+    # Test run in a unique sandbox directory for this session/task/attempt
+    temp_dir = create_attempt_sandbox(session_id, current_task_index, state.get("iterations") or 0)
     script_filename = "test_script.py"
     script_path = os.path.join(temp_dir, script_filename)
     
-    with open(script_path, "w") as f:
-        # f.write(all_generated_code + "\n" + imports + "\n" + code_block)
-        f.write(imports + "\n" + code_block)
+    # Repeated blocks on unchanged inputs are served from the result cache (isolated execution only)
+    use_cache = RESULT_CACHE_ENABLED and state.get("use_result_cache", True) is not False and not persistent
+    # Runs whose output shows a fatal error are stopped early unless disabled
+    fatal_patterns = FATAL_PATTERNS if state.get("early_kill", True) is not False else None
+    
+    # Stream execution output line by line to the UI (and to the logs at DEBUG)
+    def stream_output(stream_name, line):
+        logging.debug(f"[exec {stream_name}] {line.rstrip()}")
+        emit_progress({"type": "exec_output", "stream": stream_name, "line": line,
+                       "task_index": current_task_index, "iteration": iterations})
     
+    emit_progress({"type": "exec_start", "task": current_task, "task_index": current_task_index, "iteration": iterations})
     try:
-        result = subprocess.run(
-            ["python", script_filename],
-            cwd=temp_dir,  
-            capture_output=True,
-            text=True,
-            timeout=600,
-            check=True
-        )
+        # Runs in the session's warm kernel (or a fresh interpreter, see workflow_utils/executor.py)
+        if use_cache:
+            result = yield Blocking(
+                run_code_cached,
+                session_id,
+                imports + "\n" + code_block,
+                script_path=script_path,
+                cwd=temp_dir,
+                timeout=600,
+                input_file_path=state.get("input_file_path"),
+                on_output=stream_output,
+                fatal_patterns=fatal_patterns,
+                results_dir=state.get("results_dir"),
+                afn=arun_code_cached,
+            )
+        else:
+            result = yield Blocking(
+                run_code,
+                session_id,
+                imports + "\n" + code_block,
+                script_path=script_path,
+                cwd=temp_dir,
+                timeout=600,
+                on_output=stream_output,
+                fatal_patterns=fatal_patterns,
+                afn=arun_code,
+            )
+        emit_progress({"type": "exec_end", "task_index": current_task_index, "iteration": iterations,
+                       "returncode": result.returncode, "duration": result.duration,
+                       "backend": result.backend, "killed_reason": result.killed_reason,
+                       "peak_rss_mb": result.peak_rss_mb})
+        peak_memory = f", peak memory {result.peak_rss_mb:.0f} MB" if result.peak_rss_mb is not None else ""
+        logging.info(f"Code block executed in {result.duration:.2f}s ({result.backend}{peak_memory})")
+        result.check_returncode()
         
-        # If no error occurs in "subprocess.run", the code below will be executed.
+        # If no error occurs in "run_code", the code below will be executed.
         
         # Build message content from output
         output_msg = f"Code executed successfully for task '{current_task}'."
@@ -100,6 +176,9 @@ def code_check(state: AgentState):
         # Save the output message
         if result.stdout.strip():
             std_output_all += f"\n{result.stdout.strip()}\n"
+        # Structured record of this step, used for the compacted prompt context
+        output_records = list(state.get("output_records") or [])
+        output_records.append(build_output_record(current_task_index, current_task, result.stdout))
             
         print("---CODE BLOCK CHECK: SUCCESS---")
         logging.info("---CODE BLOCK CHECK: SUCCESS---")
@@ -109,11 +188,19 @@ def code_check(state: AgentState):
         logging.info(f"success message: {output_message.content}")
         # Update compiled code for next steps
         compile_generated_code = all_generated_code + f"\n#Next Task: {current_task}\n" + imports + "\n" + code_block
+        if persistent:
+            live_variables = result.variables
+            logging.info(f"live variables: {list(live_variables)}")
+        remember_fixes(state.get("fix_context") or {}, current_task, imports + "\n" + code_block, iterations)
         return {
             "messages": [output_message],
             "error": "no",
             "all_generated_code": compile_generated_code,
             "stdout_output": std_output_all,
+            "output_records": output_records,
+            "live_variables": live_variables,
+            "preflight_failed": False,
+            "patched_retry": False,
         }
             
     except subprocess.CalledProcessError as e:
@@ -125,13 +212,56 @@ def code_check(state: AgentState):
         logging.error(f"current task: {current_task}")
         logging.error(f"current task index: {state['current_task_index']}")
         
-        error_message = AIMessage(content=f"Code execution failed with error:\n\nStdout: {e.stdout.strip()}\n\nStderr: {e.stderr.strip()}")
+        # The full output is in the log; the message window only gets the relevant part
+        logging.error(f"Full stderr:\n\n{e.stderr.strip()}")
+        # Failed blocks are not committed, but a crashed kernel loses every live variable.
+        if persistent and result is not None:
+            live_variables = result.variables
+
+        # Known errors: apply a deterministic patch and re-check, or show the fix that worked before
+        signature = error_signature(e.stdout, e.stderr)
+        fix_context = dict(state.get("fix_context") or {})
+        fix_context["signatures"] = list(dict.fromkeys((fix_context.get("signatures") or []) + [signature]))
+        fix_context.setdefault("failed_code", imports + "\n" + code_block)
+        fix_context["failures"] = fix_context.get("failures", 0) + 1
+        logging.info(f"Error signature: {signature}")
+        patch = apply_patches(signature, imports, code_block, traceback=e.stderr)
+        if patch:
+            description, (patched_imports, patched_code) = patch
+            fix_context["patched"] = True
+            patch_message = AIMessage(content=f"Code execution failed with a known error ({signature}); applied the deterministic fix: {description}.")
+            print(f"---APPLIED DETERMINISTIC FIX: {description}---")
+            logging.info(patch_message.content)
+            emit_progress({"type": "known_fix", "task_index": current_task_index, "iteration": iterations,
+                           "signature": signature, "patch": description})
+            return {
+                "messages": [patch_message],
+                "error": "yes",
+                "code_generation": Code(prefix=code_solution.prefix, imports=patched_imports, code=patched_code),
+                "live_variables": live_variables,
+                "preflight_failed": False,
+                "patched_retry": True,
+                "fix_context": fix_context,
+            }
+
+        error_content = format_execution_error(e.stdout, e.stderr)
+        known_fix = lookup_fix(signature)
+        if known_fix:
+            fix_context["known_fix_used"] = True
+            error_content += (f"\n\nThis error was solved before (task: {known_fix['task']}) with this change:\n"
+                              f"{known_fix['diff']}")
+            emit_progress({"type": "known_fix", "task_index": current_task_index, "iteration": iterations,
+                           "signature": signature, "patch": None})
+        error_message = AIMessage(content=error_content)
         print(f"Error message:\n\n{error_message.content}")
         logging.error(f"Error message:\n\n{error_message.content}")
-        
         return {
             "messages": [error_message],
             "error": "yes",
+            "live_variables": live_variables,
+            "preflight_failed": False,
+            "patched_retry": False,
+            "fix_context": fix_context,
         }
     except Exception as e:
         print("---CODE BLOCK CHECK: FAILED (Unexpected Exception)---")
@@ -142,24 +272,44 @@ def code_check(state: AgentState):
         logging.error(f"current task: {current_task}")
         logging.error(f"current task index: {current_task_index}")
         
+        emit_progress({"type": "exec_end", "task_index": current_task_index, "iteration": iterations,
+                       "returncode": None, "error": str(e)})
         error_message = AIMessage(content=f"An unexpected error occurred during code execution:\n{str(e)}")
         print(f"Error message:\n\t{error_message.content}")
         logging.error(f"Error message:\n\t{error_message.content}")
         
+        # Timeouts restart the kernel, so nothing survives in the live namespace.
         return {
             "messages": [error_message],
             "error": "yes",
+            "live_variables": {} if persistent else live_variables,
+            "preflight_failed": False,
+            "patched_retry": False,
         }
     finally:
     # Always clean up the directory
-        shutil.rmtree(temp_dir)
+        release_sandbox(temp_dir)
+
+def remember_fixes(fix_context, task, fixed_code, iterations):
+    """Store the fix for every error the task hit on its way to this successful block, and the attempts it took."""
+    for signature in fix_context.get("signatures") or []:
+        record_fix(signature, task, fix_context["failed_code"], fixed_code)
+    helped = bool(fix_context.get("known_fix_used") or fix_context.get("patched"))
+    record_task_outcome(max(iterations, 1), fix_context.get("failures", 0), helped)
+    if fix_context.get("signatures"):
+        logging.info(f"Fix memory stats: {iteration_stats()}")
 
 # Theoretically not a "Node" but act like a node
-def tool_doc_retrieval(tool_name):
-    doc_path = os.path.join("tool_documentation", f"{tool_name}.txt")
-    document_full_path = os.path.abspath(doc_path) 
-    if os.path.isfile(document_full_path):
-        with open(document_full_path, "r", encoding="utf-8") as f:
-            return f.read()
-    else:
-        return "" # Return empty string if no such file exist for selected tool.
\ No newline at end of file
+def tool_doc_retrieval(tool_name, query=None, budget_tokens=TOOL_DOC_TOKENS):
+    """
+    Documentation of the selected tool, served from the in-memory section index.
+    With a query, only the sections most relevant to it are returned within `budget_tokens`.
+    """
+    index = get_tool_doc_index()
+    if query is None:
+        return index.full_text(tool_name) # Empty string if no such file exist for selected tool.
+    return index.retrieve(tool_name, query, budget_tokens)
+
+def preload_tool_docs(tool_names):
+    loaded = [tool_name for tool_name in tool_names if get_tool_doc_index().load(tool_name)]
+    logging.info(f"Preloaded tool documentation: {len(loaded)} file(s)")
@@ -0,0 +1,190 @@
+import time
+import asyncio
+import logging
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+from agent_types import AgentState
+from workflow_utils import plan_predecessors, plan_ancestors, run_dag, arun_dag, task_digest, emit_progress, PARALLEL_STEPS
+from workflow_utils import save_step_result, completed_step_results, shutdown_kernel, cleanup_session
+from .agent_nodes import select_tools_for_steps
+
+
+class _ParallelRun:
+    """State shared by the steps of one parallel run: how each step's input is built and how the results are merged."""
+
+    def __init__(self, state: AgentState, config: RunnableConfig):
+        self.state = state
+        # Completed steps are saved per run thread, so a resumed run skips them (see workflow_utils/checkpoints.py)
+        self.thread_id = (config.get("configurable") or {}).get("thread_id")
+        self.plan = list(state["plan"])
+        self.start_index = state["current_task_index"]
+        self.predecessors = plan_predecessors(self.plan, state.get("step_dependencies"))
+        self.ancestors = plan_ancestors(self.predecessors)
+        self.session_id = state.get("session_id") or "default"
+        self.base_code = state.get("all_generated_code") or ""
+        self.base_records = list(state.get("output_records") or [])
+        self.step_tools = {step: tool for step, tool in (state.get("step_tools") or {}).items() if step in self.plan}
+        self.missing_steps = [step for step in dict.fromkeys(self.plan) if step not in self.step_tools]
+        self.step_results = {}
+        self.started = {}
+        logging.info(f"Step dependencies: {dict((idx + 1, [p + 1 for p in preds]) for idx, preds in enumerate(self.predecessors))}")
+
+    def lane_session(self, lane: int) -> str:
+        # One execution kernel per lane, so blocks of concurrent steps do not queue on the session kernel
+        return f"{self.session_id}-lane{lane}" if lane else self.session_id
+
+    def release_lanes(self):
+        """Shut down the lane kernels (lane 0 is the session's own) and remove their sandboxes."""
+        for lane in range(1, max(PARALLEL_STEPS, 1)):
+            shutdown_kernel(self.lane_session(lane))
+            cleanup_session(self.lane_session(lane))
+
+    def step_state(self, idx: int, lane: int) -> dict:
+        task = self.plan[idx]
+        self.started[idx] = time.time()
+        emit_progress({"type": "parallel_step", "status": "start", "task_index": idx, "task": task, "lane": lane})
+        logging.info(f"Parallel step {idx + 1} started on lane {lane}: {task}")
+        # The step sees the code and output of the steps it depends on (directly or not)
+        ancestors = self.ancestors[idx]
+        code = self.base_code + "".join(self.step_results[a]["code"] for a in ancestors if a in self.step_results)
+        records = self.base_records + [self.step_results[a]["record"] for a in ancestors
+                                       if a in self.step_results and self.step_results[a]["record"] is not None]
+        return {
+            **self.state,
+            "plan": list(self.plan),
+            "current_task": task,
+            "current_task_index": idx,
+            "completed_steps": ancestors,
+            "messages": [HumanMessage(content=task_digest(self.plan, idx, ancestors)),
+                         HumanMessage(content=f"Task {idx+1}: {task}")],
+            "iterations": 0,
+            "code_generation": "",
+            "error": "no",
+            "all_generated_code": code,
+            "stdout_output": "",
+            "output_records": records,
+            "live_variables": {},
+            "step_tools": self.step_tools,
+            "fix_context": {},
+            "preflight_failed": False,
+            "patched_retry": False,
+            "session_id": self.lane_session(lane),
+        }
+
+    def restore_completed(self) -> dict:
+        """Results of the steps an earlier attempt of this run completed; they are not run again."""
+        restored = completed_step_results(self.thread_id, self.plan, self.predecessors, range(self.start_index))
+        if restored:
+            self.step_results.update(restored)
+            logging.info(f"Resuming parallel run: step(s) {[idx + 1 for idx in sorted(restored)]} already completed")
+        return restored
+
+    def save(self, idx: int):
+        save_step_result(self.thread_id, idx, self.plan[idx], self.step_results[idx])
+
+    def finish_step(self, idx: int, lane: int, step_state: dict, result: dict) -> dict:
+        new_records = [record for record in result.get("output_records") or [] if record["task_index"] == idx]
+        self.step_results[idx] = {
+            "task": result["plan"][idx],
+            "code": result["all_generated_code"][len(step_state["all_generated_code"]):],
+            "stdout": result.get("stdout_output") or "",
+            "record": new_records[-1] if new_records else None,
+            "step_tools": result.get("step_tools") or {},
+        }
+        duration = time.time() - self.started[idx]
+        emit_progress({"type": "parallel_step", "status": "end", "task_index": idx, "task": self.plan[idx], "lane": lane, "duration": duration})
+        logging.info(f"Parallel step {idx + 1} finished in {duration:.1f}s")
+        return self.step_results[idx]
+
+    def merge(self, results: dict) -> dict:
+        """Deterministic merge, in plan order."""
+        plan = list(self.plan)
+        all_generated_code, stdout_output = self.base_code, self.state.get("stdout_output") or ""
+        output_records = self.base_records
+        step_tools = dict(self.step_tools)
+        step_dependencies = dict(self.state.get("step_dependencies") or {})
+        for idx in sorted(results):
+            result = results[idx]
+            all_generated_code += result["code"]
+            stdout_output += result["stdout"]
+            if result["record"] is not None:
+                output_records = output_records + [result["record"]]
+            step_tools.update(result["step_tools"])
+            if result["task"] != plan[idx]:
+                # Replanned step: it keeps its place in the dependency graph under its new text
+                if plan[idx] in step_dependencies:
+                    step_dependencies[result["task"]] = step_dependencies.pop(plan[idx])
+                step_dependencies = {step: [result["task"] if d == plan[idx] else d for d in deps]
+                                     for step, deps in step_dependencies.items()}
+                plan[idx] = result["task"]
+        return {
+            "plan": plan,
+            "current_task": plan[-1],
+            "current_task_index": len(plan) - 1,
+            "iterations": 0,
+            "error": "no",
+            "all_generated_code": all_generated_code,
+            "stdout_output": stdout_output,
+            "output_records": output_records,
+            "step_tools": step_tools,
+            "step_dependencies": step_dependencies,
+            "live_variables": {},
+        }
+
+
+def make_parallel_runner(step_app):
+    """
+    Node that runs the whole plan with independent steps side by side.
+    `step_app` is the compiled single-task loop (tool selection, code generation, check, reflect/replan);
+    each step runs it on its own copy of the state, seeded with the output of the steps it depends on.
+    The results are merged in plan order, so the final state does not depend on which step finished first.
+    """
+    def run_parallel_steps(state: AgentState, config: RunnableConfig):
+        print("---Initiate Parallel Step Runner---")
+        logging.info("---Initiate Parallel Step Runner---")
+        run = _ParallelRun(state, config)
+        # Tools for every step in one call, instead of one call per branch
+        if run.missing_steps:
+            run.step_tools.update(select_tools_for_steps(run.plan, run.missing_steps, state["available_tools"]))
+        restored = run.restore_completed()
+
+        def run_step(idx: int, lane: int):
+            step_state = run.step_state(idx, lane)
+            result = run.finish_step(idx, lane, step_state, step_app.invoke(step_state, config))
+            run.save(idx)
+            return result
+
+        started = time.time()
+        try:
+            results = run_dag(run.predecessors, run_step, done=[*range(run.start_index), *restored])
+        finally:
+            run.release_lanes()
+        logging.info(f"Parallel run of {len(results)} step(s) finished in {time.time() - started:.1f}s "
+                     f"(up to {PARALLEL_STEPS} at once)")
+        return run.merge({**restored, **results})
+
+    async def arun_parallel_steps(state: AgentState, config: RunnableConfig):
+        print("---Initiate Parallel Step Runner---")
+        logging.info("---Initiate Parallel Step Runner---")
+        run = _ParallelRun(state, config)
+        if run.missing_steps:
+            run.step_tools.update(await select_tools_for_steps.afunc(run.plan, run.missing_steps, state["available_tools"]))
+        restored = await asyncio.to_thread(run.restore_completed)
+
+        async def run_step(idx: int, lane: int):
+            step_state = run.step_state(idx, lane)
+            result = run.finish_step(idx, lane, step_state, await step_app.ainvoke(step_state, config))
+            await asyncio.to_thread(run.save, idx)
+            return result
+
+        started = time.time()
+        try:
+            results = await arun_dag(run.predecessors, run_step, done=[*range(run.start_index), *restored])
+        finally:
+            await asyncio.to_thread(run.release_lanes)
+        logging.info(f"Parallel run of {len(results)} step(s) finished in {time.time() - started:.1f}s "
+                     f"(up to {PARALLEL_STEPS} at once)")
+        return run.merge({**restored, **results})
+
+    run_parallel_steps.afunc = arun_parallel_steps
+    return run_parallel_steps
@@ -0,0 +1,119 @@
+from .checkpoints import SessionCheckpointer, get_checkpointer, run_thread_id, run_config, begin_run, finish_run, mark_interrupted_runs, resumable_runs, cleanup_checkpoints, resume_point, restore_live_namespace, CHECKPOINTS_ENABLED, save_step_result, completed_step_results
+from .dag import dependencies_from_plan, plan_predecessors, plan_ancestors, dag_width, runs_in_parallel, run_dag, arun_dag, PARALLEL_STEPS
+from .dataset_probe import probe_dataset, probe_inputs, describe_dataset, is_large_data, data_context, memory_limit_bytes, LARGE_DATA
+from .executor import ExecutionResult, PersistentKernel, run_code, arun_code, get_kernel, shutdown_kernel, reset_namespace, uses_persistent_namespace, FATAL_PATTERNS
+from .fix_memory import error_signature, apply_patches, lookup_fix, record_fix, record_task_outcome, iteration_stats, FIX_MEMORY_ENABLED
+from .history import compact_history, HISTORY_SUMMARY_TOKENS
+from .llm import make_chat_model
+from .llm_cache import get_llm_cache, llm_cache_stats, LLM_CACHE_CODEGEN
+from .message_window import format_execution_error, truncate_traceback, dedupe_messages, task_digest
+from .node_runtime import Blocking, dual_node, as_runnable, drive, adrive
+from .output_records import build_output_record, format_output_records, CODEGEN_OUTPUT_TOKENS, REPORT_OUTPUT_TOKENS
+from .preflight import preflight_check, preflight_stats, PREFLIGHT_ENABLED
+from .progress import emit_progress
+from .router import pre_route, record_decision, router_stats
+from .result_cache import run_code_cached, arun_code_cached, RESULT_CACHE_ENABLED
+from .sandbox import create_attempt_sandbox, release_sandbox, cleanup_session, RESULTS_DIR
+from .structured_logging import setup_logging, stop_logging, parse_levels, read_payload, resolve_payload, prune_payloads, read_log_entries, LOG_DIR
+from .tokens import count_tokens, truncate_to_tokens
+from .tracing import RunProfiler, load_profile, node_breakdown, format_breakdown, PROFILING_ENABLED
+from .tool_docs import ToolDocIndex, get_tool_doc_index, TOOL_DOC_TOKENS
+
+__all__ = [
+    "ExecutionResult",
+    "PersistentKernel",
+    "run_code",
+    "arun_code",
+    "get_kernel",
+    "shutdown_kernel",
+    "reset_namespace",
+    "uses_persistent_namespace",
+    "run_code_cached",
+    "arun_code_cached",
+    "RESULT_CACHE_ENABLED",
+    "create_attempt_sandbox",
+    "release_sandbox",
+    "cleanup_session",
+    "RESULTS_DIR",
+    "FATAL_PATTERNS",
+    "emit_progress",
+    "pre_route",
+    "record_decision",
+    "router_stats",
+    "make_chat_model",
+    "get_llm_cache",
+    "llm_cache_stats",
+    "LLM_CACHE_CODEGEN",
+    "build_output_record",
+    "format_output_records",
+    "count_tokens",
+    "CODEGEN_OUTPUT_TOKENS",
+    "REPORT_OUTPUT_TOKENS",
+    "truncate_to_tokens",
+    "compact_history",
+    "HISTORY_SUMMARY_TOKENS",
+    "format_execution_error",
+    "truncate_traceback",
+    "dedupe_messages",
+    "task_digest",
+    "ToolDocIndex",
+    "get_tool_doc_index",
+    "TOOL_DOC_TOKENS",
+    "preflight_check",
+    "preflight_stats",
+    "PREFLIGHT_ENABLED",
+    "error_signature",
+    "apply_patches",
+    "lookup_fix",
+    "record_fix",
+    "record_task_outcome",
+    "iteration_stats",
+    "FIX_MEMORY_ENABLED",
+    "dependencies_from_plan",
+    "plan_predecessors",
+    "plan_ancestors",
+    "dag_width",
+    "runs_in_parallel",
+    "run_dag",
+    "arun_dag",
+    "PARALLEL_STEPS",
+    "Blocking",
+    "dual_node",
+    "as_runnable",
+    "drive",
+    "adrive",
+    "SessionCheckpointer",
+    "get_checkpointer",
+    "run_thread_id",
+    "run_config",
+    "begin_run",
+    "finish_run",
+    "mark_interrupted_runs",
+    "resumable_runs",
+    "cleanup_checkpoints",
+    "resume_point",
+    "restore_live_namespace",
+    "CHECKPOINTS_ENABLED",
+    "RunProfiler",
+    "load_profile",
+    "node_breakdown",
+    "format_breakdown",
+    "PROFILING_ENABLED",
+    "setup_logging",
+    "stop_logging",
+    "parse_levels",
+    "read_payload",
+    "resolve_payload",
+    "LOG_DIR",
+    "probe_dataset",
+    "probe_inputs",
+    "describe_dataset",
+    "is_large_data",
+    "data_context",
+    "memory_limit_bytes",
+    "LARGE_DATA",
+    "save_step_result",
+    "completed_step_results",
+    "prune_payloads",
+    "read_log_entries"
+]
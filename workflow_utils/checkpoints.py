@@ -0,0 +1,273 @@
+"""
+Durable checkpoints of analysis runs, so a failed or interrupted run resumes instead of restarting.
+
+Every request runs on its own LangGraph thread ("<session_id>:<run_no>"), and the
+state is checkpointed to a local SQLite file after every node. A `runs` table in
+the same file records each run's status (running, completed, failed, interrupted).
+
+A run can be resumed from its last task boundary: the newest checkpoint whose
+next node is task_retriever (or parallel_runner). That state already holds the
+completed tasks' all_generated_code, stdout_output and output records, so no
+finished LLM call or code block is paid for again. In persistent execution mode
+the committed code is replayed once to rebuild the live namespace.
+
+The parallel runner executes the whole plan inside one node, so its checkpoint
+is taken before any step ran. Each step it completes is saved to a
+`parallel_steps` table of the same file instead, and a resumed parallel run
+skips those steps (see completed_step_results).
+
+Runs are only listed to, and resumed by, the session that started them.
+
+Retention:
+    - completed runs are deleted right away (they cannot be resumed), unless kept
+    - runs not updated for SCAGENT_CHECKPOINT_RETENTION_DAYS are deleted
+    - only the newest SCAGENT_CHECKPOINT_MAX_RUNS runs are kept
+
+Settings (environment variables):
+    SCAGENT_CHECKPOINTS=0                   disable checkpointing
+    SCAGENT_CHECKPOINT_DIR                  store location (default .scagent_cache/checkpoints)
+    SCAGENT_CHECKPOINT_RETENTION_DAYS       age after which runs are deleted (default 7)
+    SCAGENT_CHECKPOINT_MAX_RUNS             runs kept at most (default 50)
+    SCAGENT_CHECKPOINT_KEEP_COMPLETED=1     keep the checkpoints of completed runs
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from .executor import run_code, uses_persistent_namespace, reset_namespace
+from .sandbox import create_attempt_sandbox, release_sandbox
+
+CHECKPOINTS_ENABLED = os.environ.get("SCAGENT_CHECKPOINTS", "1") != "0"
+CHECKPOINT_DIR = os.path.abspath(os.environ.get("SCAGENT_CHECKPOINT_DIR", os.path.join(".scagent_cache", "checkpoints")))
+CHECKPOINT_RETENTION = float(os.environ.get("SCAGENT_CHECKPOINT_RETENTION_DAYS", "7")) * 24 * 3600
+CHECKPOINT_MAX_RUNS = int(os.environ.get("SCAGENT_CHECKPOINT_MAX_RUNS", "50"))
+CHECKPOINT_KEEP_COMPLETED = os.environ.get("SCAGENT_CHECKPOINT_KEEP_COMPLETED", "0") == "1"
+
+# Nodes that start a task: a checkpoint just before them is a clean resume point
+RESUME_NODES = {"task_retriever", "parallel_runner"}
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+_db_lock = threading.Lock()
+
+
+class SessionCheckpointer(SqliteSaver):
+    """SqliteSaver whose async methods run the sync ones in a worker thread, so the async graph can share the file."""
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def _db_path() -> str:
+    return os.path.join(CHECKPOINT_DIR, "checkpoints.sqlite")
+
+
+def get_checkpointer() -> Optional[SessionCheckpointer]:
+    """Process-wide checkpointer, or None when checkpointing is disabled."""
+    global _checkpointer
+    if not CHECKPOINTS_ENABLED:
+        return None
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+            _checkpointer = SessionCheckpointer(sqlite3.connect(_db_path(), check_same_thread=False, timeout=30))
+            _checkpointer.setup()
+    return _checkpointer
+
+
+# ---------- runs ----------
+def _connect() -> sqlite3.Connection:
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    conn = sqlite3.connect(_db_path(), timeout=30)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS runs (
+            thread_id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            user_prompt TEXT NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            started REAL NOT NULL,
+            updated REAL NOT NULL
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS parallel_steps (
+            thread_id TEXT NOT NULL,
+            step_index INTEGER NOT NULL,
+            planned_task TEXT NOT NULL,
+            result TEXT NOT NULL,
+            PRIMARY KEY (thread_id, step_index)
+        )"""
+    )
+    return conn
+
+
+def run_thread_id(session_id: str, run_no: int) -> str:
+    return f"{session_id}:{run_no}"
+
+
+def run_config(thread_id: str, **config) -> dict:
+    """Graph config for a run; `config` adds e.g. recursion_limit."""
+    return {**config, "configurable": {"thread_id": thread_id}}
+
+
+def begin_run(thread_id: str, session_id: str, user_prompt: str):
+    if not CHECKPOINTS_ENABLED:
+        return
+    now = time.time()
+    with _db_lock, closing(_connect()) as conn:
+        conn.execute(
+            """INSERT INTO runs VALUES (?, ?, ?, 'running', NULL, ?, ?)
+               ON CONFLICT(thread_id) DO UPDATE SET status = 'running', error = NULL, updated = excluded.updated""",
+            (thread_id, session_id, user_prompt, now, now),
+        )
+        conn.commit()
+
+
+def finish_run(thread_id: str, status: str, error: Optional[str] = None):
+    """Record the outcome of a run; completed runs lose their checkpoints unless they are kept."""
+    if not CHECKPOINTS_ENABLED:
+        return
+    with _db_lock, closing(_connect()) as conn:
+        conn.execute("UPDATE runs SET status = ?, error = ?, updated = ? WHERE thread_id = ?",
+                     (status, (error or "")[:500] or None, time.time(), thread_id))
+        conn.commit()
+    if status == "completed" and not CHECKPOINT_KEEP_COMPLETED:
+        _delete_runs([thread_id])
+    cleanup_checkpoints()
+
+
+def mark_interrupted_runs() -> int:
+    """At process start: runs still marked running were cut off by the previous process."""
+    if not CHECKPOINTS_ENABLED:
+        return 0
+    with _db_lock, closing(_connect()) as conn:
+        count = conn.execute("UPDATE runs SET status = 'interrupted', updated = ? WHERE status = 'running'",
+                             (time.time(),)).rowcount
+        conn.commit()
+    if count:
+        logging.info(f"Checkpoints: {count} run(s) interrupted by the previous process can be resumed")
+    return count
+
+
+def resumable_runs(session_id: str, limit: int = 10) -> List[Dict]:
+    """Failed or interrupted runs of one session, newest first."""
+    if not CHECKPOINTS_ENABLED:
+        return []
+    with _db_lock, closing(_connect()) as conn:
+        rows = conn.execute(
+            """SELECT thread_id, session_id, user_prompt, status, error, updated FROM runs
+               WHERE status IN ('failed', 'interrupted') AND session_id = ?
+               ORDER BY updated DESC LIMIT ?""",
+            (session_id, limit),
+        ).fetchall()
+    keys = ("thread_id", "session_id", "user_prompt", "status", "error", "updated")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def _delete_runs(thread_ids: List[str]):
+    checkpointer = get_checkpointer()
+    for thread_id in thread_ids:
+        checkpointer.delete_thread(thread_id)
+    with _db_lock, closing(_connect()) as conn:
+        conn.executemany("DELETE FROM runs WHERE thread_id = ?", [(thread_id,) for thread_id in thread_ids])
+        conn.executemany("DELETE FROM parallel_steps WHERE thread_id = ?", [(thread_id,) for thread_id in thread_ids])
+        conn.commit()
+
+
+# ---------- parallel steps ----------
+def save_step_result(thread_id: str, step_index: int, planned_task: str, result: dict):
+    """Record a step the parallel runner completed; `planned_task` is the step's text in the plan it ran."""
+    if not CHECKPOINTS_ENABLED or not thread_id:
+        return
+    with _db_lock, closing(_connect()) as conn:
+        conn.execute("INSERT OR REPLACE INTO parallel_steps VALUES (?, ?, ?, ?)",
+                     (thread_id, step_index, planned_task, json.dumps(result, default=str)))
+        conn.commit()
+
+
+def completed_step_results(thread_id: str, plan: List[str], predecessors: List[List[int]],
+                           done: Sequence[int] = ()) -> Dict[int, dict]:
+    """
+    Saved results of the steps of `plan` a previous attempt of this run completed. A result is
+    only reused while its step text is unchanged and every step it depends on is in `done` or reused too.
+    """
+    if not CHECKPOINTS_ENABLED or not thread_id:
+        return {}
+    with _db_lock, closing(_connect()) as conn:
+        rows = conn.execute("SELECT step_index, planned_task, result FROM parallel_steps WHERE thread_id = ?",
+                            (thread_id,)).fetchall()
+    saved = {idx: json.loads(result) for idx, task, result in rows if idx < len(plan) and plan[idx] == task}
+    reused = {}
+    for idx in range(len(plan)):
+        if idx in saved and idx not in done and all(p in reused or p in done for p in predecessors[idx]):
+            reused[idx] = saved[idx]
+    return reused
+
+
+def cleanup_checkpoints(max_age: float = CHECKPOINT_RETENTION, max_runs: int = CHECKPOINT_MAX_RUNS) -> int:
+    """Delete runs older than `max_age` seconds and all but the newest `max_runs` runs."""
+    if not CHECKPOINTS_ENABLED:
+        return 0
+    with _db_lock, closing(_connect()) as conn:
+        expired = [row[0] for row in conn.execute(
+            "SELECT thread_id FROM runs WHERE status != 'running' AND (updated < ? OR thread_id NOT IN "
+            "(SELECT thread_id FROM runs ORDER BY updated DESC LIMIT ?))",
+            (time.time() - max_age, max_runs),
+        )]
+    if expired:
+        _delete_runs(expired)
+        logging.info(f"Checkpoints: deleted {len(expired)} expired run(s)")
+    return len(expired)
+
+
+# ---------- resume ----------
+def resume_point(app, thread_id: str) -> Optional[Tuple[dict, dict]]:
+    """
+    (config, state values) to resume `thread_id` from: the newest checkpoint taken just before a task
+    started, else the newest checkpoint that still has work left. None when there is nothing to resume.
+    """
+    fallback = None
+    for snapshot in app.get_state_history(run_config(thread_id)):
+        if not snapshot.next:
+            continue
+        if RESUME_NODES & set(snapshot.next):
+            return snapshot.config, snapshot.values
+        fallback = fallback or (snapshot.config, snapshot.values)
+    return fallback
+
+
+def restore_live_namespace(values: dict):
+    """Persistent execution mode: rebuild the live variables of a resumed run by replaying its committed code."""
+    code = values.get("all_generated_code") or ""
+    if not uses_persistent_namespace() or not code.strip():
+        return
+    session_id = values.get("session_id") or "default"
+    reset_namespace(session_id)
+    temp_dir = create_attempt_sandbox(session_id, values.get("current_task_index", 0), -1)
+    try:
+        result = run_code(session_id, code, script_path=os.path.join(temp_dir, "replay_script.py"), cwd=temp_dir, timeout=3600)
+        logging.info(f"Replayed committed code of the resumed run in {result.duration:.1f}s (returncode {result.returncode})")
+    finally:
+        release_sandbox(temp_dir)
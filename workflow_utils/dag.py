@@ -0,0 +1,155 @@
+"""
+Step dependencies of an analysis plan and concurrent scheduling of independent steps.
+
+The planner states, for each step, which earlier steps' outputs it needs. The
+dependencies are kept in state keyed by step text (step_dependencies), like
+step_tools, so they survive plan edits for unchanged steps. A step without a
+recorded entry, or whose recorded dependencies are no longer in the plan (the
+plan editor or replanner changed them), waits for every earlier step: the
+sequential order is always the safe default.
+
+Steps whose dependencies are done run at the same time, up to
+PARALLEL_STEPS at once. Parallel runs need self-contained blocks, so they are
+only used in isolated execution mode.
+
+Settings (environment variables):
+    SCAGENT_PARALLEL_STEPS      maximum plan steps run at the same time (default 4, 1 disables)
+"""
+import os
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from .executor import uses_persistent_namespace
+
+PARALLEL_STEPS = int(os.environ.get("SCAGENT_PARALLEL_STEPS", "4"))
+
+
+def dependencies_from_plan(steps: Sequence[str], depends_on: Optional[Sequence[Sequence[int]]]) -> Dict[str, List[str]]:
+    """
+    Convert the planner's per-step lists of 1-based step numbers into {step: [earlier steps]}.
+    A misaligned answer is dropped entirely (sequential plan); references to the step itself
+    or to later steps are ignored.
+    """
+    if not depends_on or len(depends_on) != len(steps):
+        if depends_on:
+            logging.warning(f"Planner returned dependencies for {len(depends_on)} of {len(steps)} steps, running sequentially")
+        return {}
+    return {step: [steps[n - 1] for n in numbers if 1 <= n <= idx] for idx, (step, numbers) in enumerate(zip(steps, depends_on))}
+
+
+def plan_predecessors(plan: Sequence[str], step_dependencies: Optional[Dict[str, List[str]]]) -> List[List[int]]:
+    """For each step, the indices of the earlier steps it directly waits for."""
+    step_dependencies = step_dependencies or {}
+    predecessors = []
+    for idx, step in enumerate(plan):
+        earlier = {text: i for i, text in enumerate(plan[:idx])}   # Repeated steps refer to the latest occurrence
+        dependencies = step_dependencies.get(step)
+        if dependencies is None or any(dependency not in earlier for dependency in dependencies):
+            predecessors.append(list(range(idx)))
+        else:
+            predecessors.append(sorted({earlier[dependency] for dependency in dependencies}))
+    return predecessors
+
+
+def plan_ancestors(predecessors: List[List[int]]) -> List[List[int]]:
+    """For each step, every earlier step it depends on directly or indirectly, in plan order."""
+    ancestors: List[set] = []
+    for direct in predecessors:
+        found = set(direct)
+        for i in direct:
+            found |= ancestors[i]
+        ancestors.append(found)
+    return [sorted(found) for found in ancestors]
+
+
+def dag_width(predecessors: List[List[int]]) -> int:
+    """Largest number of steps at the same depth, i.e. how many steps can run side by side."""
+    depths = []
+    for direct in predecessors:
+        depths.append(1 + max((depths[i] for i in direct), default=0))
+    return max((depths.count(depth) for depth in set(depths)), default=0)
+
+
+def runs_in_parallel(plan: Sequence[str], step_dependencies: Optional[Dict[str, List[str]]]) -> bool:
+    return (PARALLEL_STEPS > 1 and not uses_persistent_namespace() and bool(plan)
+            and dag_width(plan_predecessors(plan, step_dependencies)) > 1)
+
+
+def run_dag(predecessors: List[List[int]], run_step: Callable[[int, int], object],
+            done: Sequence[int] = (), max_workers: int = PARALLEL_STEPS) -> Dict[int, object]:
+    """
+    Run every step not in `done` as soon as its predecessors have finished, at most `max_workers` at once.
+    `run_step(index, lane)` gets a lane number below `max_workers` that no other running step uses.
+    Returns {index: result}. After a failure no new step starts; the first error is raised once
+    the running steps have finished.
+    """
+    finished = set(done)
+    pending = [idx for idx in range(len(predecessors)) if idx not in finished]
+    results: Dict[int, object] = {}
+    free_lanes = list(range(max(max_workers, 1)))
+    running = {}
+    error = None
+    with ThreadPoolExecutor(max_workers=len(free_lanes), thread_name_prefix="scagent-step") as pool:
+        while pending or running:
+            if error is None:
+                for idx in [i for i in pending if all(p in finished for p in predecessors[i])]:
+                    if not free_lanes:
+                        break
+                    lane = free_lanes.pop(0)
+                    pending.remove(idx)
+                    # Each step runs in a copy of the caller's context (stream writer, callbacks)
+                    running[pool.submit(contextvars.copy_context().run, run_step, idx, lane)] = (idx, lane)
+            if not running:
+                break
+            completed, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in completed:
+                idx, lane = running.pop(future)
+                free_lanes.append(lane)
+                free_lanes.sort()
+                try:
+                    results[idx] = future.result()
+                    finished.add(idx)
+                except Exception as e:
+                    logging.error(f"Plan step {idx + 1} failed: {e}")
+                    error = error or e
+    if error is not None:
+        raise error
+    return results
+
+
+async def arun_dag(predecessors: List[List[int]], run_step: Callable[[int, int], Awaitable[object]],
+                   done: Sequence[int] = (), max_workers: int = PARALLEL_STEPS) -> Dict[int, object]:
+    """run_dag for coroutines: the steps run as asyncio tasks on the caller's event loop."""
+    finished = set(done)
+    pending = [idx for idx in range(len(predecessors)) if idx not in finished]
+    results: Dict[int, object] = {}
+    free_lanes = list(range(max(max_workers, 1)))
+    running = {}
+    error = None
+    while pending or running:
+        if error is None:
+            for idx in [i for i in pending if all(p in finished for p in predecessors[i])]:
+                if not free_lanes:
+                    break
+                lane = free_lanes.pop(0)
+                pending.remove(idx)
+                running[asyncio.ensure_future(run_step(idx, lane))] = (idx, lane)
+        if not running:
+            break
+        completed, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in completed:
+            idx, lane = running.pop(task)
+            free_lanes.append(lane)
+            free_lanes.sort()
+            try:
+                results[idx] = task.result()
+                finished.add(idx)
+            except Exception as e:
+                logging.error(f"Plan step {idx + 1} failed: {e}")
+                error = error or e
+    if error is not None:
+        raise error
+    return results
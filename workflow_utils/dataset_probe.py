@@ -0,0 +1,188 @@
+"""
+Dataset size probing and the large-data mode of code generation.
+
+Before any code runs, every input file is probed once: its size on disk and,
+for .h5ad and 10x .h5 files (read with h5py, when installed), the number of
+cells and genes and the memory the count matrices take once loaded (X, layers
+and raw). The code generator is told the size of the data, and when a dataset
+is too large for the memory available to the executor it switches to the
+large-data mode: the prompt then asks for backed reads
+(sc.read_h5ad(path, backed="r")), chunked statistics and early subsetting
+instead of loading the whole matrix in every step.
+
+A dataset counts as large when its in-memory size exceeds
+SCAGENT_LARGE_DATA_FRACTION of the memory available (physical memory, or the
+cgroup limit of the container when lower): scanpy preprocessing holds several
+copies of the matrix at once. SCAGENT_LARGE_DATA_THRESHOLD_GB sets a fixed
+threshold instead.
+
+Settings (environment variables):
+    SCAGENT_LARGE_DATA                  auto (default), 1 to always use the large-data mode, 0 to never use it
+    SCAGENT_LARGE_DATA_FRACTION         fraction of the available memory (default 0.25)
+    SCAGENT_LARGE_DATA_THRESHOLD_GB     fixed threshold in GB, overrides the fraction
+"""
+import os
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Union
+
+LARGE_DATA = os.environ.get("SCAGENT_LARGE_DATA", "auto")
+LARGE_DATA_FRACTION = float(os.environ.get("SCAGENT_LARGE_DATA_FRACTION", "0.25"))
+LARGE_DATA_THRESHOLD_GB = os.environ.get("SCAGENT_LARGE_DATA_THRESHOLD_GB", "")
+
+_GB = 1024 ** 3
+
+large_data_context = (
+    "### Large-data mode:\n"
+    "The input data is too large to be loaded into memory in every step. Work memory-efficiently:\n"
+    "- Open `.h5ad` inputs with `sc.read_h5ad(path, backed=\"r\")`: the matrix stays on disk. Backed objects are read-only; "
+    "compute masks or statistics on them, then load only the subset the task needs with `adata[cell_mask, gene_mask].to_memory()`.\n"
+    "- Compute per-cell and per-gene statistics in chunks of rows (`for chunk, start, end in adata.chunked_X(50000): ...`) "
+    "instead of on the full matrix.\n"
+    "- Keep matrices sparse: never call `.toarray()` or `.todense()` on a full matrix, and do not scale the full matrix "
+    "(subset to highly variable genes first, or use `zero_center=False`).\n"
+    "- Reduce early (filtering, highly variable genes, PCA) and write the reduced object to `results_dir` for later steps, "
+    "so they do not reload the full dataset.\n"
+    "- Free large intermediates (`del` and `gc.collect()`) as soon as they are no longer needed."
+)
+
+
+def memory_limit_bytes() -> Optional[int]:
+    """Memory available to code execution: physical memory, or the cgroup limit when lower."""
+    limits = []
+    try:
+        limits.append(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"))
+    except (ValueError, OSError, AttributeError):
+        pass
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            limits.append(int(value))
+    return min(limits) if limits else None
+
+
+def _matrix_bytes(node) -> int:
+    """In-memory size of a dense or sparse (data/indices/indptr) matrix stored in an HDF5 file."""
+    import h5py
+    if isinstance(node, h5py.Dataset):
+        return node.size * node.dtype.itemsize
+    return sum(node[name].size * node[name].dtype.itemsize for name in ("data", "indices", "indptr") if name in node)
+
+
+def _matrix_shape(node) -> Optional[tuple]:
+    import h5py
+    if isinstance(node, h5py.Dataset):
+        return tuple(node.shape)
+    for key in ("shape", "h5sparse_shape"):
+        if key in node.attrs:
+            return tuple(int(n) for n in node.attrs[key])
+    if "shape" in node:
+        return tuple(int(n) for n in node["shape"][()])
+    return None
+
+
+def _probe_hdf5(path: str, info: dict):
+    import h5py
+    with h5py.File(path, "r") as f:
+        if "X" in f:
+            # AnnData: cells x genes
+            shape = _matrix_shape(f["X"])
+            matrices = [f["X"]]
+            matrices += [f["layers"][name] for name in f.get("layers", {})]
+            if "raw" in f and "X" in f["raw"]:
+                matrices.append(f["raw"]["X"])
+            info["sparse"] = not isinstance(f["X"], h5py.Dataset)
+        elif "matrix" in f and not isinstance(f["matrix"], h5py.Dataset):
+            # 10x Genomics .h5: genes x cells
+            shape = _matrix_shape(f["matrix"])
+            shape = shape[::-1] if shape else None
+            matrices = [f["matrix"]]
+            info["sparse"] = True
+        else:
+            return
+        if shape and len(shape) == 2:
+            info["n_obs"], info["n_vars"] = shape
+        info["memory_bytes"] = sum(_matrix_bytes(node) for node in matrices)
+        info["estimated"] = False
+
+
+@lru_cache(maxsize=64)
+def _probe(path: str, size: int, mtime: float) -> dict:
+    info = {"path": path, "file_bytes": size, "n_obs": None, "n_vars": None, "sparse": None,
+            # Without the matrix layout, the size on disk is the best guess of the size in memory
+            "memory_bytes": size, "estimated": True}
+    if path.endswith((".h5ad", ".h5")):
+        try:
+            _probe_hdf5(path, info)
+        except ImportError:
+            pass
+        except Exception as e:
+            logging.warning(f"Could not read the layout of {path}: {type(e).__name__}: {e}")
+    return info
+
+
+def probe_dataset(path: str) -> Optional[dict]:
+    """Size of one input file (see the module docstring), or None when it does not exist; cached per file version."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    return dict(_probe(os.path.abspath(path), stat.st_size, stat.st_mtime))
+
+
+def _paths(input_file_path: Union[str, Dict[str, str], None]) -> List[str]:
+    if not input_file_path:
+        return []
+    if isinstance(input_file_path, dict):
+        return list(input_file_path)
+    return [input_file_path]
+
+
+def probe_inputs(input_file_path: Union[str, Dict[str, str], None]) -> List[dict]:
+    return [info for info in map(probe_dataset, _paths(input_file_path)) if info is not None]
+
+
+def large_data_threshold() -> Optional[int]:
+    if LARGE_DATA_THRESHOLD_GB:
+        return int(float(LARGE_DATA_THRESHOLD_GB) * _GB)
+    limit = memory_limit_bytes()
+    return int(limit * LARGE_DATA_FRACTION) if limit else None
+
+
+def is_large_data(datasets: List[dict]) -> bool:
+    if LARGE_DATA == "0":
+        return False
+    if LARGE_DATA == "1":
+        return True
+    threshold = large_data_threshold()
+    return threshold is not None and any(info["memory_bytes"] > threshold for info in datasets)
+
+
+def _size(n_bytes: int) -> str:
+    return f"{n_bytes / _GB:.1f} GB" if n_bytes >= _GB else f"{n_bytes / 1024 ** 2:.0f} MB"
+
+
+def describe_dataset(info: dict) -> str:
+    parts = []
+    if info["n_obs"] is not None:
+        parts.append(f"{info['n_obs']:,} cells x {info['n_vars']:,} genes" + (", sparse" if info["sparse"] else ", dense"))
+    approx = "~" if info["estimated"] else ""
+    parts.append(f"{approx}{_size(info['memory_bytes'])} in memory, {_size(info['file_bytes'])} on disk")
+    return f"{info['path']}: " + ", ".join(parts)
+
+
+def data_context(input_file_path: Union[str, Dict[str, str], None]) -> str:
+    """Prompt text on the size of the inputs, with the large-data guidance when they are too large for memory."""
+    datasets = probe_inputs(input_file_path)
+    if not datasets:
+        return ""
+    text = "Input data size:\n" + "\n".join(f"- {describe_dataset(info)}" for info in datasets)
+    if is_large_data(datasets):
+        text += "\n\n" + large_data_context
+    return text
@@ -0,0 +1,574 @@
+"""
+Execution engine for generated code blocks.
+
+Two backends are available, selected with the SCAGENT_EXECUTOR environment variable:
+    - "kernel" (default): a long-lived, per-session worker interpreter with the heavy
+      scientific stack pre-imported (see kernel_worker.py). The worker is restarted
+      cleanly whenever a block crashes it or runs past its timeout.
+    - "subprocess": a brand-new `python script.py` per attempt (the original behaviour).
+
+SCAGENT_EXECUTION_MODE selects how variables flow between plan steps:
+    - "isolated" (default): every block is self-contained and reloads its inputs from disk.
+    - "persistent": variables created by a successful block (e.g. `adata`) stay alive in the
+      session kernel and are exposed to the next step. Requires the "kernel" backend.
+
+Every result carries the peak resident memory of its block (Linux): the kernel worker
+measures it per block, and subprocess runs are sampled from /proc while they run.
+"""
+import os
+import sys
+import re
+import json
+import time
+import queue
+import signal
+import asyncio
+import atexit
+import logging
+import threading
+import subprocess
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+EXECUTOR_BACKEND = os.environ.get("SCAGENT_EXECUTOR", "kernel")
+EXECUTION_MODE = os.environ.get("SCAGENT_EXECUTION_MODE", "isolated")   # "isolated" or "persistent"
+KERNEL_PREIMPORTS = os.environ.get(
+    "SCAGENT_KERNEL_PREIMPORTS",
+    "numpy,pandas,scipy.sparse,anndata,scanpy,celltypist,matplotlib.pyplot",
+)
+KERNEL_STARTUP_TIMEOUT = float(os.environ.get("SCAGENT_KERNEL_STARTUP_TIMEOUT", "300"))
+KERNEL_IDLE_TIMEOUT = float(os.environ.get("SCAGENT_KERNEL_IDLE_TIMEOUT", "3600"))
+DEFAULT_TIMEOUT = 600
+
+# Output matching this pattern dooms a run: it is stopped after a short grace period
+# instead of waiting for the timeout. Set SCAGENT_FATAL_PATTERNS to "" to disable.
+FATAL_PATTERNS = os.environ.get(
+    "SCAGENT_FATAL_PATTERNS",
+    r"MemoryError|No space left on device|CUDA out of memory|std::bad_alloc",
+)
+FATAL_GRACE_SECONDS = float(os.environ.get("SCAGENT_FATAL_GRACE_SECONDS", "5"))
+# Seconds between two peak memory readings of a subprocess run
+PEAK_RSS_SAMPLE_SECONDS = 0.1
+
+_WORKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernel_worker.py")
+_SENTINEL = "\x1eSCAGENT_"
+
+
+@dataclass
+class ExecutionResult:
+    """Outcome of running one code block, shaped like subprocess.CompletedProcess."""
+    args: str
+    returncode: int
+    stdout: str
+    stderr: str
+    duration: float
+    backend: str
+    variables: Optional[Dict[str, str]] = None                              # Live variables after the block (kernel only)
+    namespace_reset: bool = False                                           # True when the kernel lost its live variables
+    killed_reason: Optional[str] = None                                     # Fatal output that stopped the run early
+    peak_rss_mb: Optional[float] = None                                     # Peak resident memory of the block, where measurable
+
+    def check_returncode(self):
+        if self.returncode != 0:
+            raise subprocess.CalledProcessError(self.returncode, self.args, self.stdout, self.stderr)
+
+
+OutputCallback = Callable[[str, str], None]
+
+
+def _pump(stream_name, stream, events):
+    for line in iter(stream.readline, ""):
+        events.put((stream_name, line))
+    events.put((stream_name, None))
+
+
+class _OutputCollector:
+    """Accumulates streamed output, forwards it line by line and watches for fatal patterns."""
+
+    def __init__(self, on_output: Optional[OutputCallback] = None, fatal_patterns: Optional[str] = None):
+        self.parts = {"stdout": [], "stderr": []}
+        self.on_output = on_output
+        self.fatal_re = re.compile(fatal_patterns) if fatal_patterns else None
+        self.fatal_match: Optional[str] = None
+        self.fatal_at = 0.0
+
+    def feed(self, stream_name: str, text: str):
+        self.parts[stream_name].append(text)
+        if self.on_output is not None:
+            try:
+                self.on_output(stream_name, text)
+            except Exception:
+                logging.exception("Output callback failed")
+        if self.fatal_re is not None and self.fatal_match is None:
+            match = self.fatal_re.search(text)
+            if match:
+                self.fatal_match = match.group(0)
+                self.fatal_at = time.time()
+                logging.warning(f"Fatal output pattern detected: {self.fatal_match!r}")
+
+    def wait_budget(self, deadline: float) -> float:
+        """Seconds to wait for the next line: until the timeout, or the end of the fatal grace period."""
+        remaining = deadline - time.time()
+        if self.fatal_match is not None:
+            remaining = min(remaining, self.fatal_at + FATAL_GRACE_SECONDS - time.time())
+        return remaining
+
+    def kill_due(self) -> bool:
+        return self.fatal_match is not None and time.time() - self.fatal_at >= FATAL_GRACE_SECONDS
+
+    def killed_note(self) -> str:
+        return f"\nExecution stopped early: output matched fatal error pattern {self.fatal_match!r}.\n"
+
+    @property
+    def stdout(self) -> str:
+        return "".join(self.parts["stdout"])
+
+    @property
+    def stderr(self) -> str:
+        return "".join(self.parts["stderr"])
+
+
+def _read_peak_rss_mb(status_path: str) -> Optional[float]:
+    """Resident memory high-water mark (VmHWM) from a /proc/<pid>/status file."""
+    try:
+        with open(status_path) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class _PeakRssSampler:
+    """Follows the peak resident memory of a child process while it runs (Linux only).
+
+    The child's own high-water mark is read, not its rusage: ru_maxrss of a child
+    starts at the size of the process it was spawned from.
+    """
+
+    def __init__(self, pid: int):
+        self.status_path = f"/proc/{pid}/status"
+        self.peak_mb: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = None
+        if os.path.exists(self.status_path):
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            peak = _read_peak_rss_mb(self.status_path)
+            if peak is not None:
+                self.peak_mb = max(self.peak_mb or 0.0, peak)
+            if self._stop.wait(PEAK_RSS_SAMPLE_SECONDS):
+                return
+
+    def stop(self) -> Optional[float]:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.peak_mb
+
+
+def _sigkill_note(peak_rss_mb: Optional[float]) -> str:
+    """Explanation of a run killed by SIGKILL that was not stopped by us: most often the out-of-memory killer."""
+    peak = f" after reaching {peak_rss_mb:.0f} MB" if peak_rss_mb else ""
+    return (f"\nThe process was killed (SIGKILL){peak}, most likely by the out-of-memory killer. "
+            "Reduce the memory the block needs, e.g. read the data with backed=\"r\" and load only a subset.\n")
+
+
+class PersistentKernel:
+    """A long-lived worker interpreter that executes code blocks one at a time."""
+
+    def __init__(self, name: str, preimports: str = KERNEL_PREIMPORTS):
+        self.name = name
+        self.preimports = preimports
+        self.process: Optional[subprocess.Popen] = None
+        self.last_used = time.time()
+        self._lock = threading.Lock()
+        self._events: "queue.Queue" = queue.Queue()
+        self._ready = False
+        self._request_id = 0
+
+    # ---------- lifecycle ----------
+    def start(self):
+        if self.is_alive():
+            return
+        env = dict(os.environ)
+        env["SCAGENT_KERNEL_PREIMPORTS"] = self.preimports
+        env.setdefault("MPLBACKEND", "Agg")
+        env["PYTHONUNBUFFERED"] = "1"
+        self._events = queue.Queue()
+        self._ready = False
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", _WORKER_PATH],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            env=env,
+        )
+        for stream_name in ("stdout", "stderr"):
+            reader = threading.Thread(
+                target=_pump,
+                args=(stream_name, getattr(self.process, stream_name), self._events),
+                daemon=True,
+            )
+            reader.start()
+        logging.info(f"Kernel '{self.name}' started (pid {self.process.pid})")
+
+    def shutdown(self):
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        try:
+            process.stdin.close()
+        except Exception:
+            pass
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        logging.info(f"Kernel '{self.name}' shut down")
+
+    def kill(self):
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        process.kill()
+        process.wait()
+
+    def restart(self):
+        logging.info(f"Restarting kernel '{self.name}'")
+        self.kill()
+        self.start()
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def _wait_ready(self):
+        deadline = time.time() + KERNEL_STARTUP_TIMEOUT
+        while not self._ready:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                self.kill()
+                raise TimeoutError(f"Kernel '{self.name}' did not become ready in {KERNEL_STARTUP_TIMEOUT}s")
+            try:
+                stream_name, line = self._events.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if line is None:
+                self.kill()
+                raise RuntimeError(f"Kernel '{self.name}' exited during start-up")
+            if stream_name == "stderr" and line.startswith(f"{_SENTINEL}READY "):
+                info = json.loads(line[len(f"{_SENTINEL}READY "):])
+                logging.info(f"Kernel '{self.name}' ready in {info['seconds']:.2f}s, pre-imported: {info['loaded']}")
+                self._ready = True
+
+    # ---------- execution ----------
+    def execute(self, source: str, script_path: str, cwd: str, timeout: float = DEFAULT_TIMEOUT,
+                namespace: str = "isolated", on_output: Optional[OutputCallback] = None,
+                fatal_patterns: Optional[str] = None) -> ExecutionResult:
+        request = {"source": source, "script_path": script_path, "cwd": cwd, "namespace": namespace}
+        return self._send(request, script_path, timeout, _OutputCollector(on_output, fatal_patterns))
+
+    def reset_namespace(self):
+        """Drop every variable kept by persistent-mode blocks."""
+        if self.is_alive():
+            self._send({"command": "reset"}, "reset", KERNEL_STARTUP_TIMEOUT, _OutputCollector())
+
+    def _send(self, request: dict, label: str, timeout: float, output: _OutputCollector) -> ExecutionResult:
+        with self._lock:
+            self.last_used = time.time()
+            self.start()
+            self._wait_ready()
+
+            self._request_id += 1
+            request = dict(request, id=self._request_id)
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+
+            start = time.time()
+            deadline = start + timeout
+            stdout_done, done = False, None
+
+            while not (stdout_done and done is not None):
+                if output.kill_due():
+                    # Doomed run: stop now rather than at the timeout.
+                    self.restart()
+                    output.feed("stderr", output.killed_note())
+                    return ExecutionResult(label, -9, output.stdout, output.stderr, time.time() - start, "kernel",
+                                           variables={}, namespace_reset=True, killed_reason=output.fatal_match)
+                try:
+                    budget = output.wait_budget(deadline)
+                    if budget <= 0 and not output.kill_due():
+                        raise queue.Empty
+                    stream_name, line = self._events.get(timeout=max(budget, 0))
+                except queue.Empty:
+                    if output.kill_due():
+                        continue
+                    # Hung block: discard the worker, the next call gets a fresh one.
+                    self.restart()
+                    raise subprocess.TimeoutExpired(label, timeout, output.stdout, output.stderr)
+
+                if line is None:
+                    # Worker died (segfault, os._exit, OOM kill ...): report and restart.
+                    crashed_code = self.process.wait() if self.process else -1
+                    self.restart()
+                    output.feed("stderr", f"\nKernel process exited unexpectedly with code {crashed_code}. "
+                                          "All live variables were lost.\n")
+                    if crashed_code == -signal.SIGKILL:
+                        output.feed("stderr", _sigkill_note(None))
+                    return ExecutionResult(label, crashed_code or 1, output.stdout, output.stderr,
+                                           time.time() - start, "kernel", variables={}, namespace_reset=True)
+
+                marker = line.find(f"{_SENTINEL}DONE ")
+                if marker == -1:
+                    output.feed(stream_name, line)
+                    continue
+                if marker > 0:
+                    output.feed(stream_name, line[:marker])
+                payload = line[marker + len(f"{_SENTINEL}DONE "):]
+                if stream_name == "stdout":
+                    stdout_done = True
+                else:
+                    done = json.loads(payload)
+
+            self.last_used = time.time()
+            return ExecutionResult(label, done["returncode"], output.stdout, output.stderr,
+                                   time.time() - start, "kernel", variables=done.get("variables", {}),
+                                   peak_rss_mb=done.get("peak_rss_mb"))
+
+
+# ---------- per-session kernel registry ----------
+_kernels: Dict[str, PersistentKernel] = {}
+_kernels_lock = threading.Lock()
+
+
+def get_kernel(session_id: str) -> PersistentKernel:
+    """Return the warm kernel of a session, starting one if needed."""
+    reap_idle_kernels()
+    with _kernels_lock:
+        kernel = _kernels.get(session_id)
+        if kernel is None:
+            kernel = PersistentKernel(session_id)
+            _kernels[session_id] = kernel
+        kernel.start()
+        return kernel
+
+
+def shutdown_kernel(session_id: str):
+    with _kernels_lock:
+        kernel = _kernels.pop(session_id, None)
+    if kernel is not None:
+        kernel.shutdown()
+
+
+def reset_namespace(session_id: str):
+    """Forget the live variables of a session, e.g. before a new analysis run starts."""
+    with _kernels_lock:
+        kernel = _kernels.get(session_id)
+    if kernel is not None:
+        kernel.reset_namespace()
+
+
+def uses_persistent_namespace(backend: Optional[str] = None) -> bool:
+    return EXECUTION_MODE == "persistent" and (backend or EXECUTOR_BACKEND) == "kernel"
+
+
+def reap_idle_kernels(max_idle: float = KERNEL_IDLE_TIMEOUT):
+    """Shut down kernels of sessions that have not executed anything for a while."""
+    now = time.time()
+    with _kernels_lock:
+        idle = [sid for sid, k in _kernels.items() if not k._lock.locked() and now - k.last_used > max_idle]
+        kernels = [_kernels.pop(sid) for sid in idle]
+    for kernel in kernels:
+        kernel.shutdown()
+
+
+@atexit.register
+def shutdown_all_kernels():
+    with _kernels_lock:
+        kernels = list(_kernels.values())
+        _kernels.clear()
+    for kernel in kernels:
+        kernel.shutdown()
+
+
+# ---------- public entry point ----------
+def _run_subprocess(script_path: str, cwd: str, timeout: float, output: _OutputCollector) -> ExecutionResult:
+    """Run the script in a fresh interpreter, streaming its output line by line."""
+    start = time.time()
+    process = subprocess.Popen(
+        [sys.executable, "-u", os.path.basename(script_path)],
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1,
+    )
+    sampler = _PeakRssSampler(process.pid)
+    events: "queue.Queue" = queue.Queue()
+    for stream_name in ("stdout", "stderr"):
+        threading.Thread(target=_pump, args=(stream_name, getattr(process, stream_name), events), daemon=True).start()
+
+    deadline = start + timeout
+    open_streams = 2
+    while open_streams:
+        if output.kill_due():
+            peak_rss_mb = sampler.stop()
+            process.kill()
+            process.wait()
+            output.feed("stderr", output.killed_note())
+            return ExecutionResult(script_path, -9, output.stdout, output.stderr, time.time() - start, "subprocess",
+                                   killed_reason=output.fatal_match, peak_rss_mb=peak_rss_mb)
+        try:
+            budget = output.wait_budget(deadline)
+            if budget <= 0 and not output.kill_due():
+                raise queue.Empty
+            stream_name, line = events.get(timeout=max(budget, 0))
+        except queue.Empty:
+            if output.kill_due():
+                continue
+            sampler.stop()
+            process.kill()
+            process.wait()
+            raise subprocess.TimeoutExpired(script_path, timeout, output.stdout, output.stderr)
+        if line is None:
+            open_streams -= 1
+        else:
+            output.feed(stream_name, line)
+
+    # Read before the process is reaped, while its /proc entry still belongs to it
+    peak_rss_mb = sampler.stop()
+    returncode = process.wait()
+    if returncode == -signal.SIGKILL:
+        output.feed("stderr", _sigkill_note(peak_rss_mb))
+    return ExecutionResult(script_path, returncode, output.stdout, output.stderr, time.time() - start, "subprocess",
+                           peak_rss_mb=peak_rss_mb)
+
+
+def run_code(session_id: str, source: str, script_path: str, cwd: str,
+             timeout: float = DEFAULT_TIMEOUT, backend: Optional[str] = None,
+             on_output: Optional[OutputCallback] = None, fatal_patterns: Optional[str] = FATAL_PATTERNS) -> ExecutionResult:
+    """
+    Run a code block and return its ExecutionResult.
+    `on_output(stream_name, line)` is called for every line of stdout/stderr as it is produced.
+    A run whose output matches `fatal_patterns` is stopped early (returncode -9); pass None to disable.
+    Raises subprocess.TimeoutExpired when the block exceeds `timeout` seconds.
+    """
+    backend = backend or EXECUTOR_BACKEND
+    if EXECUTION_MODE == "persistent" and backend != "kernel":
+        logging.warning("SCAGENT_EXECUTION_MODE=persistent requires the kernel backend, running isolated.")
+
+    # The script is written for both backends so tracebacks can show source lines.
+    with open(script_path, "w") as f:
+        f.write(source)
+
+    if backend == "kernel":
+        namespace = "persistent" if uses_persistent_namespace(backend) else "isolated"
+        return get_kernel(session_id).execute(source, script_path, cwd, timeout, namespace=namespace,
+                                              on_output=on_output, fatal_patterns=fatal_patterns)
+
+    return _run_subprocess(script_path, cwd, timeout, _OutputCollector(on_output, fatal_patterns))
+
+
+# ---------- async entry point ----------
+_READ_CHUNK = 64 * 1024
+
+
+def _kill_process(process: "asyncio.subprocess.Process"):
+    """Kill a block that is still running; it may have exited since its output was last read."""
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+async def _arun_subprocess(script_path: str, cwd: str, timeout: float, output: _OutputCollector) -> ExecutionResult:
+    """Like _run_subprocess, on asyncio pipes: the event loop keeps serving other sessions while the block runs."""
+    start = time.time()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-u", os.path.basename(script_path),
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    events: "asyncio.Queue" = asyncio.Queue()
+
+    async def pump(stream_name, stream):
+        # Lines are split here: StreamReader's own line reading fails on lines over its 64 KiB limit
+        pending = bytearray()
+        try:
+            while chunk := await stream.read(_READ_CHUNK):
+                pending += chunk
+                end = pending.rfind(b"\n")
+                if end < 0:
+                    continue
+                complete, pending = bytes(pending[:end]), pending[end + 1:]
+                for line in complete.split(b"\n"):
+                    await events.put((stream_name, line.decode(errors="replace") + "\n"))
+            if pending:
+                await events.put((stream_name, pending.decode(errors="replace")))
+        finally:
+            # Always tell the reader the stream is done, or it waits for the deadline
+            events.put_nowait((stream_name, None))
+
+    pumps = [asyncio.create_task(pump(name, getattr(process, name))) for name in ("stdout", "stderr")]
+    sampler = _PeakRssSampler(process.pid)
+    deadline = start + timeout
+    open_streams = 2
+    try:
+        while open_streams:
+            if output.kill_due():
+                peak_rss_mb = sampler.stop()
+                _kill_process(process)
+                await process.wait()
+                output.feed("stderr", output.killed_note())
+                return ExecutionResult(script_path, -9, output.stdout, output.stderr, time.time() - start, "subprocess",
+                                       killed_reason=output.fatal_match, peak_rss_mb=peak_rss_mb)
+            try:
+                budget = output.wait_budget(deadline)
+                if budget <= 0 and not output.kill_due():
+                    raise asyncio.TimeoutError
+                stream_name, line = await asyncio.wait_for(events.get(), timeout=max(budget, 0))
+            except asyncio.TimeoutError:
+                if output.kill_due():
+                    continue
+                _kill_process(process)
+                await process.wait()
+                raise subprocess.TimeoutExpired(script_path, timeout, output.stdout, output.stderr)
+            if line is None:
+                open_streams -= 1
+            else:
+                output.feed(stream_name, line)
+    finally:
+        peak_rss_mb = sampler.stop()
+        for task in pumps:
+            task.cancel()
+
+    returncode = await process.wait()
+    if returncode == -signal.SIGKILL:
+        output.feed("stderr", _sigkill_note(peak_rss_mb))
+    return ExecutionResult(script_path, returncode, output.stdout, output.stderr, time.time() - start, "subprocess",
+                           peak_rss_mb=peak_rss_mb)
+
+
+async def arun_code(session_id: str, source: str, script_path: str, cwd: str,
+                    timeout: float = DEFAULT_TIMEOUT, backend: Optional[str] = None,
+                    on_output: Optional[OutputCallback] = None, fatal_patterns: Optional[str] = FATAL_PATTERNS) -> ExecutionResult:
+    """
+    Async run_code. The subprocess backend runs on asyncio pipes; the kernel backend, whose worker
+    protocol is blocking, runs in a worker thread.
+    """
+    backend = backend or EXECUTOR_BACKEND
+    if backend == "kernel":
+        return await asyncio.to_thread(run_code, session_id, source, script_path, cwd, timeout, backend,
+                                       on_output, fatal_patterns)
+    with open(script_path, "w") as f:
+        f.write(source)
+    return await _arun_subprocess(script_path, cwd, timeout, _OutputCollector(on_output, fatal_patterns))
@@ -0,0 +1,223 @@
+"""
+Persistent memory of execution errors and the fixes that resolved them.
+
+When a code block fails, its error is reduced to a normalized signature (the
+exception line, or the error line the code printed itself, with paths, numbers
+and long literals masked). Then:
+    1. If a deterministic patch is known for the signature (e.g. sparse `.A` ->
+       `.toarray()` on the expression of the failing traceback line, CellTypist
+       model names without `.pkl`), the patched code is re-checked directly,
+       without any LLM call.
+    2. Otherwise, if an earlier task hit the same signature and eventually
+       succeeded, the diff between the failing and the successful code is shown
+       to the reflection and code generator agents on the first retry.
+When a task succeeds after failures, the diff is stored for every signature it
+hit. Every finished task also records how many attempts it needed, so
+iteration_stats() can compare tasks helped by the memory with tasks whose
+errors were new.
+
+Settings (environment variables):
+    SCAGENT_FIX_MEMORY=0        disable the fix memory and deterministic patches
+    SCAGENT_FIX_MEMORY_DIR      store location (default .scagent_cache/fixes)
+"""
+import os
+import re
+import time
+import sqlite3
+import difflib
+import hashlib
+import threading
+from contextlib import closing
+from typing import Dict, Optional, Tuple
+
+FIX_MEMORY_ENABLED = os.environ.get("SCAGENT_FIX_MEMORY", "1") != "0"
+FIX_MEMORY_DIR = os.path.abspath(os.environ.get("SCAGENT_FIX_MEMORY_DIR", os.path.join(".scagent_cache", "fixes")))
+
+_MAX_DIFF_LINES = 40
+_db_lock = threading.Lock()
+
+_EXCEPTION_LINE_RE = re.compile(r"^([A-Za-z_][\w.]*(Error|Exception|Warning|Exit)|KeyboardInterrupt)\b.*")
+_PRINTED_ERROR_RE = re.compile(r"error|failed|🛑|exception|not found|no such", re.IGNORECASE)
+
+
+# ---------- signatures ----------
+def _error_line(stdout: str, stderr: str) -> str:
+    """The line that best describes the failure: last exception in stderr, else the last error printed to stdout."""
+    for line in reversed(stderr.strip().splitlines()):
+        if _EXCEPTION_LINE_RE.match(line.strip()):
+            return line.strip()
+    for line in reversed(stdout.strip().splitlines()):
+        if _PRINTED_ERROR_RE.search(line):
+            return line.strip()
+    lines = (stderr.strip() or stdout.strip()).splitlines()
+    return lines[-1].strip() if lines else ""
+
+
+def normalize_error(line: str) -> str:
+    line = re.sub(r"(?:[A-Za-z]:)?(?:/[^\s'\"():,]+)+", "<path>", line)
+    line = re.sub(r"0x[0-9a-fA-F]+", "<addr>", line)
+    line = re.sub(r"\b\d+(\.\d+)?\b", "<n>", line)
+    line = re.sub(r"(['\"])[^'\"]{40,}\1", "<str>", line)
+    return re.sub(r"\s+", " ", line).strip()[:300]
+
+
+def error_signature(stdout: str, stderr: str) -> str:
+    return normalize_error(_error_line(stdout or "", stderr or ""))
+
+
+def _signature_hash(signature: str) -> str:
+    return hashlib.sha1(signature.encode("utf-8")).hexdigest()
+
+
+# ---------- deterministic patches ----------
+_FRAME_RE = re.compile(r'^\s*File "[^"]+", line \d+')
+_SPARSE_TYPE = r"'(?:(?:csr|csc|coo|bsr|dia|dok|lil)_(?:matrix|array)|spmatrix|sparray)'"
+
+
+def _frame_lines(traceback: str) -> list:
+    """Source lines of the traceback frames, outermost first."""
+    lines = traceback.splitlines()
+    return [lines[i + 1].strip() for i, line in enumerate(lines[:-1]) if _FRAME_RE.match(line)]
+
+
+def _sparse_dense(attribute: str, replacement: str):
+    """Patch that rewrites `<expr>.<attribute>` only for the expression on the failing line of the traceback."""
+    expression_re = re.compile(rf"([A-Za-z_][\w.]*(?:\[[^\]\n]*\])*)\.{attribute}\b(?!\s*=)")
+
+    def patch(match: re.Match, source: str, traceback: str) -> str:
+        for line in reversed(_frame_lines(traceback)):
+            expressions = set(expression_re.findall(line))
+            if expressions:
+                for expression in expressions:
+                    source = re.sub(rf"(?<![\w.]){re.escape(expression)}\.{attribute}\b(?!\s*=)",
+                                    lambda m: f"{expression}{replacement}", source)
+                return source
+        return source
+    return patch
+
+
+def _celltypist_pkl(match: re.Match, source: str, traceback: str) -> str:
+    model = re.escape(match.group(1))
+    return re.sub(rf"(['\"]){model}\1", lambda m: f"{m.group(1)}{match.group(1)}.pkl{m.group(1)}", source)
+
+
+# (signature pattern, description, patch(match, source, traceback) -> source)
+DETERMINISTIC_PATCHES = [
+    (re.compile(rf"{_SPARSE_TYPE} object has no attribute 'A1'"), "sparse `.A1` -> `.toarray().ravel()`",
+     _sparse_dense("A1", ".toarray().ravel()")),
+    (re.compile(rf"{_SPARSE_TYPE} object has no attribute 'A'"), "sparse `.A` -> `.toarray()`",
+     _sparse_dense("A", ".toarray()")),
+    (re.compile(r"module 'numpy' has no attribute '(float|int|bool|object|complex|str)'"),
+     "removed numpy aliases (np.float, np.int, ...) -> builtins",
+     lambda match, source, traceback: re.sub(rf"\b(np|numpy)\.{match.group(1)}\b(?!\w)", match.group(1), source)),
+    (re.compile(r"No such file: ([A-Za-z0-9_]+)$"), "CellTypist model names need the `.pkl` extension",
+     _celltypist_pkl),
+]
+
+
+def apply_patches(signature: str, *sources: str, traceback: str = "") -> Optional[Tuple[str, tuple]]:
+    """
+    Apply the first deterministic patch matching `signature` that changes the code; returns (description, sources).
+    `traceback` is the stderr of the failed run: patches that depend on the failing line only rewrite that expression.
+    """
+    if not FIX_MEMORY_ENABLED:
+        return None
+    for pattern, description, patch in DETERMINISTIC_PATCHES:
+        match = pattern.search(signature)
+        if not match:
+            continue
+        patched = tuple(patch(match, source, traceback) for source in sources)
+        if patched != sources:
+            return description, patched
+    return None
+
+
+# ---------- storage ----------
+def _connect() -> sqlite3.Connection:
+    os.makedirs(FIX_MEMORY_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(FIX_MEMORY_DIR, "fixes.sqlite"), timeout=30)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS fixes (
+            signature_hash TEXT PRIMARY KEY,
+            signature TEXT NOT NULL,
+            task TEXT NOT NULL,
+            diff TEXT NOT NULL,
+            successes INTEGER NOT NULL,
+            hits INTEGER NOT NULL,
+            updated REAL NOT NULL
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS task_outcomes (
+            finished REAL NOT NULL,
+            iterations INTEGER NOT NULL,
+            failures INTEGER NOT NULL,
+            helped INTEGER NOT NULL
+        )"""
+    )
+    return conn
+
+
+def lookup_fix(signature: str) -> Optional[Dict]:
+    if not FIX_MEMORY_ENABLED or not signature:
+        return None
+    with _db_lock, closing(_connect()) as conn:
+        row = conn.execute("SELECT task, diff, successes FROM fixes WHERE signature_hash = ?",
+                           (_signature_hash(signature),)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE fixes SET hits = hits + 1 WHERE signature_hash = ?", (_signature_hash(signature),))
+        conn.commit()
+    return {"task": row[0], "diff": row[1], "successes": row[2]}
+
+
+def code_diff(failed_code: str, fixed_code: str) -> str:
+    diff = list(difflib.unified_diff(failed_code.splitlines(), fixed_code.splitlines(),
+                                     "failing", "fixed", n=1, lineterm=""))
+    if len(diff) > _MAX_DIFF_LINES:
+        diff = diff[:_MAX_DIFF_LINES] + [f"... ({len(diff) - _MAX_DIFF_LINES} more diff lines)"]
+    return "\n".join(diff)
+
+
+def record_fix(signature: str, task: str, failed_code: str, fixed_code: str):
+    """Remember the change that turned code failing with `signature` into code that ran."""
+    if not FIX_MEMORY_ENABLED or not signature:
+        return
+    diff = code_diff(failed_code, fixed_code)
+    if not diff:
+        return
+    with _db_lock, closing(_connect()) as conn:
+        conn.execute(
+            """INSERT INTO fixes VALUES (?, ?, ?, ?, 1, 0, ?)
+               ON CONFLICT(signature_hash) DO UPDATE SET task = excluded.task, diff = excluded.diff,
+               successes = successes + 1, updated = excluded.updated""",
+            (_signature_hash(signature), signature, task, diff, time.time()),
+        )
+        conn.commit()
+
+
+def record_task_outcome(iterations: int, failures: int, helped: bool):
+    if not FIX_MEMORY_ENABLED:
+        return
+    with _db_lock, closing(_connect()) as conn:
+        conn.execute("INSERT INTO task_outcomes VALUES (?, ?, ?, ?)", (time.time(), iterations, failures, int(helped)))
+        conn.commit()
+
+
+def iteration_stats() -> Dict[str, float]:
+    """Average attempts to success: all tasks, tasks helped by the memory, and failing tasks it could not help."""
+    with _db_lock, closing(_connect()) as conn:
+        def average(where: str) -> Tuple[int, float]:
+            count, mean = conn.execute(f"SELECT COUNT(*), COALESCE(AVG(iterations), 0) FROM task_outcomes WHERE {where}").fetchone()
+            return count, round(mean, 2)
+        tasks, overall = average("1")
+        helped_tasks, helped = average("helped = 1")
+        unhelped_tasks, unhelped = average("helped = 0 AND failures > 0")
+    return {
+        "tasks": tasks,
+        "avg_iterations": overall,
+        "helped_tasks": helped_tasks,
+        "avg_iterations_with_known_fix": helped,
+        "new_error_tasks": unhelped_tasks,
+        "avg_iterations_with_new_errors": unhelped,
+    }
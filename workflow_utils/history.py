@@ -0,0 +1,101 @@
+"""
+Token-budgeted conversation history for the conductor and front desk agents.
+
+The last HISTORY_KEEP_TURNS turns (a user message and the replies that follow
+it) are shown verbatim, as many as fit in the agent's token budget. Everything
+older is folded into a running summary. The summary is updated incrementally:
+only the messages that newly fell out of the verbatim window are summarized,
+together with the previous summary, and the number of messages it covers is
+kept in state (history_summary / history_summary_covered).
+
+Settings (environment variables):
+    SCAGENT_HISTORY_KEEP_TURNS              turns kept verbatim at most (default 4)
+    SCAGENT_HISTORY_TOKENS_CONDUCTOR        history budget of the conductor (default 1500)
+    SCAGENT_HISTORY_TOKENS_FRONTDESK        history budget of the front desk (default 3000)
+    SCAGENT_HISTORY_SUMMARY_TOKENS          size cap of the running summary (default 400)
+"""
+import os
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from .tokens import count_tokens, truncate_to_tokens
+
+HISTORY_KEEP_TURNS = int(os.environ.get("SCAGENT_HISTORY_KEEP_TURNS", "4"))
+HISTORY_TOKEN_BUDGETS = {
+    "conductor": int(os.environ.get("SCAGENT_HISTORY_TOKENS_CONDUCTOR", "1500")),
+    "frontdesk": int(os.environ.get("SCAGENT_HISTORY_TOKENS_FRONTDESK", "3000")),
+}
+HISTORY_SUMMARY_TOKENS = int(os.environ.get("SCAGENT_HISTORY_SUMMARY_TOKENS", "400"))
+
+
+def render_message(message: BaseMessage) -> str:
+    role = "User" if isinstance(message, HumanMessage) else "Assistant"
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return f"{role}: {content.removeprefix('User prompt: ')}"
+
+
+def _turn_starts(messages: Sequence[BaseMessage]) -> List[int]:
+    """Indices where a turn (a user message and its replies) begins."""
+    starts = [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return starts
+
+
+def verbatim_cutoff(messages: Sequence[BaseMessage], budget_tokens: int, keep_turns: int = HISTORY_KEEP_TURNS) -> int:
+    """Index of the first message shown verbatim: the last `keep_turns` turns that fit in the budget."""
+    # Leave room for the running summary
+    available = budget_tokens - HISTORY_SUMMARY_TOKENS
+    per_message_cap = max(budget_tokens // 3, 50)
+    cutoff = len(messages)
+    used = 0
+    for start in reversed(_turn_starts(messages)[-keep_turns:] if keep_turns > 0 else []):
+        turn_tokens = sum(min(count_tokens(render_message(m)), per_message_cap) for m in messages[start:cutoff])
+        if used + turn_tokens > available and cutoff != len(messages):
+            break
+        used += turn_tokens
+        cutoff = start
+    return cutoff
+
+
+def compact_history(
+    messages: Optional[Sequence[BaseMessage]],
+    agent: str,
+    summary: Optional[str],
+    covered: Optional[int],
+    summarize: Callable[[str, str], str],
+) -> Tuple[str, Dict]:
+    """
+    Render the conversation for `agent` within its token budget.
+
+    `summarize(previous_summary, new_messages_text)` returns the updated summary.
+    Returns the history text and the state update ({"history_summary", "history_summary_covered"}).
+    """
+    messages = list(messages or [])
+    summary = summary or ""
+    covered = min(covered or 0, len(messages))
+    budget = HISTORY_TOKEN_BUDGETS.get(agent, 2000)
+    if not messages:
+        return "No History", {}
+
+    cutoff = max(verbatim_cutoff(messages, budget), covered)
+    update = {}
+    if cutoff > covered:
+        # Only the messages that left the verbatim window since the last update are summarized
+        delta = "\n".join(render_message(m) for m in messages[covered:cutoff])
+        summary = truncate_to_tokens(summarize(summary, truncate_to_tokens(delta, 4 * HISTORY_SUMMARY_TOKENS)), HISTORY_SUMMARY_TOKENS)
+        covered = cutoff
+        update = {"history_summary": summary, "history_summary_covered": covered}
+        logging.info(f"History summary updated to cover {covered} messages ({count_tokens(summary)} tokens)")
+
+    per_message_cap = max(budget // 3, 50)
+    recent = [truncate_to_tokens(render_message(m), per_message_cap) for m in messages[cutoff:]]
+    parts = []
+    if summary:
+        parts.append(f"Summary of the earlier conversation:\n{summary}")
+    if recent:
+        parts.append("Most recent messages:\n" + "\n".join(recent))
+    history = truncate_to_tokens("\n\n".join(parts), budget)
+    return history, update
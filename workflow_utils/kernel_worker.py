@@ -0,0 +1,220 @@
+"""
+Long-lived Python worker used by the persistent execution kernel.
+
+The worker pre-imports the heavy scientific stack once and then executes code
+blocks sent by the parent process (see executor.py) one at a time.
+
+Blocks run either in a fresh namespace ("isolated") or in a namespace that is
+kept across blocks ("persistent"), so objects such as an AnnData loaded by one
+plan step are handed to the next one without touching disk. A persistent block
+runs on a shallow copy of the session namespace that is only committed when the
+block succeeds; in-place mutations of existing objects cannot be rolled back.
+
+After every block the worker reports the block's peak resident memory: the
+high-water mark (VmHWM) is reset before the block runs, where Linux allows it.
+Memory freed by the block is then handed back to the OS (gc and malloc_trim),
+so an idle worker does not keep the footprint of its largest step.
+
+Protocol (one JSON object per line):
+    parent -> worker (stdin):   {"id": int, "source": str, "script_path": str, "cwd": str, "namespace": str}
+    parent -> worker (stdin):   {"id": int, "command": "reset"}
+    worker -> parent (stderr):  SENTINEL + "READY " + json    once, after pre-imports
+    worker -> parent (stdout):  SENTINEL + "DONE " + id       after every block
+    worker -> parent (stderr):  SENTINEL + "DONE " + json     after every block (returncode, duration, peak_rss_mb, variables)
+
+Everything else written to stdout/stderr is the output of the executed code.
+This file only depends on the standard library so it can be launched by path.
+"""
+import gc
+import os
+import sys
+import json
+import ctypes
+import time
+import types
+import builtins
+import importlib
+import traceback
+
+SENTINEL = "\x1eSCAGENT_"
+_MAX_SUMMARY_CHARS = 600
+
+# Variables kept between blocks in "persistent" mode.
+_session_namespace = {}
+_HOME = os.getcwd()
+
+
+def _preimport(modules):
+    loaded, failed = [], []
+    for module_name in modules:
+        try:
+            importlib.import_module(module_name)
+            loaded.append(module_name)
+        except Exception:
+            failed.append(module_name)
+    return loaded, failed
+
+
+def _describe(value):
+    """Short, human-readable description of a live variable for the code generator."""
+    type_name = type(value).__name__
+    try:
+        if type_name == "AnnData":
+            description = repr(value)
+        elif type_name in ("DataFrame", "Series"):
+            description = f"pandas.{type_name} with shape {value.shape}"
+            if type_name == "DataFrame":
+                description += f", columns {list(value.columns)[:20]}"
+        elif hasattr(value, "shape") and hasattr(value, "dtype"):
+            description = f"{type(value).__module__}.{type_name} with shape {value.shape}, dtype {value.dtype}"
+        elif isinstance(value, (bool, int, float, complex, str, bytes)):
+            description = f"{type_name} = {value!r}"
+        elif isinstance(value, (list, tuple, set, dict)):
+            description = f"{type_name} of length {len(value)}"
+        else:
+            description = f"{type(value).__module__}.{type_name}"
+    except Exception:
+        description = type_name
+    if len(description) > _MAX_SUMMARY_CHARS:
+        description = description[:_MAX_SUMMARY_CHARS] + " ..."
+    return description
+
+
+def _summarize_namespace(namespace):
+    summary = {}
+    for name, value in namespace.items():
+        if name.startswith("_") or name in ("In", "Out"):
+            continue
+        if isinstance(value, (types.ModuleType, types.FunctionType, types.BuiltinFunctionType, type)):
+            continue
+        summary[name] = _describe(value)
+    return summary
+
+
+def _reset_peak_rss():
+    """Reset the resident memory high-water mark (Linux), so the next reading covers one block only."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _release_memory():
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def _reset_namespace():
+    global _session_namespace
+    _session_namespace = {}
+    return 0
+
+
+def _run_block(request):
+    """Execute one code block the same way `python script.py` would."""
+    global _session_namespace
+    script_path = request["script_path"]
+    persistent = request.get("namespace") == "persistent"
+    namespace = dict(_session_namespace) if persistent else {}
+    namespace.update({
+        "__name__": "__main__",
+        "__file__": script_path,
+        "__builtins__": builtins,
+    })
+    sys.argv = [script_path]
+    sys.path[0] = os.path.dirname(script_path)
+    os.chdir(request["cwd"])
+
+    returncode = 0
+    try:
+        code_object = compile(request["source"], script_path, "exec")
+        exec(code_object, namespace)
+    except SystemExit as e:
+        if e.code is None:
+            returncode = 0
+        elif isinstance(e.code, int):
+            returncode = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            returncode = 1
+    except BaseException:
+        # Skip this function's frame so the traceback looks like a plain script run.
+        exc_type, exc_value, exc_tb = sys.exc_info()
+        traceback.print_exception(exc_type, exc_value, exc_tb.tb_next)
+        returncode = 1
+    finally:
+        # Figures left open by a block would otherwise accumulate in the worker.
+        if "matplotlib.pyplot" in sys.modules:
+            sys.modules["matplotlib.pyplot"].close("all")
+        # The block's sandbox is deleted after the run, so do not stay inside it.
+        os.chdir(_HOME)
+
+    if persistent and returncode == 0:
+        _session_namespace = namespace
+    return returncode
+
+
+def main():
+    # Keep a private handle on the protocol channel and detach fd 0, so code
+    # calling input() can never consume the next request.
+    protocol_in = os.fdopen(os.dup(0), "r", encoding="utf-8")
+    devnull_fd = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull_fd, 0)
+    sys.stdin = open(os.devnull, "r")
+
+    # Launched by path, so drop this directory from sys.path.
+    sys.path[0] = os.getcwd()
+
+    preimports = [m for m in os.environ.get("SCAGENT_KERNEL_PREIMPORTS", "").split(",") if m.strip()]
+    start = time.time()
+    loaded, failed = _preimport([m.strip() for m in preimports])
+    ready = {"pid": os.getpid(), "loaded": loaded, "failed": failed, "seconds": time.time() - start}
+    sys.stderr.write(f"{SENTINEL}READY {json.dumps(ready)}\n")
+    sys.stderr.flush()
+
+    for line in protocol_in:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        start = time.time()
+        _reset_peak_rss()
+        if request.get("command") == "reset":
+            returncode = _reset_namespace()
+        else:
+            returncode = _run_block(request)
+        duration = time.time() - start
+        peak_rss_mb = _peak_rss_mb()
+        _release_memory()
+
+        # Blocks may have swapped the streams; always report on the real ones.
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+        done = {
+            "id": request["id"],
+            "returncode": returncode,
+            "duration": duration,
+            "peak_rss_mb": peak_rss_mb,
+            "variables": _summarize_namespace(_session_namespace),
+        }
+        sys.stdout.write(f"{SENTINEL}DONE {request['id']}\n")
+        sys.stdout.flush()
+        sys.stderr.write(f"{SENTINEL}DONE {json.dumps(done)}\n")
+        sys.stderr.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Single place where the agent chains get their chat models.
+
+Deterministic (temperature=0) models share the local response cache from
+llm_cache.py; sampling models only use it when asked to (e.g. the code
+generator with SCAGENT_LLM_CACHE_CODEGEN=1).
+
+Settings (environment variables):
+    SCAGENT_LLM_FACTORY     "module:function" called instead of ChatOpenAI with the same
+                            arguments (model, temperature, cache, ...), e.g. to run the
+                            benchmarks against a simulated model
+"""
+import os
+import importlib
+from functools import lru_cache
+from typing import Callable, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_openai import ChatOpenAI
+
+from .llm_cache import get_llm_cache
+
+LLM_FACTORY = os.environ.get("SCAGENT_LLM_FACTORY", "")
+
+
+@lru_cache(maxsize=None)
+def _load_factory(spec: str) -> Callable[..., BaseChatModel]:
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def make_chat_model(model: str, temperature: float = 0, cached: Optional[bool] = None, **kwargs) -> BaseChatModel:
+    """Build a chat model; `cached` defaults to True for temperature=0 models."""
+    if cached is None:
+        cached = temperature == 0
+    cache = get_llm_cache() if cached else None
+    # cache=False (rather than None) so no global cache is picked up either.
+    factory = _load_factory(LLM_FACTORY) if LLM_FACTORY else ChatOpenAI
+    return factory(model=model, temperature=temperature, cache=cache if cache is not None else False, **kwargs)
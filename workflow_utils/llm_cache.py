@@ -0,0 +1,193 @@
+"""
+Local response cache shared by the agent chains.
+
+A LangChain BaseCache backed by SQLite. Entries are keyed on the serialized
+model configuration (model name, temperature, bound tools and structured-output
+schema, as built by LangChain's llm_string) together with the serialized prompt,
+so a byte-identical request to an identically configured chain is answered
+locally. Entries expire after a TTL and the least recently used ones are dropped
+once the cache grows past its size budget.
+
+Cached generations are returned with zeroed token usage, so get_openai_callback
+only counts what was actually spent; what the hit would have cost is tracked in
+llm_cache_stats() instead.
+
+Settings (environment variables):
+    SCAGENT_LLM_CACHE=0                 disable the cache entirely
+    SCAGENT_LLM_CACHE_DIR               cache location (default .scagent_cache/llm)
+    SCAGENT_LLM_CACHE_TTL_HOURS         entries older than this are ignored and dropped (default 168)
+    SCAGENT_LLM_CACHE_MAX_MB            size budget before LRU eviction (default 256)
+    SCAGENT_LLM_CACHE_CODEGEN=1         also cache the (temperature=1) code generator
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import warnings
+import threading
+from contextlib import closing
+from typing import Any, Dict, Optional
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+LLM_CACHE_ENABLED = os.environ.get("SCAGENT_LLM_CACHE", "1") != "0"
+LLM_CACHE_DIR = os.path.abspath(os.environ.get("SCAGENT_LLM_CACHE_DIR", os.path.join(".scagent_cache", "llm")))
+LLM_CACHE_TTL = float(os.environ.get("SCAGENT_LLM_CACHE_TTL_HOURS", "168")) * 3600
+LLM_CACHE_MAX_BYTES = int(float(os.environ.get("SCAGENT_LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
+LLM_CACHE_CODEGEN = os.environ.get("SCAGENT_LLM_CACHE_CODEGEN", "0") == "1"
+
+_EVICT_EVERY = 50               # Run eviction after this many stores
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0,
+          "saved_prompt_tokens": 0, "saved_completion_tokens": 0, "saved_cost": 0.0}
+_stats_lock = threading.Lock()
+
+
+def _token_cost(model_name: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Price of a request according to the table used by get_openai_callback (0 for unknown models)."""
+    from langchain_community.callbacks.openai_info import (
+        MODEL_COST_PER_1K_TOKENS, TokenType, get_openai_token_cost_for_model, standardize_model_name,
+    )
+    model_name = standardize_model_name(model_name or "")
+    if model_name not in MODEL_COST_PER_1K_TOKENS:
+        return 0.0
+    return (get_openai_token_cost_for_model(model_name, prompt_tokens, token_type=TokenType.PROMPT)
+            + get_openai_token_cost_for_model(model_name, completion_tokens, token_type=TokenType.COMPLETION))
+
+
+class SQLiteLLMCache(BaseCache):
+    """SQLite-backed LLM cache with TTL expiry and size-based LRU eviction."""
+
+    def __init__(self, cache_dir: str = LLM_CACHE_DIR, ttl: float = LLM_CACHE_TTL, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stores_since_evict = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(self.cache_dir, "responses.sqlite"), timeout=30)
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                generations TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        return conn
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        with self._lock, closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT generations FROM responses WHERE key = ? AND created > ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+        if row is None:
+            with _stats_lock:
+                _stats["misses"] += 1
+            return None
+        try:
+            with warnings.catch_warnings():
+                warnings.filterwarnings("ignore", message=".*`loads` is in beta")
+                generations = loads(row[0])
+        except Exception as e:
+            logging.warning(f"LLM cache: could not load entry {key[:12]} ({e}), calling the model instead")
+            return None
+        self._record_hit(generations)
+        return generations
+
+    def _record_hit(self, generations: list):
+        prompt_tokens = completion_tokens = 0
+        cost = 0.0
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None)
+            if not usage:
+                continue
+            prompt_tokens += usage.get("input_tokens", 0)
+            completion_tokens += usage.get("output_tokens", 0)
+            cost += _token_cost(message.response_metadata.get("model_name", ""),
+                                usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+            # Nothing was spent on this response; keep get_openai_callback honest.
+            message.usage_metadata = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+        with _stats_lock:
+            _stats["hits"] += 1
+            _stats["saved_prompt_tokens"] += prompt_tokens
+            _stats["saved_completion_tokens"] += completion_tokens
+            _stats["saved_cost"] += cost
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        payload = dumps(return_val)
+        if len(payload) > self.max_bytes // 2:
+            return
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (self._key(prompt, llm_string), payload, len(payload), now, now),
+            )
+            conn.commit()
+            self._stores_since_evict += 1
+            due = self._stores_since_evict >= _EVICT_EVERY
+        with _stats_lock:
+            _stats["stores"] += 1
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under the size budget."""
+        with self._lock, closing(self._connect()) as conn:
+            evicted = conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+            conn.commit()
+            self._stores_since_evict = 0
+        if evicted:
+            with _stats_lock:
+                _stats["evictions"] += evicted
+            logging.info(f"LLM cache: evicted {evicted} entries")
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+
+_shared_cache: Optional[SQLiteLLMCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[BaseCache]:
+    """The process-wide response cache, or None when caching is disabled."""
+    global _shared_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = SQLiteLLMCache()
+    return _shared_cache
+
+
+def llm_cache_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
@@ -0,0 +1,103 @@
+"""
+Keeps the inner analysis messages small.
+
+    - Each task starts a new message window: get_next_task removes the previous
+      task's messages and replaces them with a short digest of the plan and of
+      the completed tasks (see task_digest).
+    - Error dumps are trimmed before they enter the window: tracebacks keep their
+      header, the first frame and the last frames plus the exception, and only
+      the tail of stdout is kept (see format_execution_error).
+    - Identical messages (the same error hit twice, the same retry note) are only
+      sent once to the LLM (see dedupe_messages).
+
+Settings (environment variables):
+    SCAGENT_TRACEBACK_FRAMES      innermost traceback frames kept (default 4)
+    SCAGENT_ERROR_STDOUT_LINES    trailing stdout lines kept in error messages (default 20)
+"""
+import os
+import re
+from typing import List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage
+
+TRACEBACK_FRAMES = int(os.environ.get("SCAGENT_TRACEBACK_FRAMES", "4"))
+ERROR_STDOUT_LINES = int(os.environ.get("SCAGENT_ERROR_STDOUT_LINES", "20"))
+_MAX_STDERR_LINES = 60          # Non-traceback stderr lines kept (warnings, logs)
+_MAX_LINE_CHARS = 500
+
+_FRAME_RE = re.compile(r'^\s*File "')
+
+
+def _clip(line: str) -> str:
+    return line if len(line) <= _MAX_LINE_CHARS else line[:_MAX_LINE_CHARS] + " ..."
+
+
+def _unique_lines(lines: List[str]) -> List[str]:
+    """Collapse repeated lines (e.g. the same warning printed for every batch)."""
+    seen, kept = set(), []
+    for line in lines:
+        if line in seen:
+            continue
+        seen.add(line)
+        kept.append(line)
+    return kept
+
+
+def truncate_traceback(stderr: str, frames: int = TRACEBACK_FRAMES) -> str:
+    """Shorten stderr: keep the outermost and the innermost `frames` frames of the last traceback."""
+    lines = [_clip(line.rstrip()) for line in stderr.strip().splitlines()]
+    start = max((i for i, line in enumerate(lines) if line.startswith("Traceback (most recent call last)")), default=None)
+    if start is None:
+        lines = _unique_lines(lines)
+        if len(lines) > _MAX_STDERR_LINES:
+            lines = [f"... ({len(lines) - _MAX_STDERR_LINES} earlier lines omitted) ..."] + lines[-_MAX_STDERR_LINES:]
+        return "\n".join(lines)
+
+    preamble = _unique_lines(lines[:start])[-10:]
+    body = lines[start + 1:]
+    # A frame is its `File "..."` line plus the source lines after it; the exception follows the last frame.
+    frame_starts = [i for i, line in enumerate(body) if _FRAME_RE.match(line)]
+    if len(frame_starts) <= frames + 1:
+        return "\n".join(preamble + lines[start:])
+    first_frame = body[frame_starts[0]:frame_starts[1]]
+    last_frames = body[frame_starts[-frames]:]
+    omitted = len(frame_starts) - frames - 1
+    return "\n".join(preamble + [lines[start]] + first_frame + [f"  ... ({omitted} frames omitted) ..."] + last_frames)
+
+
+def format_execution_error(stdout: str, stderr: str) -> str:
+    """Compact error message for a failed code block."""
+    stdout_lines = stdout.strip().splitlines()
+    if len(stdout_lines) > ERROR_STDOUT_LINES:
+        stdout_lines = [f"... ({len(stdout_lines) - ERROR_STDOUT_LINES} earlier lines omitted) ..."] + stdout_lines[-ERROR_STDOUT_LINES:]
+    stdout_text = "\n".join(_clip(line) for line in stdout_lines)
+    return f"Code execution failed with error:\n\nStdout: {stdout_text}\n\nStderr: {truncate_traceback(stderr)}"
+
+
+def dedupe_messages(messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """Drop messages whose content repeats a later message; the latest occurrence is kept."""
+    seen, kept = set(), []
+    for message in reversed(list(messages)):
+        key = (message.type, str(message.content))
+        if key in seen:
+            continue
+        seen.add(key)
+        kept.append(message)
+    return kept[::-1]
+
+
+def task_digest(plan: List[str], current_task_index: int, completed: Optional[List[int]] = None) -> str:
+    """
+    Short context carried into a new task window instead of the earlier tasks' messages.
+    `completed` lists the finished step indices when steps run out of order (parallel runs).
+    """
+    steps = "\n".join(f"{idx+1}. {step}" for idx, step in enumerate(plan))
+    if completed is not None:
+        if not completed:
+            return f"Here are the list of tasks to be achieved:\n{steps}"
+        return (f"Here are the list of tasks to be achieved:\n{steps}\n\n"
+                f"Tasks {', '.join(str(idx + 1) for idx in completed)} completed successfully.")
+    if current_task_index == 0:
+        return f"Here are the list of tasks to be achieved:\n{steps}"
+    return (f"Here are the list of tasks to be achieved:\n{steps}\n\n"
+            f"Tasks 1-{current_task_index} completed successfully.")
@@ -0,0 +1,103 @@
+"""
+Sync and async variants of a graph node from a single definition.
+
+A node is written once, as a generator that yields its blocking work instead of
+doing it, and receives the result back:
+
+    result = yield chain, inputs                    # LLM chain: invoke / ainvoke
+    results = yield [(chain, inputs), ...]          # several chains: one after the other / concurrently
+    value = yield Blocking(fn, *args)               # other blocking work: direct call / worker thread
+    value = yield Blocking(fn, *args, afn=afn)      # ... with a native coroutine for the async graph
+
+@dual_node turns the generator into the regular (sync) node function and attaches
+the async variant as its `afunc` attribute; as_runnable() builds the
+RunnableLambda(func, afunc=...) used by the graph, so `app.invoke` and
+`app.ainvoke` / `app.astream` both work. Exceptions raised by the work are thrown
+back into the generator at the yield, so try/except around a yield behaves like
+try/except around the call.
+"""
+import asyncio
+import functools
+from typing import Any, Callable, Generator, Optional
+
+from langchain_core.runnables import Runnable, RunnableLambda
+
+
+class Blocking:
+    """Blocking work yielded by a node: run directly by the sync node, in a thread (or via `afn`) by the async one."""
+
+    def __init__(self, fn: Callable, *args, afn: Optional[Callable] = None, **kwargs):
+        self.fn = fn
+        self.afn = afn
+        self.args = args
+        self.kwargs = kwargs
+
+
+def _run(request) -> Any:
+    if isinstance(request, list):
+        return [_run(item) for item in request]
+    if isinstance(request, Blocking):
+        return request.fn(*request.args, **request.kwargs)
+    chain, inputs = request
+    return chain.invoke(inputs)
+
+
+async def _arun(request) -> Any:
+    if isinstance(request, list):
+        return list(await asyncio.gather(*(_arun(item) for item in request)))
+    if isinstance(request, Blocking):
+        if request.afn is not None:
+            return await request.afn(*request.args, **request.kwargs)
+        return await asyncio.to_thread(request.fn, *request.args, **request.kwargs)
+    chain, inputs = request
+    return await chain.ainvoke(inputs)
+
+
+def drive(steps: Generator) -> Any:
+    """Run a node generator to completion, doing its work synchronously."""
+    value, error = None, None
+    while True:
+        try:
+            request = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as done:
+            return done.value
+        value, error = None, None
+        try:
+            value = _run(request)
+        except Exception as e:
+            error = e
+
+
+async def adrive(steps: Generator) -> Any:
+    """Run a node generator to completion, awaiting its work."""
+    value, error = None, None
+    while True:
+        try:
+            request = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as done:
+            return done.value
+        value, error = None, None
+        try:
+            value = await _arun(request)
+        except Exception as e:
+            error = e
+
+
+def dual_node(steps: Callable[..., Generator]) -> Callable:
+    """Sync node function built from a node generator, with the async variant as `.afunc`."""
+    @functools.wraps(steps)
+    def node(*args, **kwargs):
+        return drive(steps(*args, **kwargs))
+
+    @functools.wraps(steps)
+    async def anode(*args, **kwargs):
+        return await adrive(steps(*args, **kwargs))
+
+    node.afunc = anode
+    return node
+
+
+def as_runnable(func: Callable) -> Runnable:
+    """RunnableLambda for a graph node, async-capable when the node has an `afunc` variant."""
+    afunc = getattr(func, "afunc", None)
+    return RunnableLambda(func, afunc=afunc) if afunc is not None else RunnableLambda(func)
@@ -0,0 +1,121 @@
+"""
+Compact, token-budgeted view of what previous steps printed.
+
+Every successful step leaves one structured record (saved files, data shapes,
+key numeric lines and a head/tail excerpt of its stdout) instead of adding its
+raw stdout to the prompt. format_output_records() renders the records under a
+token budget: every step gets at least a one-line summary (task and saved files),
+and the remaining budget upgrades the most recent steps to their key facts and
+then to their excerpts. When even the one-line summaries do not fit, the oldest
+steps are folded into a single "N earlier steps" line.
+
+Settings (environment variables):
+    SCAGENT_CODEGEN_OUTPUT_TOKENS     budget for the code generator's output_messages (default 1500)
+    SCAGENT_REPORT_OUTPUT_TOKENS      budget for the reporter's input (default 6000)
+"""
+import os
+import re
+from typing import List, Optional
+
+from .tokens import count_tokens
+
+CODEGEN_OUTPUT_TOKENS = int(os.environ.get("SCAGENT_CODEGEN_OUTPUT_TOKENS", "1500"))
+REPORT_OUTPUT_TOKENS = int(os.environ.get("SCAGENT_REPORT_OUTPUT_TOKENS", "6000"))
+
+_MAX_FILES = 20                 # Saved files kept per step
+_MAX_FACTS = 15                 # Key lines kept per step
+_EXCERPT_HEAD = 15              # Leading stdout lines kept per step
+_EXCERPT_TAIL = 25              # Trailing stdout lines kept per step
+_MAX_LINE_CHARS = 300
+
+_PATH_RE = re.compile(r"(?:[A-Za-z]:)?(?:/[\w.\-+@~ ]*[\w.\-+@~])+\.[A-Za-z0-9]{1,6}\b")
+_SHAPE_RE = re.compile(r"n_obs\s*[×x]\s*n_vars\s*=\s*\d+\s*[×x]\s*\d+|\(\d+,\s*\d+(?:,\s*\d+)*\)")
+_KEYWORD_RE = re.compile(
+    r"\b(saved|written|wrote|found|detected|identified|clusters?|cells?|genes?|annotat\w*|warning)\b",
+    re.IGNORECASE,
+)
+_NUMERIC_FACT_RE = re.compile(r"[:=]\s*\S*\d")
+
+
+def _clip(line: str) -> str:
+    line = line.rstrip()
+    return line if len(line) <= _MAX_LINE_CHARS else line[:_MAX_LINE_CHARS] + " ..."
+
+
+def build_output_record(task_index: int, task: str, stdout: str) -> dict:
+    """Extract the structured record of one successful step from its stdout."""
+    lines = [line for line in stdout.splitlines() if line.strip()]
+    saved_files, shapes, keyword_facts, numeric_facts = [], [], [], []
+    for line in lines:
+        for path in _PATH_RE.findall(line):
+            if path not in saved_files and len(saved_files) < _MAX_FILES:
+                saved_files.append(path)
+        for shape in _SHAPE_RE.findall(line):
+            if shape not in shapes:
+                shapes.append(shape)
+        fact = _clip(line.strip().lstrip("-*• "))
+        if _KEYWORD_RE.search(line):
+            keyword_facts.append(fact)
+        elif _NUMERIC_FACT_RE.search(line):
+            numeric_facts.append(fact)
+    # Lines naming results come first, then "label: number" lines
+    facts = list(dict.fromkeys(keyword_facts + numeric_facts))[:_MAX_FACTS]
+    if len(lines) > _EXCERPT_HEAD + _EXCERPT_TAIL:
+        omitted = len(lines) - _EXCERPT_HEAD - _EXCERPT_TAIL
+        excerpt = lines[:_EXCERPT_HEAD] + [f"... ({omitted} lines omitted) ..."] + lines[-_EXCERPT_TAIL:]
+    else:
+        excerpt = lines
+    return {
+        "task_index": task_index,
+        "task": task,
+        "saved_files": saved_files,
+        "shapes": shapes[:10],
+        "facts": facts,
+        "excerpt": "\n".join(_clip(line) for line in excerpt),
+    }
+
+
+def _render(record: dict, level: int) -> str:
+    """level 0: one line, 1: key facts, 2: facts and stdout excerpt."""
+    text = f"Step {record['task_index']+1}: {record['task']}"
+    if record["saved_files"]:
+        text += f" | saved: {', '.join(record['saved_files'])}"
+    if level >= 1:
+        if record["shapes"]:
+            text += f"\n  shapes: {', '.join(record['shapes'])}"
+        if record["facts"]:
+            text += "\n" + "\n".join(f"  - {fact}" for fact in record["facts"])
+    if level >= 2 and record["excerpt"]:
+        text += f"\n  output:\n{record['excerpt']}"
+    return text
+
+
+def format_output_records(records: Optional[List[dict]], budget_tokens: int) -> str:
+    """Render step records, newest in the most detail, within `budget_tokens`."""
+    if not records:
+        return "No previous step output."
+    levels = [0] * len(records)
+    costs = [count_tokens(_render(record, 0)) for record in records]
+
+    # Fold the oldest steps into a single line while the one-line summaries do not fit
+    folded = 0
+    while folded < len(records) - 1 and sum(costs[folded:]) > budget_tokens:
+        folded += 1
+    remaining = budget_tokens - sum(costs[folded:])
+
+    # Spend what is left on more detail, most recent steps first
+    for level in (1, 2):
+        for i in range(len(records) - 1, folded - 1, -1):
+            if levels[i] != level - 1:
+                continue
+            extra = count_tokens(_render(records[i], level)) - costs[i]
+            if extra <= remaining:
+                levels[i], costs[i] = level, costs[i] + extra
+                remaining -= extra
+
+    parts = []
+    if folded:
+        files = [path for record in records[:folded] for path in record["saved_files"]]
+        parts.append(f"Steps 1-{folded} completed earlier" + (f" (saved files include: {', '.join(files[-5:])})" if files else "") + ".")
+    parts.extend(_render(record, level) for record, level in zip(records[folded:], levels[folded:]))
+    return "\n\n".join(parts)
@@ -0,0 +1,191 @@
+"""
+Static pre-flight check of generated code, run before any execution.
+
+Catches in milliseconds what would otherwise cost a full interpreter run plus a
+reflection round trip:
+    - syntax errors (compile)
+    - imports that cannot be resolved in the installed environment (find_spec)
+    - names that are read but never bound anywhere in the block
+    - input paths passed to read/load/open calls that do not exist; relative
+      paths always count as missing, since blocks run in a new, empty sandbox
+      directory (not the agent's working directory)
+
+The undefined-name check is flow-insensitive (a name bound anywhere in the block
+counts as defined) and is skipped for blocks that use star imports, exec/eval or
+globals()/locals()/vars(), so it only reports names that cannot possibly exist.
+
+Settings (environment variables):
+    SCAGENT_PREFLIGHT=0     disable the pre-flight check
+"""
+import os
+import ast
+import builtins
+import importlib.util
+import threading
+from typing import Dict, Iterable, List, Union
+
+PREFLIGHT_ENABLED = os.environ.get("SCAGENT_PREFLIGHT", "1") != "0"
+
+_DYNAMIC_CALLS = {"exec", "eval", "globals", "locals", "vars", "__import__"}
+_IMPLICIT_NAMES = {"__file__", "__name__", "__builtins__", "__doc__", "__spec__", "__loader__", "__package__"}
+_stats = {"checks": 0, "failures": 0}
+_stats_lock = threading.Lock()
+_spec_cache: Dict[str, bool] = {}
+
+
+def _module_available(name: str) -> bool:
+    if name not in _spec_cache:
+        try:
+            _spec_cache[name] = importlib.util.find_spec(name) is not None
+        except (ImportError, ValueError):
+            _spec_cache[name] = False
+    return _spec_cache[name]
+
+
+def check_imports(tree: ast.AST) -> List[str]:
+    issues = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules = [node.module]
+        else:
+            continue
+        for module in modules:
+            root = module.split(".")[0]
+            if not _module_available(root):
+                issues.append(f"line {node.lineno}: ModuleNotFoundError: No module named '{root}' (not installed in the execution environment)")
+    return issues
+
+
+def _bound_names(tree: ast.AST) -> set:
+    bound = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                bound.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            bound.add(node.rest)
+    return bound
+
+
+def _is_dynamic(tree: ast.AST) -> bool:
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and any(alias.name == "*" for alias in node.names):
+            return True
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _DYNAMIC_CALLS:
+            return True
+    return False
+
+
+def check_undefined_names(tree: ast.AST, known_names: Iterable[str] = ()) -> List[str]:
+    if _is_dynamic(tree):
+        return []
+    defined = _bound_names(tree) | set(dir(builtins)) | _IMPLICIT_NAMES | set(known_names)
+    issues, reported = [], set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in defined and node.id not in reported:
+            reported.add(node.id)
+            issues.append(f"line {node.lineno}: NameError: name '{node.id}' is used but never defined or imported")
+    return issues
+
+
+def _call_name(node: ast.Call) -> str:
+    if isinstance(node.func, ast.Attribute):
+        return node.func.attr
+    if isinstance(node.func, ast.Name):
+        return node.func.id
+    return ""
+
+
+def _on_numpy(node: ast.Call) -> bool:
+    # Only np.load takes a path; Model.load / pickle.load take model names or file objects
+    return isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name) and node.func.value.id in ("np", "numpy")
+
+
+def check_input_paths(tree: ast.AST, input_file_path: Union[str, Dict[str, str], None] = None) -> List[str]:
+    """Literal paths given to read_*/load*/open(..., 'r') calls must be absolute and exist (unless the block writes them first)."""
+    written, reads = set(), []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or not node.args:
+            continue
+        first = node.args[0]
+        if not (isinstance(first, ast.Constant) and isinstance(first.value, str)):
+            continue
+        name = _call_name(node)
+        if name == "open":
+            mode = node.args[1].value if len(node.args) > 1 and isinstance(node.args[1], ast.Constant) else "r"
+            for keyword in node.keywords:
+                if keyword.arg == "mode" and isinstance(keyword.value, ast.Constant):
+                    mode = keyword.value.value
+            if "r" in str(mode) and "+" not in str(mode):
+                reads.append((node.lineno, first.value))
+            else:
+                written.add(first.value)
+        elif name.startswith("read") or name in ("load_npz", "loadtxt", "genfromtxt") or (name == "load" and _on_numpy(node)):
+            # sc.read(..., backup_url=...) downloads missing files
+            if not any(keyword.arg == "backup_url" for keyword in node.keywords):
+                reads.append((node.lineno, first.value))
+        elif name.startswith(("write", "save", "to_")) or name in ("savefig", "dump"):
+            written.add(first.value)
+
+    if isinstance(input_file_path, dict):
+        available = list(input_file_path)
+    elif isinstance(input_file_path, str) and input_file_path:
+        available = [input_file_path]
+    else:
+        available = []
+    issues = []
+    for lineno, path in reads:
+        if path in written or "://" in path:
+            continue
+        hint = f" Available input files: {available}" if available else ""
+        expanded = os.path.expanduser(path)
+        if not os.path.isabs(expanded):
+            # The sandbox working directory is empty: the file cannot be there, whatever exists next to the agent
+            hint += " Relative paths resolve against a new, empty working directory; use absolute paths."
+        elif os.path.exists(expanded):
+            continue
+        issues.append(f"line {lineno}: FileNotFoundError: '{path}' does not exist.{hint}")
+    return issues
+
+
+def preflight_check(source: str, input_file_path=None, known_names: Iterable[str] = ()) -> List[str]:
+    """
+    Problems found in `source` without running it; an empty list means the block may run.
+    `known_names` are variables that already exist at run time (persistent execution mode).
+    """
+    with _stats_lock:
+        _stats["checks"] += 1
+    try:
+        tree = ast.parse(source)
+        compile(tree, "<generated code>", "exec")
+    except SyntaxError as e:
+        issues = [f"line {e.lineno}: SyntaxError: {e.msg}" + (f"\n    {e.text.strip()}" if e.text else "")]
+    else:
+        issues = check_imports(tree) + check_undefined_names(tree, known_names) + check_input_paths(tree, input_file_path)
+    if issues:
+        with _stats_lock:
+            _stats["failures"] += 1
+    return issues
+
+
+def preflight_stats() -> Dict[str, int]:
+    """Checks run and failures caught; every failure avoided one execution and one reflection LLM call."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["executions_avoided"] = stats["failures"]
+    stats["llm_calls_avoided"] = stats["failures"]
+    return stats
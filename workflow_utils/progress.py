@@ -0,0 +1,28 @@
+"""
+Progress events emitted from inside graph nodes.
+
+Events are plain dicts with a "type" key. They reach consumers of
+`app.stream(..., stream_mode="custom")` (see main.py) and are silently dropped
+when a node runs outside of a graph run. Events other than the per-line
+execution output are also dispatched to the run's callbacks, where
+tracing.RunProfiler records them.
+"""
+from langchain_core.callbacks.manager import dispatch_custom_event
+from langgraph.config import get_stream_writer
+
+# Custom callback event name of progress events (see tracing.py)
+TRACED_EVENT = "scagent_progress"
+
+
+def emit_progress(event: dict):
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        return
+    writer(event)
+    if event.get("type") != "exec_output":
+        try:
+            dispatch_custom_event(TRACED_EVENT, event)
+        except RuntimeError:
+            # Not inside a runnable with a parent run
+            pass
@@ -0,0 +1,393 @@
+"""
+Content-addressed cache of executed code blocks.
+
+An entry is addressed by the hash of the code block, the versions of the scientific
+stack and the fingerprints (path, size, mtime or content hash) of its input files: the
+files the block references by literal path, plus every file that was already in the
+results directory when it ran and that it did not write (blocks read earlier steps'
+outputs through built paths such as os.path.join(results_dir, ...)). It stores the block's stdout and the artifacts it wrote to the
+results directory, so a repeated step can be served without running anything.
+
+Settings (environment variables):
+    SCAGENT_RESULT_CACHE=0                 disable the cache entirely
+    SCAGENT_RESULT_CACHE_DIR               cache location (default .scagent_cache/results)
+    SCAGENT_RESULT_CACHE_MAX_MB            size budget before LRU eviction (default 2048)
+    SCAGENT_RESULT_CACHE_MAX_AGE_DAYS      entries older than this are dropped (default 7)
+    SCAGENT_RESULT_CACHE_CONTENT_HASH=1    fingerprint inputs by content instead of size+mtime
+
+Only isolated execution is cached: a persistent-mode block also changes the live
+namespace, which a cache hit cannot reproduce.
+
+A block's artifacts are the files that changed in its results directory while it
+ran. The directory is shared, so a run that overlapped another cached run or a
+cache hit restoring artifacts (e.g. parallel steps, other sessions) is not
+stored: its changes cannot be told apart from the other run's. Blocks that write
+to a path literal outside the results directory are not stored either, since a
+hit could not restore that file.
+"""
+import os
+import ast
+import asyncio
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import itertools
+import threading
+from contextlib import closing
+from dataclasses import dataclass
+from functools import lru_cache
+from importlib import metadata
+from typing import Dict, List, Optional, Union
+
+from .executor import ExecutionResult, run_code, arun_code, DEFAULT_TIMEOUT, FATAL_PATTERNS
+from .sandbox import RESULTS_DIR
+
+RESULT_CACHE_ENABLED = os.environ.get("SCAGENT_RESULT_CACHE", "1") != "0"
+RESULT_CACHE_DIR = os.path.abspath(os.environ.get("SCAGENT_RESULT_CACHE_DIR", os.path.join(".scagent_cache", "results")))
+RESULT_CACHE_MAX_BYTES = int(float(os.environ.get("SCAGENT_RESULT_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+RESULT_CACHE_MAX_AGE = float(os.environ.get("SCAGENT_RESULT_CACHE_MAX_AGE_DAYS", "7")) * 24 * 3600
+RESULT_CACHE_CONTENT_HASH = os.environ.get("SCAGENT_RESULT_CACHE_CONTENT_HASH", "0") == "1"
+
+_VERSIONED_PACKAGES = ["scanpy", "anndata", "celltypist", "numpy", "pandas", "scipy", "scikit-learn", "matplotlib"]
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+_db_lock = threading.Lock()
+
+# Cached runs (and artifact restores) in progress in this process, see the module docstring
+_active_runs: Dict[int, dict] = {}
+_active_lock = threading.Lock()
+_run_ids = itertools.count()
+
+
+@dataclass
+class CachedResult:
+    key: str
+    stdout: str
+    artifacts: List[dict]
+
+
+# ---------- fingerprints ----------
+@lru_cache(maxsize=1)
+def tool_versions() -> Dict[str, str]:
+    versions = {"python": sys.version.split()[0]}
+    for package in _VERSIONED_PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = "missing"
+    return versions
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path: str) -> list:
+    if not os.path.isfile(path):
+        return [path, "missing"]
+    stat = os.stat(path)
+    if RESULT_CACHE_CONTENT_HASH:
+        return [path, stat.st_size, _sha256_file(path)]
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+def _string_constants(source: str) -> List[str]:
+    try:
+        return [node.value for node in ast.walk(ast.parse(source))
+                if isinstance(node, ast.Constant) and isinstance(node.value, str) and len(node.value) < 4096]
+    except SyntaxError:
+        return []
+
+
+def referenced_files(source: str, input_file_path: Union[str, Dict[str, str], None] = None) -> List[str]:
+    """Existing files the block can read: the workflow inputs plus every path literal in the code."""
+    candidates = []
+    if isinstance(input_file_path, dict):
+        candidates.extend(input_file_path.keys())
+    elif isinstance(input_file_path, str) and input_file_path:
+        candidates.append(input_file_path)
+    candidates.extend(_string_constants(source))
+    files = set()
+    for candidate in candidates:
+        path = os.path.abspath(os.path.expanduser(candidate))
+        if os.path.isfile(path):
+            files.add(path)
+    return sorted(files)
+
+
+def _code_hash(source: str) -> str:
+    payload = json.dumps({"source": source, "versions": tool_versions()}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _inputs_digest(paths: List[str]) -> str:
+    payload = json.dumps([file_fingerprint(p) for p in sorted(paths)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _file_stat(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return (stat.st_size, stat.st_mtime_ns) if os.path.isfile(path) else None
+
+
+def _path_literals(source: str) -> Dict[str, Optional[tuple]]:
+    """(size, mtime) of every absolute path literal in the code, None for paths that are not files."""
+    return {value: _file_stat(value) for value in _string_constants(source)
+            if os.path.isabs(value) and "\n" not in value}
+
+
+def _outside_writes(before: Dict[str, Optional[tuple]], results_dir: str) -> List[str]:
+    """Path literals outside `results_dir` that were created or modified since `before`."""
+    root = os.path.join(os.path.abspath(results_dir), "")
+    return [path for path, stat in before.items()
+            if not os.path.abspath(path).startswith(root) and _file_stat(path) != stat]
+
+
+def _begin_run() -> int:
+    """Register a cached run; every run already in progress now counts as overlapped, and so does this one."""
+    with _active_lock:
+        run_id = next(_run_ids)
+        for run in _active_runs.values():
+            run["overlapped"] = True
+        _active_runs[run_id] = {"overlapped": bool(_active_runs)}
+        return run_id
+
+
+def _end_run(run_id: int) -> bool:
+    """Unregister a cached run; True when another one ran at the same time."""
+    with _active_lock:
+        return _active_runs.pop(run_id)["overlapped"]
+
+
+def _snapshot(directory: str) -> Dict[str, tuple]:
+    snapshot = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+
+# ---------- storage ----------
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.join(RESULT_CACHE_DIR, "blobs"), exist_ok=True)
+    conn = sqlite3.connect(os.path.join(RESULT_CACHE_DIR, "index.sqlite"), timeout=30)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            code_hash TEXT NOT NULL,
+            inputs TEXT NOT NULL,
+            stdout TEXT NOT NULL,
+            artifacts TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            last_access REAL NOT NULL
+        )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS entries_code_hash ON entries (code_hash)")
+    return conn
+
+
+def _blob_path(digest: str) -> str:
+    return os.path.join(RESULT_CACHE_DIR, "blobs", digest)
+
+
+def lookup(source: str) -> Optional[CachedResult]:
+    """Return the cached result of `source` if it already succeeded on the same inputs."""
+    code_hash = _code_hash(source)
+    with _db_lock, closing(_connect()) as conn:
+        rows = conn.execute(
+            "SELECT key, inputs, stdout, artifacts FROM entries WHERE code_hash = ? AND created > ?",
+            (code_hash, time.time() - RESULT_CACHE_MAX_AGE),
+        ).fetchall()
+        for key, inputs, stdout, artifacts in rows:
+            inputs = json.loads(inputs)
+            if key != hashlib.sha256((code_hash + _inputs_digest(inputs)).encode("utf-8")).hexdigest():
+                continue
+            artifacts = json.loads(artifacts)
+            if not all(os.path.isfile(_blob_path(a["sha256"])) for a in artifacts):
+                continue
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            with _stats_lock:
+                _stats["hits"] += 1
+            return CachedResult(key, stdout, artifacts)
+    with _stats_lock:
+        _stats["misses"] += 1
+    return None
+
+
+def restore_artifacts(cached: CachedResult):
+    """Put the cached artifacts back in place when they are missing or differ."""
+    for artifact in cached.artifacts:
+        path = artifact["path"]
+        if os.path.isfile(path) and os.path.getsize(path) == artifact["size"] and _sha256_file(path) == artifact["sha256"]:
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(_blob_path(artifact["sha256"]), path)
+        logging.info(f"Restored cached artifact: {path}")
+
+
+def store(source: str, referenced: List[str], stdout: str, before: Dict[str, tuple], after: Dict[str, tuple]):
+    """
+    Record a successful run; files created or modified in the results directory become artifacts.
+    The other files of the results directory (in `before`) are inputs, like the `referenced` ones.
+    """
+    changed = [path for path, stat in after.items() if before.get(path) != stat]
+    artifact_size = sum(after[path][0] for path in changed)
+    if artifact_size > RESULT_CACHE_MAX_BYTES // 2:
+        logging.info(f"Result cache: artifacts too large to cache ({artifact_size} bytes)")
+        return
+
+    artifacts = []
+    for path in changed:
+        digest = _sha256_file(path)
+        if not os.path.isfile(_blob_path(digest)):
+            shutil.copyfile(path, _blob_path(digest))
+        artifacts.append({"path": path, "sha256": digest, "size": after[path][0]})
+
+    # Files the block wrote are outputs, not inputs of the cache key.
+    inputs = sorted({path for path in [*referenced, *before] if path not in changed})
+    code_hash = _code_hash(source)
+    key = hashlib.sha256((code_hash + _inputs_digest(inputs)).encode("utf-8")).hexdigest()
+    now = time.time()
+    with _db_lock, closing(_connect()) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, code_hash, json.dumps(inputs), stdout, json.dumps(artifacts),
+             artifact_size + len(stdout), now, now),
+        )
+        conn.commit()
+    with _stats_lock:
+        _stats["stores"] += 1
+    evict()
+
+
+def evict(max_bytes: int = RESULT_CACHE_MAX_BYTES, max_age: float = RESULT_CACHE_MAX_AGE):
+    """Drop entries older than `max_age`, then least recently used ones until under `max_bytes`."""
+    with _db_lock, closing(_connect()) as conn:
+        evicted = conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - max_age,)).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            if total <= max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        conn.commit()
+
+        referenced = set()
+        for (artifacts,) in conn.execute("SELECT artifacts FROM entries"):
+            referenced.update(a["sha256"] for a in json.loads(artifacts))
+    for name in os.listdir(os.path.join(RESULT_CACHE_DIR, "blobs")):
+        if name not in referenced:
+            os.remove(_blob_path(name))
+    if evicted:
+        with _stats_lock:
+            _stats["evictions"] += evicted
+        logging.info(f"Result cache: evicted {evicted} entries")
+
+
+def clear():
+    shutil.rmtree(RESULT_CACHE_DIR, ignore_errors=True)
+
+
+def cache_stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(_stats)
+
+
+# ---------- cached execution ----------
+def _serve_cached(source: str, script_path: str, on_output=None) -> Optional[ExecutionResult]:
+    """The cached result of `source` with its artifacts restored, or None on a miss."""
+    cached = lookup(source)
+    if cached is None:
+        return None
+    # Restored files land in the shared results directory like a run's outputs would
+    run_id = _begin_run()
+    try:
+        restore_artifacts(cached)
+    except OSError as e:
+        logging.warning(f"Result cache: could not restore artifacts ({e}), executing instead")
+        return None
+    finally:
+        _end_run(run_id)
+    logging.info(f"Result cache hit ({cached.key[:12]}), stats: {cache_stats()}")
+    if on_output is not None:
+        for line in cached.stdout.splitlines(keepends=True):
+            on_output("stdout", line)
+    return ExecutionResult(script_path, 0, cached.stdout, "", 0.0, "cache")
+
+
+def _store_attributed(source: str, referenced: List[str], stdout: str, before: Dict[str, tuple],
+                      literals: Dict[str, Optional[tuple]], results_dir: str, overlapped: bool):
+    """Store a successful run unless its writes cannot be attributed to it (see the module docstring)."""
+    if overlapped:
+        logging.info("Result cache: not stored, another block ran at the same time")
+        return
+    outside = _outside_writes(literals, results_dir)
+    if outside:
+        logging.info(f"Result cache: not stored, the block wrote outside {results_dir}: {outside[:3]}")
+        return
+    store(source, referenced, stdout, before, _snapshot(results_dir))
+
+
+def run_code_cached(session_id: str, source: str, script_path: str, cwd: str, timeout: float = DEFAULT_TIMEOUT,
+                    input_file_path=None, on_output=None, fatal_patterns=FATAL_PATTERNS,
+                    results_dir: Optional[str] = None) -> ExecutionResult:
+    """
+    Like run_code, but serves blocks that already succeeded on identical inputs from the cache.
+    Cache hits are reported with backend "cache"; their stdout is still replayed through `on_output`.
+    `results_dir` is where the block writes its outputs (default RESULTS_DIR).
+    """
+    cached_result = _serve_cached(source, script_path, on_output)
+    if cached_result is not None:
+        return cached_result
+
+    results_dir = results_dir or RESULTS_DIR
+    referenced = referenced_files(source, input_file_path)
+    run_id = _begin_run()
+    try:
+        before, literals = _snapshot(results_dir), _path_literals(source)
+        result = run_code(session_id, source, script_path, cwd, timeout, on_output=on_output, fatal_patterns=fatal_patterns)
+    finally:
+        overlapped = _end_run(run_id)
+    if result.returncode == 0:
+        _store_attributed(source, referenced, result.stdout, before, literals, results_dir, overlapped)
+    return result
+
+
+async def arun_code_cached(session_id: str, source: str, script_path: str, cwd: str, timeout: float = DEFAULT_TIMEOUT,
+                           input_file_path=None, on_output=None, fatal_patterns=FATAL_PATTERNS,
+                           results_dir: Optional[str] = None) -> ExecutionResult:
+    """Async run_code_cached: the cache index and artifact snapshots are handled in a worker thread."""
+    cached_result = await asyncio.to_thread(_serve_cached, source, script_path, on_output)
+    if cached_result is not None:
+        return cached_result
+    results_dir = results_dir or RESULTS_DIR
+    referenced = referenced_files(source, input_file_path)
+    run_id = _begin_run()
+    try:
+        before = await asyncio.to_thread(_snapshot, results_dir)
+        literals = _path_literals(source)
+        result = await arun_code(session_id, source, script_path, cwd, timeout, on_output=on_output, fatal_patterns=fatal_patterns)
+    finally:
+        overlapped = _end_run(run_id)
+    if result.returncode == 0:
+        await asyncio.to_thread(_store_attributed, source, referenced, result.stdout, before, literals, results_dir, overlapped)
+    return result
@@ -0,0 +1,244 @@
+"""
+Deterministic fast-path router that runs ahead of the conductor LLM.
+
+Confident cases are resolved locally, in this order:
+    1. Rules: greetings/thanks -> frontdesk_agent; with an existing plan,
+       short approvals ("yes, proceed", "go ahead") -> analysis_agent and short
+       imperative step edits ("change step 3 to ...", "please remove the
+       clustering step") -> plan_editor_agent. Questions and longer requests
+       that merely mention an edit verb and a step are left to the classifier
+       or the LLM.
+    2. A small multinomial naive Bayes classifier trained from logged routing
+       decisions (past scagent logs plus every decision the LLM makes at runtime),
+       stored as JSON on disk and retrained as new decisions accumulate.
+Everything else returns None and falls back to the conductor LLM.
+
+Settings (environment variables):
+    SCAGENT_PREROUTER=0                     disable the pre-router
+    SCAGENT_ROUTER_DIR                      where decisions and the model live (default .scagent_cache/routing)
+    SCAGENT_ROUTER_MIN_CONFIDENCE           classifier posterior needed to skip the LLM (default 0.95)
+"""
+import os
+import re
+import json
+import math
+import glob
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .structured_logging import read_log_entries, LOG_DIR
+
+PREROUTER_ENABLED = os.environ.get("SCAGENT_PREROUTER", "1") != "0"
+ROUTER_DIR = os.path.abspath(os.environ.get("SCAGENT_ROUTER_DIR", os.path.join(".scagent_cache", "routing")))
+ROUTER_MIN_CONFIDENCE = float(os.environ.get("SCAGENT_ROUTER_MIN_CONFIDENCE", "0.95"))
+ROUTER_MIN_EXAMPLES = 30        # Minimum training examples before the classifier is trusted
+ROUTER_RETRAIN_EVERY = 20       # Retrain after this many new decisions
+ROUTES = ("frontdesk_agent", "plan_generator_agent", "plan_editor_agent", "analysis_agent")
+
+_DECISIONS_PATH = os.path.join(ROUTER_DIR, "decisions.jsonl")
+_MODEL_PATH = os.path.join(ROUTER_DIR, "model.json")
+
+_GREETING_RE = re.compile(
+    r"^(hi|hello|hey|hiya|good (morning|afternoon|evening)|thanks?|thank you|thanks a lot|cheers|bye|goodbye)"
+    r"( there)?( scagent)?[\s!.,:)]*$",
+    re.IGNORECASE,
+)
+_APPROVAL_RE = re.compile(
+    r"^(?P<affirm>yes|yep|yeah|ok|okay|sure|approved?|confirm(ed)?|lgtm|sounds good|looks good|agreed?)?[\W_]*"
+    r"(please\s+)?(?P<action>go ahead|proceed|continue|run( it| the plan| the analysis)?|execute( it| the plan)?"
+    r"|start( it| the analysis)?|do it|let'?s go|let'?s do it)?[\W_]*(with (it|the plan|the analysis))?[\W_]*"
+    r"(please|thanks|thank you)?[\W_]*$",
+    re.IGNORECASE,
+)
+_EDIT_COMMAND_RE = re.compile(
+    r"^(please\s+)?(change|modify|edit|replace|remove|delete|drop|skip|combine|merge|swap|reorder|rename|update|insert|add)\b",
+    re.IGNORECASE,
+)
+_EDIT_MAX_WORDS = 20
+_STEP_REF_RE = re.compile(r"\b(step|task)s?\b", re.IGNORECASE)
+_TOKEN_RE = re.compile(r"[a-z0-9_.]+")
+
+_stats = Counter()
+_lock = threading.Lock()
+_model: Optional[dict] = None
+_pending_decisions = 0          # Decisions recorded since the model was last trained
+
+
+# ---------- rules ----------
+def rule_route(user_prompt: str, has_plan: bool) -> Optional[str]:
+    text = user_prompt.strip()
+    if not text:
+        return None
+    if _GREETING_RE.match(text):
+        return "frontdesk_agent"
+    if not has_plan:
+        return None
+    approval = _APPROVAL_RE.match(text) if len(text.split()) <= 8 else None
+    if approval and (approval.group("affirm") or approval.group("action")):
+        return "analysis_agent"
+    if ("?" not in text and len(text.split()) <= _EDIT_MAX_WORDS
+            and _EDIT_COMMAND_RE.match(text) and _STEP_REF_RE.search(text)):
+        return "plan_editor_agent"
+    return None
+
+
+# ---------- classifier ----------
+def _features(user_prompt: str, has_plan: bool) -> List[str]:
+    tokens = _TOKEN_RE.findall(user_prompt.lower())
+    features = tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+    features.append("__has_plan__" if has_plan else "__no_plan__")
+    if len(tokens) <= 4:
+        features.append("__short__")
+    return features
+
+
+def train(examples: List[Tuple[str, bool, str]]) -> dict:
+    """Fit a multinomial naive Bayes model on (user_prompt, has_plan, route) examples."""
+    class_counts = Counter()
+    feature_counts: Dict[str, Counter] = defaultdict(Counter)
+    vocabulary = set()
+    for user_prompt, has_plan, route in examples:
+        if route not in ROUTES:
+            continue
+        class_counts[route] += 1
+        for feature in _features(user_prompt, has_plan):
+            feature_counts[route][feature] += 1
+            vocabulary.add(feature)
+    return {
+        "examples": sum(class_counts.values()),
+        "class_counts": dict(class_counts),
+        "feature_counts": {route: dict(counts) for route, counts in feature_counts.items()},
+        "vocabulary_size": len(vocabulary),
+    }
+
+
+def predict(model: dict, user_prompt: str, has_plan: bool) -> Tuple[Optional[str], float]:
+    """Return the most likely route and its posterior probability."""
+    class_counts = model.get("class_counts", {})
+    if len(class_counts) < 2:
+        return None, 0.0
+    total = sum(class_counts.values())
+    vocabulary_size = model["vocabulary_size"] + 1
+    features = _features(user_prompt, has_plan)
+    log_scores = {}
+    for route, count in class_counts.items():
+        counts = model["feature_counts"].get(route, {})
+        denominator = sum(counts.values()) + vocabulary_size
+        score = math.log(count / total)
+        for feature in features:
+            score += math.log((counts.get(feature, 0) + 1) / denominator)
+        log_scores[route] = score
+    best = max(log_scores, key=log_scores.get)
+    normalizer = max(log_scores.values())
+    probabilities = {route: math.exp(score - normalizer) for route, score in log_scores.items()}
+    return best, probabilities[best] / sum(probabilities.values())
+
+
+# ---------- training data ----------
+def _log_files(log_dir: str) -> List[str]:
+    """App log files in `log_dir`, JSON or text, current and rotated (.gz)."""
+    return sorted(path for path in glob.glob(os.path.join(log_dir, "scagent_log_*"))
+                  if re.search(r"\.(log|jsonl)(\.\d+\.gz)?$", path))
+
+
+def examples_from_logs(log_dir: str = LOG_DIR) -> List[Tuple[str, bool, str]]:
+    """Recover (user_prompt, has_plan, route) triples from past scagent log files."""
+    examples = []
+    for path in _log_files(log_dir):
+        has_plan, pending_prompt = False, None
+        try:
+            for _, _, _, message in read_log_entries(path):
+                if message.startswith("user_prompt: "):
+                    pending_prompt = message[len("user_prompt: "):]
+                elif message.startswith("conductor_result:\n"):
+                    route = message.split("\n", 1)[1].strip()
+                    if pending_prompt is not None and route in ROUTES:
+                        examples.append((pending_prompt, has_plan, route))
+                    pending_prompt = None
+                elif message.startswith(("planner result:", "edited_plan:")):
+                    has_plan = True
+        except (OSError, EOFError, ValueError) as e:
+            logging.warning(f"Pre-router: could not read {path}: {e}")
+    return examples
+
+
+def _logged_decisions() -> List[Tuple[str, bool, str]]:
+    if not os.path.isfile(_DECISIONS_PATH):
+        return []
+    examples = []
+    with open(_DECISIONS_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                examples.append((record["user_prompt"], record["has_plan"], record["route"]))
+            except (ValueError, KeyError):
+                continue
+    return examples
+
+
+def record_decision(user_prompt: str, has_plan: bool, route: str):
+    """Append a routing decision made by the conductor LLM to the training data."""
+    global _pending_decisions
+    if route not in ROUTES:
+        return
+    os.makedirs(ROUTER_DIR, exist_ok=True)
+    with _lock, open(_DECISIONS_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"user_prompt": user_prompt, "has_plan": has_plan, "route": route}) + "\n")
+        _pending_decisions += 1
+
+
+def retrain(log_dir: str = LOG_DIR) -> dict:
+    """Rebuild the classifier from past logs and recorded decisions, and save it to disk."""
+    global _model, _pending_decisions
+    decisions = _logged_decisions()
+    model = train(examples_from_logs(log_dir) + decisions)
+    os.makedirs(ROUTER_DIR, exist_ok=True)
+    with open(_MODEL_PATH, "w", encoding="utf-8") as f:
+        json.dump(model, f)
+    _model, _pending_decisions = model, 0
+    logging.info(f"Pre-router classifier trained on {model['examples']} examples")
+    return model
+
+
+def _load_model() -> Optional[dict]:
+    global _model
+    if _model is None and os.path.isfile(_MODEL_PATH):
+        with open(_MODEL_PATH, "r", encoding="utf-8") as f:
+            _model = json.load(f)
+    if _model is None or _pending_decisions >= ROUTER_RETRAIN_EVERY:
+        retrain()
+    return _model
+
+
+# ---------- entry point ----------
+def pre_route(user_prompt: str, has_plan: bool) -> Optional[str]:
+    """Return a route when it can be decided locally with confidence, else None (use the LLM)."""
+    if not PREROUTER_ENABLED:
+        return None
+    route = rule_route(user_prompt, has_plan)
+    source = "rule"
+    if route is None:
+        model = _load_model()
+        if model and model["examples"] >= ROUTER_MIN_EXAMPLES:
+            route, confidence = predict(model, user_prompt, has_plan)
+            if confidence < ROUTER_MIN_CONFIDENCE or (route == "analysis_agent" and not has_plan):
+                route = None
+            source = "classifier"
+    with _lock:
+        _stats[source if route else "llm"] += 1
+    if route:
+        logging.info(f"Pre-router ({source}) resolved route: {route}. Stats: {router_stats()}")
+    return route
+
+
+def router_stats() -> Dict[str, float]:
+    total = sum(_stats.values())
+    resolved = _stats["rule"] + _stats["classifier"]
+    return {
+        "rule": _stats["rule"],
+        "classifier": _stats["classifier"],
+        "llm": _stats["llm"],
+        "hit_rate": resolved / total if total else 0.0,
+    }
@@ -0,0 +1,78 @@
+"""
+Isolated working directories for code execution.
+
+Every execution attempt gets its own directory under
+    <SCAGENT_SANDBOX_ROOT>/<session_id>/task<N>_try<M>_<random>/
+so concurrent sessions and graph runs never overwrite or delete each other's
+scripts. Attempt directories are removed after execution (keep them with
+SCAGENT_KEEP_SANDBOXES=1), session directories when the session ends, and
+directories left behind by dead processes are swept once they are older than
+SCAGENT_SANDBOX_MAX_AGE_HOURS. Point SCAGENT_SANDBOX_ROOT at a tmpfs mount to
+keep scratch I/O off disk.
+
+Outputs meant for the user are written to RESULTS_DIR, an absolute path shared by all sessions.
+"""
+import os
+import re
+import time
+import shutil
+import logging
+import tempfile
+import threading
+
+SANDBOX_ROOT = os.path.abspath(os.environ.get("SCAGENT_SANDBOX_ROOT", os.path.join(tempfile.gettempdir(), "scagent_sandboxes")))
+SANDBOX_MAX_AGE = float(os.environ.get("SCAGENT_SANDBOX_MAX_AGE_HOURS", "24")) * 3600
+KEEP_SANDBOXES = os.environ.get("SCAGENT_KEEP_SANDBOXES", "0") == "1"
+RESULTS_DIR = os.path.abspath(os.environ.get("SCAGENT_RESULTS_DIR", "results"))
+
+_SWEEP_INTERVAL = 3600
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+
+def _safe_name(session_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", session_id or "default")
+
+
+def session_dir(session_id: str) -> str:
+    path = os.path.join(SANDBOX_ROOT, _safe_name(session_id))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def create_attempt_sandbox(session_id: str, task_index: int = 0, iteration: int = 0) -> str:
+    """Create a fresh, unique working directory for one execution attempt."""
+    sweep_stale_sandboxes()
+    return tempfile.mkdtemp(prefix=f"task{task_index}_try{iteration}_", dir=session_dir(session_id))
+
+
+def release_sandbox(path: str):
+    if KEEP_SANDBOXES:
+        logging.info(f"Keeping sandbox directory: {path}")
+        return
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def cleanup_session(session_id: str):
+    """Remove every sandbox directory of a session."""
+    shutil.rmtree(os.path.join(SANDBOX_ROOT, _safe_name(session_id)), ignore_errors=True)
+
+
+def sweep_stale_sandboxes(max_age: float = SANDBOX_MAX_AGE, force: bool = False):
+    """Remove session directories nobody touched for `max_age` seconds (at most once per hour)."""
+    global _last_sweep
+    now = time.time()
+    with _sweep_lock:
+        if not force and now - _last_sweep < _SWEEP_INTERVAL:
+            return
+        _last_sweep = now
+    if not os.path.isdir(SANDBOX_ROOT):
+        return
+    for name in os.listdir(SANDBOX_ROOT):
+        path = os.path.join(SANDBOX_ROOT, name)
+        try:
+            if os.path.isdir(path) and now - os.path.getmtime(path) > max_age:
+                shutil.rmtree(path, ignore_errors=True)
+                logging.info(f"Removed stale sandbox directory: {path}")
+        except OSError:
+            continue
@@ -0,0 +1,342 @@
+"""
+Queue-based, structured and rotating logging for the app and the batch CLI.
+
+setup_logging() routes every record through a QueueHandler: the node that logs
+only puts the record on a queue, and a QueueListener thread formats it and does
+the disk writes. Records are written as JSON lines:
+
+    {"time": "2025-05-12 21:50:54,123", "level": "INFO", "file": "core_nodes.py", "line": 84,
+     "node": "code_checker", "thread": "...", "message": "---Initiate Code Checker---"}
+
+"node" and "thread" come from the graph run the record was logged in (empty
+outside of graph runs). SCAGENT_LOG_FORMAT=text keeps the former plain text
+lines instead; read_log_entries() reads both (log_replay.py, the pre-router).
+
+Messages longer than SCAGENT_LOG_PAYLOAD_CHARS (message lists, generated code,
+execution output) are stored once, gzipped, under <log dir>/payloads/<sha256>.gz.
+The record keeps the first line of the message and a reference,
+"<first line> [payload <sha256>, <n> chars]", so a payload repeated on every
+retry is only written once. read_payload() resolves a reference. When a log
+file rotates, payloads that no log file in the directory references any more
+are deleted (prune_payloads).
+
+Log files rotate when they reach SCAGENT_LOG_MAX_BYTES or are older than
+SCAGENT_LOG_ROTATE_HOURS; rotated files are gzipped (<log>.1.gz, <log>.2.gz, ...)
+and the oldest beyond SCAGENT_LOG_BACKUPS are removed.
+
+Verbosity is set per graph node with SCAGENT_LOG_LEVELS, e.g.
+"INFO,code_checker=WARNING,code_generator_agent=DEBUG": a bare level is the
+default, name=level applies to records logged inside that node.
+
+Settings (environment variables):
+    SCAGENT_LOG_DIR             log directory (default logs)
+    SCAGENT_LOG_FORMAT          json (default) or text
+    SCAGENT_LOG_LEVELS          default level and per-node levels (default INFO)
+    SCAGENT_LOG_CONSOLE         console level, or 0 to log to the file only (default INFO)
+    SCAGENT_LOG_MAX_BYTES       rotate at this size (default 10 MB)
+    SCAGENT_LOG_ROTATE_HOURS    rotate after this many hours (default 24)
+    SCAGENT_LOG_BACKUPS         rotated files kept (default 10)
+    SCAGENT_LOG_PAYLOAD_CHARS   longer messages go to the payload store (default 2000)
+"""
+import os
+import re
+import gzip
+import json
+import time
+import queue
+import atexit
+import shutil
+import hashlib
+import logging
+import logging.handlers
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+LOG_DIR = os.path.abspath(os.environ.get("SCAGENT_LOG_DIR", "logs"))
+LOG_FORMAT = os.environ.get("SCAGENT_LOG_FORMAT", "json")
+LOG_LEVELS = os.environ.get("SCAGENT_LOG_LEVELS", "INFO")
+LOG_CONSOLE = os.environ.get("SCAGENT_LOG_CONSOLE", "INFO")
+LOG_MAX_BYTES = int(os.environ.get("SCAGENT_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_HOURS = float(os.environ.get("SCAGENT_LOG_ROTATE_HOURS", "24"))
+LOG_BACKUPS = int(os.environ.get("SCAGENT_LOG_BACKUPS", "10"))
+LOG_PAYLOAD_CHARS = int(os.environ.get("SCAGENT_LOG_PAYLOAD_CHARS", "2000"))
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s -%(filename)s:%(lineno)d - %(message)s"
+_ENTRY_RE = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - (\w+) -([\w.]+):(\d+) - (.*)$")
+PAYLOAD_RE = re.compile(r" \[payload ([0-9a-f]{64}), \d+ chars\]$")
+_PAYLOAD_REF_RE = re.compile(r"\[payload ([0-9a-f]{64}), \d+ chars\]")
+# Payloads are written before the record that references them: recent ones are never pruned
+_PAYLOAD_GRACE_SECONDS = 3600
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_levels(spec: str) -> Tuple[int, Dict[str, int]]:
+    """Default level and per-node levels of a SCAGENT_LOG_LEVELS value."""
+    default, per_node = logging.INFO, {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.rpartition("=")
+        value = logging.getLevelName(level.strip().upper())
+        if not isinstance(value, int):
+            raise ValueError(f"Unknown log level {level!r} in SCAGENT_LOG_LEVELS")
+        if name:
+            per_node[name.strip()] = value
+        else:
+            default = value
+    return default, per_node
+
+
+def _run_context() -> Tuple[str, str]:
+    """(node, thread id) of the graph run the caller is in, empty outside of graph runs."""
+    try:
+        from langgraph.config import get_config
+        config = get_config()
+    except (ImportError, RuntimeError):
+        return "", ""
+    metadata = config.get("metadata") or {}
+    configurable = config.get("configurable") or {}
+    return metadata.get("langgraph_node") or "", configurable.get("thread_id") or ""
+
+
+class NodeLevelFilter(logging.Filter):
+    """
+    Stamps records with their graph node and applies that node's level.
+    Attached to the QueueHandler, so it runs in the thread that logs, inside the graph run:
+    that is where get_config() knows the node and thread id. On the listener's handlers
+    it would run in the listener thread and leave "node" and "thread" empty.
+    """
+
+    def __init__(self, default: int, per_node: Dict[str, int]):
+        super().__init__()
+        self.default = default
+        self.per_node = per_node
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.node, record.thread_id = _run_context()
+        return record.levelno >= self.per_node.get(record.node, self.default)
+
+
+# ---------- payload store ----------
+def payload_path(log_dir: str, digest: str) -> str:
+    return os.path.join(log_dir, "payloads", f"{digest}.gz")
+
+
+def store_payload(log_dir: str, text: str) -> str:
+    """Write `text` to the payload store unless it is already there; returns its digest."""
+    digest = hashlib.sha256(text.encode("utf-8", errors="replace")).hexdigest()
+    path = payload_path(log_dir, digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    return digest
+
+
+def read_payload(log_dir: str, digest: str) -> Optional[str]:
+    try:
+        with gzip.open(payload_path(log_dir, digest), "rt", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _referenced_payloads(log_dir: str) -> set:
+    digests = set()
+    for name in os.listdir(log_dir):
+        path = os.path.join(log_dir, name)
+        if not os.path.isfile(path) or not name.endswith((".log", ".jsonl", ".gz")):
+            continue
+        try:
+            with (gzip.open if name.endswith(".gz") else open)(path, "rt", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    digests.update(_PAYLOAD_REF_RE.findall(line))
+        except (OSError, EOFError):
+            continue
+    return digests
+
+
+def prune_payloads(log_dir: str, grace_seconds: float = _PAYLOAD_GRACE_SECONDS) -> int:
+    """Delete payloads no log file in `log_dir` references; returns how many were deleted."""
+    payload_dir = os.path.join(log_dir, "payloads")
+    if not os.path.isdir(payload_dir):
+        return 0
+    referenced = _referenced_payloads(log_dir)
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    for name in os.listdir(payload_dir):
+        path = os.path.join(payload_dir, name)
+        try:
+            if name[:-len(".gz")] not in referenced and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def resolve_payload(message: str, log_dir: str) -> str:
+    """The full message of a record whose text went to the payload store, else `message` itself."""
+    match = PAYLOAD_RE.search(message)
+    if match is None:
+        return message
+    payload = read_payload(log_dir, match.group(1))
+    return message if payload is None else payload
+
+
+# ---------- reading logs ----------
+def read_log_entries(path: str) -> Iterator[Tuple[float, str, str, str]]:
+    """(timestamp, level, source file, message) of every log entry, in JSON or text logs, rotated (.gz) or not.
+
+    In text logs continuation lines belong to the message. Messages moved to the
+    payload store are read back in full.
+    """
+    log_dir = os.path.dirname(os.path.abspath(path))
+    for timestamp, level, source, message in _raw_entries(path):
+        yield timestamp, level, source, resolve_payload(message, log_dir)
+
+
+def _raw_entries(path: str) -> Iterator[Tuple[float, str, str, str]]:
+    entry = None
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            record = None
+            if line.startswith("{"):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    pass
+            if isinstance(record, dict) and "message" in record:
+                if entry is not None:
+                    yield entry
+                    entry = None
+                timestamp = datetime.strptime(record["time"], "%Y-%m-%d %H:%M:%S,%f").timestamp()
+                yield timestamp, record["level"], record["file"], record["message"]
+                continue
+            match = _ENTRY_RE.match(line.rstrip("\n"))
+            if match:
+                if entry is not None:
+                    yield entry
+                timestamp = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S,%f").timestamp()
+                entry = (timestamp, match.group(2), match.group(3), match.group(5))
+            elif entry is not None:
+                entry = (entry[0], entry[1], entry[2], entry[3] + "\n" + line.rstrip("\n"))
+    if entry is not None:
+        yield entry
+
+
+# ---------- formatting and rotation ----------
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            message = f"{message}\n{record.exc_text}"
+        return json.dumps({
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "file": record.filename,
+            "line": record.lineno,
+            "node": getattr(record, "node", ""),
+            "thread": getattr(record, "thread_id", ""),
+            "message": message,
+        }, default=str)
+
+
+class RotatingLogFileHandler(logging.handlers.RotatingFileHandler):
+    """Size-rotating file handler that also rotates by age and gzips the rotated files."""
+
+    def __init__(self, filename: str, max_bytes: int, rotate_seconds: float, backups: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        self.rotate_seconds = rotate_seconds
+        self.rollover_at = time.time() + rotate_seconds
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = self._compress
+
+    @staticmethod
+    def _compress(source: str, dest: str):
+        with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.rotate_seconds > 0 and time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.rotate_seconds
+        # The oldest backup may have been the last reference to some payloads
+        prune_payloads(os.path.dirname(self.baseFilename))
+
+
+class PayloadQueueListener(logging.handlers.QueueListener):
+    """Moves long messages to the payload store, off the logging thread, before the handlers see them."""
+
+    def __init__(self, log_queue, *handlers, log_dir: str, payload_chars: int):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.log_dir = log_dir
+        self.payload_chars = payload_chars
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = record.getMessage()
+        if self.payload_chars and len(message) > self.payload_chars:
+            try:
+                digest = store_payload(self.log_dir, message)
+            except OSError:
+                return record
+            first_line = message.split("\n", 1)[0][:200]
+            record.msg, record.args = f"{first_line} [payload {digest}, {len(message)} chars]", None
+        return record
+
+
+def setup_logging(prefix: str = "scagent_log", log_dir: str = LOG_DIR, console: bool = True) -> str:
+    """Route the root logger through the logging queue; returns the path of the new log file."""
+    global _listener
+    stop_logging()
+    os.makedirs(log_dir, exist_ok=True)
+    extension = "jsonl" if LOG_FORMAT == "json" else "log"
+    log_path = os.path.join(log_dir, f"{prefix}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.{extension}")
+
+    file_handler = RotatingLogFileHandler(log_path, LOG_MAX_BYTES, LOG_ROTATE_HOURS * 3600, LOG_BACKUPS)
+    file_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    handlers = [file_handler]
+    if console and LOG_CONSOLE != "0":
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(LOG_CONSOLE.upper())
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(console_handler)
+
+    default, per_node = parse_levels(LOG_LEVELS)
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(NodeLevelFilter(default, per_node))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(min([default, *per_node.values()]))
+    # Chatty HTTP client internals stay at the default level even when a node logs at DEBUG
+    for name in ("httpx", "httpcore", "openai"):
+        logging.getLogger(name).setLevel(max(default, logging.INFO))
+
+    _listener = PayloadQueueListener(log_queue, *handlers, log_dir=log_dir, payload_chars=LOG_PAYLOAD_CHARS)
+    _listener.start()
+    return log_path
+
+
+def stop_logging():
+    """Write out the queued records and close the log files."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
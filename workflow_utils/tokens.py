@@ -0,0 +1,36 @@
+"""
+Local token counting for prompt budgets.
+
+Uses tiktoken's o200k_base encoding (gpt-4o / gpt-4.1). When tiktoken or its
+encoding files are not available, falls back to a characters/4 estimate.
+"""
+import logging
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1)
+def _encoder():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken missing or its encoding files cannot be downloaded
+        logging.info(f"tiktoken unavailable ({e}), estimating token counts from characters")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoder = _encoder()
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` so that it fits in `max_tokens`, marking the cut."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoder = _encoder()
+    if encoder is None:
+        return text[:max(0, max_tokens * 4 - 20)] + " ...[truncated]"
+    return encoder.decode(encoder.encode(text, disallowed_special=())[:max(0, max_tokens - 5)]) + " ...[truncated]"
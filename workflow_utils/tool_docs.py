@@ -0,0 +1,199 @@
+"""
+Sectioned, in-memory index of the tool documentation with lexical retrieval.
+
+Each tool_documentation/<tool>.txt is loaded once and split into sections:
+numbered headings underlined with dashes, "### " subheadings, or (for files
+without headings) groups of paragraphs. Long sections such as CellTypist's model
+list are split further into chunks that repeat the section heading. Sections are
+ranked against the current task with BM25, and only the best ones are injected,
+in document order, under a token budget; the opening section of each file is
+always included. A file is re-indexed when its mtime changes.
+
+Settings (environment variables):
+    SCAGENT_TOOL_DOC_DIR        documentation directory (default tool_documentation)
+    SCAGENT_TOOL_DOC_TOKENS     token budget of the injected documentation (default 1200)
+"""
+import os
+import re
+import math
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .tokens import count_tokens, truncate_to_tokens
+
+TOOL_DOC_DIR = os.path.abspath(os.environ.get("SCAGENT_TOOL_DOC_DIR", "tool_documentation"))
+TOOL_DOC_TOKENS = int(os.environ.get("SCAGENT_TOOL_DOC_TOKENS", "1200"))
+
+_MAX_SECTION_CHARS = 1500       # Longer sections are split into chunks of lines
+_PARAGRAPH_GROUP_CHARS = 1200   # Paragraphs are grouped up to this size when a file has no headings
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+
+_UNDERLINE_RE = re.compile(r"^\s*-{3,}\s*$")
+_SUBHEADING_RE = re.compile(r"^#{2,}\s+\S")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+@dataclass
+class Section:
+    title: str
+    text: str
+    position: int
+    terms: Counter = field(default_factory=Counter)
+
+
+def _terms(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _split_long(title: str, lines: List[str]) -> List[List[str]]:
+    """Split a section's lines into chunks under _MAX_SECTION_CHARS (each chunk repeats the heading)."""
+    chunks, current, size = [], [], 0
+    for line in lines:
+        if current and size + len(line) > _MAX_SECTION_CHARS:
+            chunks.append(current)
+            current, size = [f"{title} (continued)"], len(title)
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_sections(text: str) -> List[Section]:
+    lines = text.splitlines()
+    # Heading positions: a line followed by a dashed underline, or a "### " line
+    starts = []
+    for i, line in enumerate(lines):
+        if i + 1 < len(lines) and line.strip() and _UNDERLINE_RE.match(lines[i + 1]):
+            starts.append(i)
+        elif _SUBHEADING_RE.match(line):
+            starts.append(i)
+
+    if starts:
+        bounds = ([0] if starts[0] != 0 else []) + starts + [len(lines)]
+        raw = [lines[a:b] for a, b in zip(bounds, bounds[1:])]
+    else:
+        # No headings: group blank-line separated paragraphs
+        raw, current = [], []
+        for paragraph in re.split(r"\n\s*\n", text):
+            if current and sum(len(p) for p in current) + len(paragraph) > _PARAGRAPH_GROUP_CHARS:
+                raw.append("\n\n".join(current).splitlines())
+                current = []
+            current.append(paragraph)
+        if current:
+            raw.append("\n\n".join(current).splitlines())
+
+    # A heading with nothing under it (only "### " subsections follow) is merged into the next section
+    merged, pending = [], []
+    for section_lines in raw:
+        content = [line for line in section_lines if line.strip() and not _UNDERLINE_RE.match(line)]
+        if len(content) <= 1 and starts:
+            pending += section_lines
+            continue
+        merged.append(pending + section_lines)
+        pending = []
+    if pending:
+        merged.append(pending)
+
+    sections = []
+    for section_lines in merged:
+        if not "\n".join(section_lines).strip():
+            continue
+        title = next((line.strip().lstrip("#").strip() for line in section_lines if line.strip()), "")
+        for chunk in _split_long(title, section_lines):
+            body = "\n".join(chunk).strip()
+            section = Section(title, body, len(sections))
+            # Headings count twice
+            section.terms = Counter(_terms(body) + _terms(title))
+            sections.append(section)
+    return sections
+
+
+class ToolDocIndex:
+    """Per-tool BM25 index over documentation sections, reloaded when files change."""
+
+    def __init__(self, doc_dir: str = TOOL_DOC_DIR):
+        self.doc_dir = doc_dir
+        self._docs: Dict[str, tuple] = {}       # tool -> (mtime, full text, sections)
+        self._lock = threading.Lock()
+
+    def _path(self, tool_name: str) -> str:
+        return os.path.join(self.doc_dir, f"{tool_name}.txt")
+
+    def load(self, tool_name: str) -> Optional[tuple]:
+        path = self._path(tool_name)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._docs.get(tool_name)
+            if cached is None or cached[0] != mtime:
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read()
+                cached = (mtime, text, split_sections(text))
+                self._docs[tool_name] = cached
+                logging.info(f"Indexed tool documentation {tool_name}: {len(cached[2])} sections")
+        return cached
+
+    def full_text(self, tool_name: str) -> str:
+        doc = self.load(tool_name)
+        return doc[1] if doc else ""
+
+    @staticmethod
+    def rank(sections: List[Section], query: str) -> List[tuple]:
+        """BM25 scores of `sections` for `query`, best first."""
+        query_terms = set(_terms(query))
+        if not sections or not query_terms:
+            return []
+        n = len(sections)
+        average_length = sum(sum(s.terms.values()) for s in sections) / n
+        scores = []
+        for section in sections:
+            length = sum(section.terms.values())
+            score = 0.0
+            for term in query_terms:
+                tf = section.terms.get(term, 0)
+                if not tf:
+                    continue
+                df = sum(1 for s in sections if term in s.terms)
+                # Robertson idf floored at 0: terms found in most sections ("cell", "model") carry no weight
+                idf = max(0.0, math.log((n - df + 0.5) / (df + 0.5)))
+                score += idf * tf * (_BM25_K1 + 1) / (tf + _BM25_K1 * (1 - _BM25_B + _BM25_B * length / average_length))
+            scores.append((score, section))
+        return sorted(scores, key=lambda item: (-item[0], item[1].position))
+
+    def retrieve(self, tool_name: str, query: str, budget_tokens: int = TOOL_DOC_TOKENS) -> str:
+        """The sections of a tool's documentation most relevant to `query`, within `budget_tokens`."""
+        doc = self.load(tool_name)
+        if doc is None:
+            return ""
+        _, text, sections = doc
+        if count_tokens(text) <= budget_tokens:
+            return text
+        selected = [sections[0]]
+        used = count_tokens(sections[0].text)
+        for score, section in self.rank(sections, query):
+            if score <= 0:
+                break
+            if section is sections[0]:
+                continue
+            cost = count_tokens(section.text)
+            if used + cost > budget_tokens:
+                continue
+            selected.append(section)
+            used += cost
+        selected.sort(key=lambda s: s.position)
+        logging.info(f"Tool documentation {tool_name}: {len(selected)}/{len(sections)} sections, {used} tokens")
+        return truncate_to_tokens("\n\n".join(s.text for s in selected), budget_tokens)
+
+
+_index = ToolDocIndex()
+
+
+def get_tool_doc_index() -> ToolDocIndex:
+    return _index
@@ -0,0 +1,236 @@
+"""
+Per-node latency, token and cost tracing of graph runs.
+
+RunProfiler is a LangChain callback handler; pass it in the run config
+(config["callbacks"] = [profiler]) and it records, as they happen:
+
+    - node:  every graph node run (start/end, task index, retry iteration, outcome)
+    - llm:   every chat model call (model, prompt/completion tokens, cost, outcome)
+    - exec:  every code execution (duration, return code, backend, early-kill reason, peak memory)
+
+LLM and execution records carry the node, task index and iteration of the node
+run they happened in. Every record is appended to a JSONL run profile under
+SCAGENT_PROFILE_DIR as soon as it is complete, so a crashed run still leaves
+its profile behind. node_breakdown() turns a profile into one row per node
+(time in LLM calls, in code execution and elsewhere), shown in the UI after
+every run and printed by
+
+    python -m workflow_utils.tracing .scagent_cache/profiles/<profile>.jsonl
+
+Nested nodes (the steps run by parallel_runner) are recorded too, so the
+parallel_runner row overlaps with the rows of the nodes it ran.
+
+Settings (environment variables):
+    SCAGENT_PROFILING=0         disable run profiles
+    SCAGENT_PROFILE_DIR         where profiles are written (default .scagent_cache/profiles)
+"""
+import os
+import re
+import sys
+import json
+import time
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .llm_cache import _token_cost
+from .progress import TRACED_EVENT
+
+PROFILING_ENABLED = os.environ.get("SCAGENT_PROFILING", "1") != "0"
+PROFILE_DIR = os.path.abspath(os.environ.get("SCAGENT_PROFILE_DIR", os.path.join(".scagent_cache", "profiles")))
+
+
+def _token_usage(response) -> Dict[str, int]:
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return {"prompt_tokens": usage.get("prompt_tokens") or 0, "completion_tokens": usage.get("completion_tokens") or 0}
+    # Streamed and cached responses carry the usage on the message instead
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            prompt_tokens += metadata.get("input_tokens") or 0
+            completion_tokens += metadata.get("output_tokens") or 0
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+
+
+class RunProfiler(BaseCallbackHandler):
+    """Callback handler that writes the run profile of one graph run (or several runs sharing a label)."""
+
+    run_inline = True
+
+    def __init__(self, label: str = "run", path: Optional[str] = None):
+        safe_label = re.sub(r"[^A-Za-z0-9_.-]", "_", label)
+        self.path = path or os.path.join(PROFILE_DIR, f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{safe_label}.jsonl")
+        self.records: List[dict] = []
+        self._parents: Dict[UUID, Optional[UUID]] = {}
+        self._nodes: Dict[UUID, dict] = {}
+        self._llm_calls: Dict[UUID, dict] = {}
+        self._lock = threading.Lock()
+
+    # ---------- bookkeeping ----------
+    def _write(self, record: dict):
+        with self._lock:
+            self.records.append(record)
+            if PROFILING_ENABLED:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+
+    def _node_of(self, run_id: Optional[UUID]) -> Optional[dict]:
+        """The innermost graph node run that `run_id` belongs to."""
+        while run_id is not None:
+            if run_id in self._nodes:
+                return self._nodes[run_id]
+            run_id = self._parents.get(run_id)
+        return None
+
+    def _context(self, run_id: Optional[UUID]) -> dict:
+        node = self._node_of(run_id) or {}
+        return {"node": node.get("node"), "task_index": node.get("task_index"), "iteration": node.get("iteration")}
+
+    # ---------- graph nodes ----------
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                       metadata: Optional[dict] = None, **kwargs: Any):
+        self._parents[run_id] = parent_run_id
+        node = (metadata or {}).get("langgraph_node")
+        if node is None or kwargs.get("name") != node:
+            return
+        state = inputs if isinstance(inputs, dict) else {}
+        self._nodes[run_id] = {
+            "kind": "node",
+            "node": node,
+            "task_index": state.get("current_task_index"),
+            "iteration": state.get("iterations") or 0,
+            "start": time.time(),
+        }
+
+    def _end_node(self, run_id: UUID, outcome: str, error: Optional[BaseException] = None):
+        self._parents.pop(run_id, None)
+        record = self._nodes.pop(run_id, None)
+        if record is None:
+            return
+        record["end"] = time.time()
+        record["duration"] = record["end"] - record["start"]
+        record["outcome"] = outcome
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"[:300]
+        self._write(record)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any):
+        self._end_node(run_id, "ok")
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        # Control-flow interrupts are not errors of the node
+        self._end_node(run_id, "interrupted" if type(error).__name__.startswith("Graph") else "error", error)
+
+    # ---------- LLM calls ----------
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                            metadata: Optional[dict] = None, invocation_params: Optional[dict] = None, **kwargs: Any):
+        self._parents[run_id] = parent_run_id
+        params = invocation_params or kwargs.get("invocation_params") or {}
+        self._llm_calls[run_id] = {
+            "kind": "llm",
+            **self._context(parent_run_id),
+            "model": params.get("model_name") or params.get("model") or (metadata or {}).get("ls_model_name") or "unknown",
+            "start": time.time(),
+        }
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        self._parents.pop(run_id, None)
+        record = self._llm_calls.pop(run_id, None)
+        if record is None:
+            return
+        usage = _token_usage(response)
+        record.update(usage, end=time.time(), outcome="ok",
+                      cost=_token_cost(record["model"], usage["prompt_tokens"], usage["completion_tokens"]))
+        record["duration"] = record["end"] - record["start"]
+        self._write(record)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._parents.pop(run_id, None)
+        record = self._llm_calls.pop(run_id, None)
+        if record is None:
+            return
+        record.update(end=time.time(), outcome="error", error=f"{type(error).__name__}: {error}"[:300],
+                      prompt_tokens=0, completion_tokens=0, cost=0.0)
+        record["duration"] = record["end"] - record["start"]
+        self._write(record)
+
+    # ---------- code execution ----------
+    def on_custom_event(self, name: str, data: Any, *, run_id: UUID, **kwargs: Any):
+        if name != TRACED_EVENT or data.get("type") != "exec_end":
+            return
+        now = time.time()
+        self._write({
+            "kind": "exec",
+            **self._context(run_id),
+            "start": now - (data.get("duration") or 0.0),
+            "end": now,
+            "duration": data.get("duration") or 0.0,
+            "returncode": data.get("returncode"),
+            "backend": data.get("backend"),
+            "killed_reason": data.get("killed_reason"),
+            "peak_rss_mb": data.get("peak_rss_mb"),
+            "outcome": "ok" if data.get("returncode") == 0 else "error",
+        })
+
+    def breakdown(self) -> List[dict]:
+        with self._lock:
+            return node_breakdown(self.records)
+
+
+def load_profile(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def node_breakdown(records: List[dict]) -> List[dict]:
+    """One row per node: runs, wall time, time in LLM calls and code execution, tokens, cost, peak memory and errors."""
+    rows: Dict[str, dict] = {}
+
+    def row(node):
+        return rows.setdefault(node or "(outside nodes)", {
+            "node": node or "(outside nodes)", "runs": 0, "seconds": 0.0, "llm_seconds": 0.0, "exec_seconds": 0.0,
+            "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "peak_rss_mb": None, "errors": 0,
+        })
+
+    for record in records:
+        current = row(record.get("node"))
+        if record["kind"] == "node":
+            current["runs"] += 1
+            current["seconds"] += record["duration"]
+        elif record["kind"] == "llm":
+            current["llm_calls"] += 1
+            current["llm_seconds"] += record["duration"]
+            current["prompt_tokens"] += record.get("prompt_tokens") or 0
+            current["completion_tokens"] += record.get("completion_tokens") or 0
+            current["cost"] += record.get("cost") or 0.0
+        elif record["kind"] == "exec":
+            current["exec_seconds"] += record["duration"]
+            if record.get("peak_rss_mb") is not None:
+                current["peak_rss_mb"] = max(current["peak_rss_mb"] or 0.0, record["peak_rss_mb"])
+        current["errors"] += record.get("outcome") == "error"
+    for current in rows.values():
+        current["other_seconds"] = max(0.0, current["seconds"] - current["llm_seconds"] - current["exec_seconds"])
+    return sorted(rows.values(), key=lambda current: current["seconds"], reverse=True)
+
+
+def format_breakdown(rows: List[dict]) -> str:
+    lines = [f"{'node':<26}{'runs':>6}{'total':>10}{'LLM':>10}{'exec':>10}{'other':>10}{'calls':>7}{'tokens in/out':>17}{'cost':>11}{'peak mem':>10}{'errors':>8}"]
+    for current in rows:
+        tokens = f"{current['prompt_tokens']}/{current['completion_tokens']}"
+        peak = f"{current['peak_rss_mb']:.0f}MB" if current["peak_rss_mb"] is not None else "-"
+        lines.append(f"{current['node'][:25]:<26}{current['runs']:>6}{current['seconds']:>9.1f}s{current['llm_seconds']:>9.1f}s"
+                     f"{current['exec_seconds']:>9.1f}s{current['other_seconds']:>9.1f}s{current['llm_calls']:>7}{tokens:>17}"
+                     f"{current['cost']:>10.4f}${peak:>10}{current['errors']:>8}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python -m workflow_utils.tracing <profile.jsonl>")
+    print(format_breakdown(node_breakdown(load_profile(sys.argv[1]))))